@@ -12,6 +12,9 @@ class MyApp:
         self.app_config = {"username": "Guest"}
         self.menu_items = {}
         self.current_page = "" # 現在のページを保持
+        # ページは最初に表示するときに 1 回だけ作り、以降は隠す/表示するだけにする
+        # （作り直さないので、切り替えが速く、ライブラリの再生もページを離れても続く）
+        self.pages = {}
 
         # レイアウト
         self.sidebar = tk.Frame(self.root, width=240, bg=c.COLOR_SIDEBAR)
@@ -79,19 +82,32 @@ class MyApp:
             else:
                 label.config(bg=c.COLOR_SIDEBAR) # 通常の色
 
-        # コンテンツの切り替え
-        for widget in self.content_area.winfo_children():
-            widget.destroy()
+        # コンテンツの切り替え（表示中のページは隠すだけで破棄しない）
+        for name, shown in self.pages.items():
+            if name != page_name and shown.winfo_manager():
+                shown.pack_forget()
+                if hasattr(shown, "on_hide"):
+                    shown.on_hide()
 
+        page = self.pages.get(page_name)
+        if page is None:
+            page = self._create_page(page_name)
+            self.pages[page_name] = page
+        elif not page.winfo_manager() and hasattr(page, "on_show"):
+            # 隠れている間に変わった分だけ反映する
+            page.on_show()
+        
+        page.pack(fill=tk.BOTH, expand=True)
+
+    def _create_page(self, page_name):
         theme = c.APP_THEME
         if page_name == "library":
-            page = LibraryPage(self.content_area, theme, self.app_config)
+            return LibraryPage(self.content_area, theme, self.app_config)
         elif page_name == "playlist":
-            page = PlaylistPage(self.content_area, theme, self.app_config)
+            return PlaylistPage(self.content_area, theme, self.app_config)
         elif page_name == "edit":
-            page = EditPage(self.content_area, theme, self.app_config)
-        
-        page.pack(fill=tk.BOTH, expand=True)
+            return EditPage(self.content_area, theme, self.app_config)
+        raise ValueError(f"unknown page: {page_name}")
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -1,45 +1,41 @@
 from pathlib import Path
-import subprocess
 from typing import Optional
 
+from misc.audio_probe import AudioInfo, probe_audio
+
 
 class AudioInfoError(Exception):
     """音声情報取得に失敗したときの例外"""
-    
-def get_duration_seconds(path: Path) -> Optional[float]:
+
+
+def get_audio_info(path: Path) -> Optional[AudioInfo]:
     """
-    ffprobe を使って音声ファイルの長さ（秒）を取得する。
+    音声ファイルの長さ・ビットレート・サンプリング周波数・チャンネル数・コーデックをまとめて返す。
+    結果は misc.audio_probe が (パス, サイズ, 更新時刻) ごとにキャッシュするので、
+    同じファイルを何度調べても外部プロセスは起動しない。
     取得に失敗した場合は None を返す。
-    ffprobe が存在しない・エラー終了した場合も None を返す。
     """
     if not path.is_file():
         return None
+    return probe_audio(path)
 
-    try:
-        result = subprocess.run(
-            [
-                "ffprobe",
-                "-v",
-                "error",
-                "-show_entries",
-                "format=duration",
-                "-of",
-                "default=noprint_wrappers=1:nokey=1",
-                str(path),
-            ],
-            check=True,
-            capture_output=True,
-            text=True,
-        )
-    except (FileNotFoundError, subprocess.CalledProcessError):
-        return None
 
-    try:
-        duration_sec = float(result.stdout.strip())
-    except ValueError:
+def get_duration_seconds(path: Path) -> Optional[float]:
+    """
+    音声ファイルの長さ（秒）を取得する。
+    取得に失敗した場合は None を返す。
+    ffmpeg が存在しない・エラー終了した場合も None を返す。
+    """
+    info = get_audio_info(path)
+    if info is None or info.duration is None or info.duration <= 0:
         return None
+    return info.duration
 
-    if duration_sec <= 0:
-        return None
 
-    return duration_sec
\ No newline at end of file
+def get_audio_codec(path: Path) -> Optional[str]:
+    """
+    最初の音声ストリームのコーデック名（"mp3", "aac", "opus" など）を返す。
+    音声が無い・取得に失敗した場合は None を返す。
+    """
+    info = get_audio_info(path)
+    return info.codec if info is not None else None
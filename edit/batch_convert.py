@@ -0,0 +1,331 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from edit.changemp3 import (
+    DEFAULT_FORMAT,
+    DEFAULT_OUTPUT_DIR,
+    OUTPUT_FORMATS,
+    build_convert_command,
+    is_fresh,
+    output_suffix,
+    partial_path,
+    plan_conversion,
+)
+from edit.audio_info import get_duration_seconds
+from misc.mp3_header import get_mp3_duration
+
+
+logger = logging.getLogger(__name__)
+
+# 使い方:
+#   python -m edit.batch_convert video1.mp4 video2.mp4     # ファイルを指定
+#   python -m edit.batch_convert ~/Videos                  # フォルダ内の mp4 をまとめて変換
+#   python -m edit.batch_convert ~/Videos -j 2 --force     # 同時実行数を指定、変換済みも作り直す
+#   python -m edit.batch_convert ~/Videos -f m4a           # AAC の音声はそのまま m4a に取り出す
+
+# mp3 のエンコードはほぼ 1 スレッドなので、CPU 数だけ ffmpeg を並べる
+DEFAULT_MAX_WORKERS = max(1, os.cpu_count() or 1)
+# フォルダを指定したときに変換対象にする拡張子
+CONVERT_SUFFIXES = (".mp4",)
+# ファイルを直接指定したときに受け付ける拡張子
+INPUT_SUFFIXES = (".mp4", ".mp3")
+# 出力フォルダに置く、出力ファイル名 → 元ファイルの対応表（同じ名前の別ファイルを上書きしないため）
+MANIFEST_NAME = ".sources.json"
+
+# 1 ファイル分の結果
+# - "converted"      : 変換した
+# - "fresh"          : 出力が元ファイルより新しいので変換しなかった
+# - "passthrough"    : 出力形式と同じファイルなので変換不要
+# - "failed"         : ffmpeg が失敗した
+# - "cancelled"      : キャンセルされた
+# - "missing_ffmpeg" : ffmpeg が見つからない
+STATUSES = ("converted", "fresh", "passthrough", "failed", "cancelled", "missing_ffmpeg")
+
+
+@dataclass
+class ConvertResult:
+    source: Path
+    output: Path
+    status: str = "pending"
+    message: str = ""
+    copied: bool = False  # 再エンコードせずにストリームコピーしたか
+    seconds: float = 0.0  # 変換にかかった時間
+    input_bytes: int = 0
+    audio_seconds: float = 0.0  # 変換した音声の長さ
+
+
+@dataclass
+class BatchReport:
+    results: List[ConvertResult] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    def by_status(self, status: str) -> List[ConvertResult]:
+        return [r for r in self.results if r.status == status]
+
+    @property
+    def failures(self) -> List[ConvertResult]:
+        return [r for r in self.results if r.status in ("failed", "cancelled", "missing_ffmpeg")]
+
+    def summary(self) -> str:
+        """件数とスループット（ファイル/秒・入力 MB/秒・再生時間に対する速度）"""
+        converted = self.by_status("converted")
+        counts = ", ".join(f"{s} {len(self.by_status(s))}" for s in STATUSES if self.by_status(s))
+        lines = [f"{len(self.results)} ファイル ({counts or 'なし'}) / {self.elapsed:.2f} 秒"]
+        if converted and self.elapsed > 0:
+            mb = sum(r.input_bytes for r in converted) / (1024 * 1024)
+            audio = sum(r.audio_seconds for r in converted)
+            busy = sum(r.seconds for r in converted)
+            copied = sum(1 for r in converted if r.copied)
+            lines.append(f"うちストリームコピー {copied}, 再エンコード {len(converted) - copied}")
+            line = f"変換: {len(converted) / self.elapsed:.2f} ファイル/秒, {mb / self.elapsed:.1f} MB/秒"
+            if audio > 0:
+                line += f", 音声 {audio:.0f} 秒を {audio / self.elapsed:.1f} 倍速"
+            lines.append(line + f"（並列化による短縮 {busy / self.elapsed:.1f} 倍）")
+        return "\n".join(lines)
+
+
+def expand_inputs(paths: Iterable[Path]) -> List[Path]:
+    """
+    ファイル・フォルダの並びを、変換対象のファイルの並びにする。
+    フォルダは中の mp4 を再帰的に集める。同じファイルは 1 回だけにする。
+    """
+    files: List[Path] = []
+    seen = set()
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            found = sorted(p for p in path.rglob("*") if p.is_file() and p.suffix.lower() in CONVERT_SUFFIXES)
+        else:
+            found = [path]
+        for p in found:
+            key = p.resolve()
+            if key not in seen:
+                seen.add(key)
+                files.append(p)
+    return files
+
+
+def _load_manifest(output_dir: Path) -> Dict[str, str]:
+    try:
+        data = json.loads((output_dir / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _save_manifest(output_dir: Path, manifest: Dict[str, str]) -> None:
+    tmp = output_dir / (MANIFEST_NAME + ".tmp")
+    try:
+        tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp, output_dir / MANIFEST_NAME)
+    except OSError:
+        logger.warning("failed to write %s", output_dir / MANIFEST_NAME, exc_info=True)
+
+
+def assign_output_paths(
+    sources: List[Path], output_dir: Path, manifest: Dict[str, str], suffix: str = ".mp3"
+) -> List[Path]:
+    """
+    出力ファイル名を決める。基本は <元の名前><suffix> で、
+    その名前が別の元ファイルの出力として使われていれば <元の名前>_<パスのハッシュ><suffix> にする。
+    同じ元ファイルには毎回同じ名前を返すので、変換済みかどうかを名前で判定できる。
+    """
+    owners = dict(manifest)
+    outputs = []
+    for src in sources:
+        source_key = str(src.resolve())
+        name = f"{src.stem}{suffix}"
+        owner = owners.get(name)
+        if owner is not None and owner != source_key:
+            name = f"{src.stem}_{hashlib.sha1(source_key.encode('utf-8')).hexdigest()[:8]}{suffix}"
+        owners[name] = source_key
+        outputs.append(output_dir / name)
+    return outputs
+
+
+def _is_converted(src: Path, output: Path, manifest: Dict[str, str]) -> bool:
+    """対応表でこの元ファイルの出力と分かっていて、元ファイルより新しければ変換済みとみなす"""
+    return manifest.get(output.name) == str(src.resolve()) and is_fresh(src, output)
+
+
+def _run_cancellable(cmd: List[str], cancel_event: Optional[threading.Event]) -> Tuple[str, str]:
+    """ffmpeg を実行し、(状態, エラーメッセージ) を返す。キャンセルされたら ffmpeg を止める。"""
+    try:
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        return "missing_ffmpeg", ""
+
+    # stderr のパイプが詰まらないよう別スレッドで読み出しておく
+    stderr_chunks: List[bytes] = []
+    reader = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)
+    reader.start()
+
+    while True:
+        try:
+            proc.wait(timeout=0.1)
+            break
+        except subprocess.TimeoutExpired:
+            if cancel_event is not None and cancel_event.is_set():
+                proc.kill()
+                proc.wait()
+                return "cancelled", ""
+    reader.join()
+    if proc.returncode != 0:
+        return "failed", b"".join(stderr_chunks).decode("utf-8", errors="replace").strip()[-300:]
+    return "converted", ""
+
+
+def _convert_one(result: ConvertResult, output_format: str, cancel_event: Optional[threading.Event]) -> ConvertResult:
+    """
+    1 ファイルを変換する。音声が出力形式のコーデックならストリームコピーし、
+    コピーに失敗した場合は再エンコードでやり直す。
+    """
+    if cancel_event is not None and cancel_event.is_set():
+        result.status = "cancelled"
+        return result
+
+    t0 = time.perf_counter()
+    tmp_file = partial_path(result.output)
+    try:
+        cmd, result.copied = plan_conversion(result.source, tmp_file, output_format)
+        result.status, result.message = _run_cancellable(cmd, cancel_event)
+        if result.status == "failed" and result.copied:
+            logger.info("stream copy failed, re-encoding: %s\n%s", result.source, result.message)
+            result.copied = False
+            cmd = build_convert_command(result.source, tmp_file, output_format)
+            result.status, result.message = _run_cancellable(cmd, cancel_event)
+        if result.status == "converted":
+            os.replace(tmp_file, result.output)
+    finally:
+        tmp_file.unlink(missing_ok=True)
+
+    if result.status == "converted":
+        result.seconds = time.perf_counter() - t0
+        if result.output.suffix.lower() == ".mp3":
+            result.audio_seconds = get_mp3_duration(result.output) or 0.0
+        else:
+            result.audio_seconds = get_duration_seconds(result.output) or 0.0
+    return result
+
+
+def convert_batch(
+    inputs: Iterable[Path],
+    output_dir: Path = DEFAULT_OUTPUT_DIR,
+    max_workers: Optional[int] = None,
+    force: bool = False,
+    cancel_event: Optional[threading.Event] = None,
+    job=None,
+    on_result: Optional[Callable[[ConvertResult], None]] = None,
+    output_format: str = DEFAULT_FORMAT,
+) -> BatchReport:
+    """
+    ファイル・フォルダをまとめて output_format（既定は mp3）に変換する。最大 max_workers 個の ffmpeg を並列に動かす。
+    音声がすでに出力形式のコーデックなら再エンコードせずにコピーする。
+    出力が元ファイルより新しいものは変換しない（force=True なら作り直す）。
+    戻り値の results の順序は入力（フォルダは展開後）と同じ。
+    on_result: 1 ファイル終わるごとにワーカースレッドから呼ばれる
+    job: edit.job_runner.Job を渡すと進捗通知・キャンセルに対応する
+    """
+    if job is not None:
+        cancel_event = job.cancel_event
+    t0 = time.perf_counter()
+    sources = expand_inputs(inputs)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = _load_manifest(output_dir)
+    results: List[ConvertResult] = []
+    pending: List[ConvertResult] = []
+    suffix = output_suffix(output_format)
+    to_convert = [s for s in sources if s.suffix.lower() != suffix]
+    outputs = dict(zip(to_convert, assign_output_paths(to_convert, output_dir, manifest, suffix)))
+    for src in sources:
+        if src not in outputs:
+            result = ConvertResult(src, src, "passthrough")
+        else:
+            result = ConvertResult(src, outputs[src])
+            if not src.is_file():
+                result.status, result.message = "failed", "ファイルが見つかりません"
+            elif src.suffix.lower() not in INPUT_SUFFIXES:
+                result.status, result.message = "failed", "対応していないファイル形式です。（mp3 または mp4 のみ対応）"
+            elif not force and _is_converted(src, result.output, manifest):
+                result.status = "fresh"
+            else:
+                result.input_bytes = src.stat().st_size
+                pending.append(result)
+        results.append(result)
+
+    for r in results:
+        if r.status != "pending" and on_result is not None:
+            on_result(r)
+
+    done = [0]
+    lock = threading.Lock()
+
+    def run(result: ConvertResult) -> ConvertResult:
+        _convert_one(result, output_format, cancel_event)
+        with lock:
+            done[0] += 1
+            if result.status == "converted":
+                manifest[result.output.name] = str(result.source.resolve())
+        if job is not None:
+            job.report(done[0] / len(pending), f"変換中 ({done[0]}/{len(pending)})")
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    if pending:
+        workers = max(1, min(max_workers or DEFAULT_MAX_WORKERS, len(pending)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run, pending))
+        _save_manifest(output_dir, manifest)
+
+    return BatchReport(results, time.perf_counter() - t0)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="mp4 をまとめて mp3（m4a / opus）に変換する")
+    parser.add_argument("inputs", nargs="+", type=Path, help="変換するファイルまたはフォルダ")
+    parser.add_argument("-o", "--output-dir", type=Path, default=DEFAULT_OUTPUT_DIR, help="出力先フォルダ")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help=f"同時に動かす ffmpeg の数（既定: {DEFAULT_MAX_WORKERS}）")
+    parser.add_argument("-f", "--format", choices=list(OUTPUT_FORMATS), default=DEFAULT_FORMAT, help="出力形式")
+    parser.add_argument("--force", action="store_true", help="変換済みのファイルも作り直す")
+    args = parser.parse_args(argv)
+
+    def on_result(r: ConvertResult) -> None:
+        if r.status == "converted":
+            method = "コピー" if r.copied else "再エンコード"
+            print(f"変換完了: {r.source} -> {r.output} ({method}, {r.seconds:.1f} 秒)")
+        elif r.status == "fresh":
+            print(f"変換済み: {r.source} -> {r.output}")
+        elif r.status == "passthrough":
+            print(f"{args.format}ファイルのため変換をスキップします: {r.source}")
+        elif r.status == "missing_ffmpeg":
+            print("エラー: ffmpeg コマンドが見つかりません。ffmpeg をインストールしてください。", file=sys.stderr)
+        else:
+            print(f"エラー: {r.source}: {r.status} {r.message}", file=sys.stderr)
+
+    try:
+        report = convert_batch(
+            args.inputs, args.output_dir, args.jobs, args.force, on_result=on_result, output_format=args.format
+        )
+    except KeyboardInterrupt:
+        sys.exit(130)
+    print(report.summary())
+    if report.failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
+import os
 import sys
 import subprocess
 from pathlib import Path
+from typing import List, Optional, Tuple
+
+from edit.audio_info import get_audio_codec
 
 # 例: 他のスクリプトからの利用方法
 
@@ -18,12 +22,101 @@ from pathlib import Path
 class ConvertError(Exception):
 	"""mp4→mp3 変換時のエラー用例外"""
 
-def convert_mp4_to_mp3(input_file: Path) -> Path:
+
+# 変換後の mp3 は、このスクリプトと同じフォルダ配下の "editfiles" ディレクトリに保存する
+DEFAULT_OUTPUT_DIR = Path(__file__).resolve().parent / "editfiles"
+
+
+# 出力形式ごとの設定: (拡張子, ffmpeg の出力形式, そのままコピーできるコーデック, 再エンコードの引数)
+OUTPUT_FORMATS = {
+	"mp3": (".mp3", "mp3", ("mp3",), ["-c:a", "libmp3lame", "-b:a", "192k"]),
+	"m4a": (".m4a", "ipod", ("aac", "alac"), ["-c:a", "aac", "-b:a", "192k"]),
+	"opus": (".opus", "opus", ("opus",), ["-c:a", "libopus", "-b:a", "128k"]),
+}
+DEFAULT_FORMAT = "mp3"
+
+
+def output_suffix(output_format: str) -> str:
+	if output_format not in OUTPUT_FORMATS:
+		raise ConvertError(f"対応していない出力形式です: {output_format}")
+	return OUTPUT_FORMATS[output_format][0]
+
+
+def can_stream_copy(codec: Optional[str], output_format: str) -> bool:
+	"""元の音声をそのまま（再エンコードせずに）出力形式のコンテナに入れられるか"""
+	return codec is not None and codec in OUTPUT_FORMATS[output_format][2]
+
+
+def build_convert_command(
+	input_file: Path,
+	output_file: Path,
+	output_format: str = DEFAULT_FORMAT,
+	copy: bool = False,
+) -> List[str]:
+	"""
+	動画から最初の音声ストリームだけを取り出して output_format にする ffmpeg コマンド。
+	copy=True ならストリームコピー（無劣化・高速）、False なら再エンコードする。
+	出力形式は拡張子ではなく -f で指定するので、一時ファイル名（.part）にも書き出せる。
+	"""
+	_suffix, muxer, _codecs, encode_args = OUTPUT_FORMATS[output_format]
+	return [
+		"ffmpeg",
+		"-y",  # 上書き確認なし
+		"-i",
+		str(input_file),
+		"-map",
+		"0:a:0",
+		"-vn",  # 映像を無効化
+		"-sn",
+		"-dn",
+		*(["-c:a", "copy"] if copy else encode_args),
+		"-f",
+		muxer,
+		str(output_file),
+	]
+
+
+def plan_conversion(input_file: Path, output_file: Path, output_format: str = DEFAULT_FORMAT) -> Tuple[List[str], bool]:
+	"""
+	音声のコーデックを調べて、変換コマンドとストリームコピーするかどうかを返す。
+	コーデックが分からない場合は再エンコードする。
+	"""
+	copy = can_stream_copy(get_audio_codec(input_file), output_format)
+	return build_convert_command(input_file, output_file, output_format, copy), copy
+
+
+def is_fresh(input_file: Path, output_file: Path) -> bool:
+	"""出力が存在し、入力より新しい（入力の更新後に作られた）か"""
+	try:
+		return output_file.stat().st_mtime_ns >= input_file.stat().st_mtime_ns
+	except OSError:
+		return False
+
+
+def partial_path(output_file: Path) -> Path:
+	"""書き出し途中のファイル名（完了後に output_file へ置き換える）"""
+	return output_file.with_name(output_file.name + ".part")
+
+
+def convert_mp4_to_mp3(
+	input_file: Path,
+	job=None,
+	output_file: Optional[Path] = None,
+	skip_if_fresh: bool = False,
+	output_format: str = DEFAULT_FORMAT,
+) -> Path:
 	"""
-	mp4 ファイルを mp3 に変換するライブラリ関数。
-	- mp3 の場合: 変換せず、そのまま Path を返す
-	- mp4 の場合: mp3 を生成し、その mp3 の Path を返す
+	mp4 ファイルを mp3（または output_format）に変換するライブラリ関数。
+	- 出力形式と同じ拡張子の場合: 変換せず、そのまま Path を返す
+	- mp4 の場合: 変換したファイルを生成し、その Path を返す
+	  音声がすでに出力形式のコーデック（mp3 なら MP3、m4a なら AAC など）なら再エンコードせずにコピーする
 	- それ以外: ConvertError を送出
+	job: edit.job_runner.Job を渡すと進捗通知・キャンセルに対応した実行になる
+	output_file: 出力先（None の場合は editfiles/<元の名前>.<出力形式の拡張子>）
+	skip_if_fresh: 出力が入力より新しければ変換せずにそのまま返す
+	output_format: "mp3" / "m4a" / "opus"
+
+	複数ファイルをまとめて変換する場合は edit.batch_convert を使う。
 	"""
 
 	if not input_file.exists():
@@ -33,51 +126,64 @@ def convert_mp4_to_mp3(input_file: Path) -> Path:
 		raise ConvertError(f"通常のファイルではありません: {input_file}")
 
 	ext = input_file.suffix.lower()
+	suffix = output_suffix(output_format)
 
-	if ext == ".mp3":
+	if ext == suffix:
 		# 変換不要
 		return input_file
 
-	if ext != ".mp4":
+	if ext not in (".mp4", ".mp3"):
 		raise ConvertError("対応していないファイル形式です。（mp3 または mp4 のみ対応）")
 
-	# 変換後の mp3 は、このスクリプトと同じフォルダ配下の
-	# "editfiles" ディレクトリに保存する
-	base_dir = Path(__file__).resolve().parent
-	output_dir = base_dir / "editfiles"
-	output_dir.mkdir(exist_ok=True)
+	if output_file is None:
+		output_file = DEFAULT_OUTPUT_DIR / f"{input_file.stem}{suffix}"
+	output_file.parent.mkdir(parents=True, exist_ok=True)
 
-	output_file = output_dir / f"{input_file.stem}.mp3"
+	if skip_if_fresh and is_fresh(input_file, output_file):
+		return output_file
 
-	cmd = [
-		"ffmpeg",
-		"-y",  # 上書き確認なし
-		"-i",
-		str(input_file),
-		"-vn",  # 映像を無効化
-		"-acodec",
-		"libmp3lame",
-		"-ab",
-		"192k",
-		str(output_file),
-	]
+	# 途中で失敗・キャンセルしても、書きかけのファイルが「変換済み」に見えないようにする
+	tmp_file = partial_path(output_file)
+	cmd, copy = plan_conversion(input_file, tmp_file, output_format)
 
 	try:
-		subprocess.run(cmd, check=True)
+		try:
+			_run_convert(cmd, input_file, job)
+		except subprocess.CalledProcessError:
+			if not copy or (job is not None and job.cancelled):
+				raise
+			# コピーできないストリームだった場合は再エンコードでやり直す
+			_run_convert(build_convert_command(input_file, tmp_file, output_format), input_file, job)
+		os.replace(tmp_file, output_file)
 	except FileNotFoundError as exc:
 		raise ConvertError("ffmpeg コマンドが見つかりません。ffmpeg をインストールしてください。") from exc
 	except subprocess.CalledProcessError as exc:
 		raise ConvertError("変換中に問題が発生しました。") from exc
+	finally:
+		tmp_file.unlink(missing_ok=True)
 
 	return output_file
 
 
+def _run_convert(cmd: List[str], input_file: Path, job) -> None:
+	if job is not None:
+		job.run_ffmpeg(cmd, text=f"変換中: {input_file.name}")
+	else:
+		subprocess.run(cmd, check=True)
+
+
 def main() -> None:
 
 	if len(sys.argv) < 2:
-		print("使い方: python changemp3.py 入力ファイルパス", file=sys.stderr)
+		print("使い方: python -m edit.changemp3 入力ファイルパス [入力ファイル/フォルダ ...]", file=sys.stderr)
 		sys.exit(1)
 
+	# 複数のファイルやフォルダが渡されたときは一括変換にまかせる
+	if len(sys.argv) > 2 or Path(sys.argv[1]).is_dir():
+		from edit.batch_convert import main as batch_main
+		batch_main(sys.argv[1:])
+		return
+
 	input_path = Path(sys.argv[1])
 
 	try:
@@ -0,0 +1,160 @@
+import argparse
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from edit.export_benchmark import legacy_export
+from edit.segment_exporter import build_filter_command, export_segments
+from edit.segments import Segment
+from edit.smart_cut import get_frame_index
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 使い方:
+#   python -m edit.cut_accuracy                    # テスト信号で各方式の境界誤差を比較
+#   python -m edit.cut_accuracy -n 8 --seed 3      # セグメント数・乱数を指定
+#   python -m edit.cut_accuracy --source song.mp3  # 手元の MP3 で測る
+#
+# 各方式で書き出したファイルをデコードし、元音声から直接切り出した参照 PCM と比べる。
+# セグメントの継ぎ目ごとに、出力が参照から何サンプルずれているかを相互相関で求める。
+
+METHODS = ("legacy", "copy", "filter", "smart")
+# 継ぎ目のずれを探す範囲（サンプル）と、比較に使う窓の長さ
+SEARCH_SAMPLES = 3000
+WINDOW_SAMPLES = 4096
+
+
+def _make_source(tmpdir: Path, seconds: float) -> Path:
+    """相関でずれを測りやすいよう、チャープとノイズを混ぜた mp3 を作る"""
+    src = tmpdir / "accuracy_source.mp3"
+    subprocess.run(
+        [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"aevalsrc=0.4*sin(2*PI*(200+40*t)*t):s=44100:d={seconds}",
+            "-f", "lavfi", "-i", f"anoisesrc=d={seconds}:a=0.2:r=44100:seed=7",
+            "-filter_complex", "amix=inputs=2:normalize=0", "-ac", "2",
+            "-c:a", "libmp3lame", "-b:a", "192k", str(src),
+        ],
+        check=True,
+    )
+    return src
+
+
+def _decode(path: Path) -> "np.ndarray":
+    """ファイルをモノラルの float PCM にデコードする（LAME タグの遅延・パディングは ffmpeg が処理する）"""
+    result = subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-i", str(path), "-ac", "1", "-f", "s16le", "pipe:1"],
+        check=True,
+        capture_output=True,
+    )
+    return np.frombuffer(result.stdout, dtype="<i2").astype(np.float32) / 32768.0
+
+
+def _make_segments(src: Path, count: int, seconds: float, rng: random.Random) -> List[Segment]:
+    segments = []
+    for _ in range(count):
+        duration = rng.uniform(1.5, 6.0)
+        start = rng.uniform(0.0, seconds - duration - 0.5)
+        # 0.1ms 単位にそろえて、サンプル位置が端数にならない範囲で指定する
+        segments.append((src, round(start, 4), round(duration, 4)))
+    return segments
+
+
+def _reference(pcm: "np.ndarray", segments: List[Segment], sample_rate: int) -> "np.ndarray":
+    parts = []
+    for _src, start, duration in segments:
+        a = round(start * sample_rate)
+        b = round((start + duration) * sample_rate)
+        parts.append(pcm[a:b])
+    return np.concatenate(parts)
+
+
+def _lag_at(out: "np.ndarray", ref: "np.ndarray", pos: int) -> int:
+    """参照の pos 以降の窓が、出力のどこに最もよく一致するか（ずれのサンプル数）"""
+    window = ref[pos:pos + WINDOW_SAMPLES]
+    lo = max(0, pos - SEARCH_SAMPLES)
+    hi = min(len(out), pos + SEARCH_SAMPLES + len(window))
+    target = out[lo:hi]
+    if len(window) == 0 or len(target) < len(window):
+        return SEARCH_SAMPLES
+    corr = np.correlate(target, window, mode="valid")
+    energy = np.convolve(target * target, np.ones(len(window)), mode="valid")
+    score = corr / np.sqrt(np.maximum(energy, 1e-12))
+    return int(np.argmax(score)) + lo - pos
+
+
+def measure(out_pcm: "np.ndarray", ref: "np.ndarray", segments: List[Segment], sample_rate: int) -> Dict[str, float]:
+    """各セグメントの先頭（継ぎ目の直後）と末尾直前のずれ、全体の長さの誤差を返す"""
+    lags = []
+    pos = 0
+    for _src, start, duration in segments:
+        length = round((start + duration) * sample_rate) - round(start * sample_rate)
+        lags.append(_lag_at(out_pcm, ref, pos + 64))
+        lags.append(_lag_at(out_pcm, ref, pos + max(length - WINDOW_SAMPLES - 64, 0)))
+        pos += length
+    abs_lags = [abs(x) for x in lags]
+    return {
+        "length_error": len(out_pcm) - len(ref),
+        "max_lag": max(abs_lags),
+        "mean_lag": sum(abs_lags) / len(abs_lags),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="セグメント書き出し方式ごとの境界誤差（サンプル数）の測定")
+    parser.add_argument("-n", "--segments", type=int, default=5, help="セグメント数")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--source", type=Path, help="測定に使う mp3（省略時はテスト信号を生成）")
+    parser.add_argument("-m", "--methods", nargs="+", default=list(METHODS), choices=METHODS)
+    args = parser.parse_args()
+
+    if np is None:
+        print("エラー: この測定には numpy が必要です。", file=sys.stderr)
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir_path = Path(tmpdir)
+        try:
+            src = args.source or _make_source(tmpdir_path, 60.0)
+            pcm = _decode(src)
+        except (FileNotFoundError, subprocess.CalledProcessError):
+            print("エラー: ffmpeg で音源を用意できませんでした。", file=sys.stderr)
+            sys.exit(1)
+
+        sample_rate = get_frame_index(src).sample_rate
+        seconds = len(pcm) / sample_rate
+        segments = _make_segments(src, args.segments, seconds, random.Random(args.seed))
+        ref = _reference(pcm, segments, sample_rate)
+
+        exporters: Dict[str, Callable[[Path], None]] = {
+            "legacy": lambda out: legacy_export(segments, out),
+            "copy": lambda out: export_segments(segments, out, mode="copy", use_cache=False),
+            # 参照と同じサンプリング周波数で比べる
+            "filter": lambda out: subprocess.run(
+                build_filter_command(segments, out, sample_rate=sample_rate), check=True, capture_output=True
+            ),
+            "smart": lambda out: export_segments(segments, out, mode="smart", use_cache=False),
+        }
+
+        print(f"{'method':>8} {'time':>8} {'length':>8} {'max lag':>8} {'mean lag':>9}")
+        for method in args.methods:
+            out = tmpdir_path / f"out_{method}.mp3"
+            t0 = time.perf_counter()
+            exporters[method](out)
+            elapsed = time.perf_counter() - t0
+            result = measure(_decode(out), ref, segments, sample_rate)
+            print(
+                f"{method:>8} {elapsed:>7.3f}s {result['length_error']:>8d} "
+                f"{result['max_lag']:>8d} {result['mean_lag']:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from edit.segment_exporter import build_copy_command, export_segments
+from edit.segments import Segment
+
+# 使い方:
+#   python -m edit.export_benchmark            # 2, 10, 50 セグメントで比較
+#   python -m edit.export_benchmark -n 5 20    # セグメント数を指定
+
+SEGMENT_COUNTS = (2, 10, 50)
+SEGMENT_SECONDS = 5.0
+
+
+def _make_source(tmpdir: Path, seconds: float) -> Path:
+    """ベンチマーク用の mp3 を ffmpeg のテスト信号から作る"""
+    src = tmpdir / "bench_source.mp3"
+    subprocess.run(
+        [
+            "ffmpeg", "-y", "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+            "-ac", "2", "-c:a", "libmp3lame", "-b:a", "192k", str(src),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return src
+
+
+def _make_segments(src: Path, count: int, source_seconds: float) -> List[Segment]:
+    step = (source_seconds - SEGMENT_SECONDS) / max(count, 1)
+    return [(src, i * step, SEGMENT_SECONDS) for i in range(count)]
+
+
+def legacy_export(segments: List[Segment], out_path: Path) -> None:
+    """従来の方式: セグメントごとに ffmpeg で一時ファイルに切り出してから concat で連結する"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir_path = Path(tmpdir)
+        list_file = tmpdir_path / "concat_list.txt"
+        with list_file.open("w", encoding="utf-8") as f:
+            for i, (src, start, duration) in enumerate(segments):
+                seg_path = tmpdir_path / f"seg_{i}.mp3"
+                subprocess.run(
+                    ["ffmpeg", "-y", "-ss", str(start), "-t", str(duration), "-i", str(src),
+                     "-acodec", "copy", str(seg_path)],
+                    check=True,
+                    capture_output=True,
+                )
+                f.write(f"file '{seg_path.as_posix()}'\n")
+        subprocess.run(build_copy_command(list_file, out_path), check=True, capture_output=True)
+
+
+def _time(func: Callable[[], None], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="セグメント書き出し方式の速度比較")
+    parser.add_argument("-n", "--counts", type=int, nargs="+", default=list(SEGMENT_COUNTS))
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="各計測の繰り返し回数（最速値を採用）")
+    args = parser.parse_args()
+
+    source_seconds = max(args.counts) * SEGMENT_SECONDS * 2 + SEGMENT_SECONDS
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir_path = Path(tmpdir)
+        try:
+            src = _make_source(tmpdir_path, source_seconds)
+        except (FileNotFoundError, subprocess.CalledProcessError):
+            print("エラー: ffmpeg でテスト用の音源を作成できませんでした。", file=sys.stderr)
+            sys.exit(1)
+
+        print(f"{'segments':>8} {'legacy':>10} {'copy':>10} {'filter':>10}")
+        for count in args.counts:
+            segments = _make_segments(src, count, source_seconds)
+            out = tmpdir_path / "out.mp3"
+            legacy = _time(lambda: legacy_export(segments, out), args.repeat)
+            copy = _time(lambda: export_segments(segments, out, mode="copy", use_cache=False), args.repeat)
+            filt = _time(lambda: export_segments(segments, out, mode="filter", use_cache=False), args.repeat)
+            print(f"{count:>8} {legacy:>9.3f}s {copy:>9.3f}s {filt:>9.3f}s")
+
+
+if __name__ == "__main__":
+    main()
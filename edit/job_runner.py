@@ -0,0 +1,247 @@
+import queue
+import subprocess
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, List, Optional
+
+
+class JobCancelled(Exception):
+    """ジョブがキャンセルされたときの例外"""
+
+
+class Job:
+    """
+    バックグラウンドで実行中の処理 1 つ分。
+    ワーカースレッド側からは report() / run_process() / run_ffmpeg() を使い、
+    Tk 側からは cancel() で中止できる。
+    """
+
+    def __init__(self, runner: "JobRunner", label: str):
+        self.label = label
+        self.cancel_event = threading.Event()
+        self._runner = runner
+        self._process: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self) -> None:
+        """ジョブを中止する（実行中の外部プロセスも終了させる）"""
+        self.cancel_event.set()
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                self._process.terminate()
+
+    def check_cancelled(self) -> None:
+        if self.cancelled:
+            raise JobCancelled(self.label)
+
+    @contextmanager
+    def attach(self, proc: subprocess.Popen):
+        """
+        with 文の間、proc を cancel() で終了させる対象として登録する。
+        登録前に cancel() されていた場合はすぐに終了させる。
+        """
+        with self._lock:
+            self._process = proc
+            if self.cancelled:
+                proc.terminate()
+        try:
+            yield proc
+        finally:
+            with self._lock:
+                self._process = None
+
+    def report(self, fraction: Optional[float], text: str = "") -> None:
+        """進捗を Tk 側に通知する（fraction は 0.0〜1.0、不明なら None）"""
+        self._runner._post(self, "progress", (fraction, text))
+
+    def run_process(
+        self,
+        cmd: List[str],
+        on_line: Optional[Callable[[str], None]] = None,
+        on_stderr_line: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        """
+        外部プロセスを実行し、終了まで待つ。
+        stdout / stderr は 1 行ずつ on_line / on_stderr_line に渡す。
+        キャンセル時は JobCancelled、異常終了時は subprocess.CalledProcessError を送出する。
+        """
+        self.check_cancelled()
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        # stderr はパイプが詰まらないよう別スレッドで読み出す
+        stderr_lines: List[str] = []
+
+        def read_stderr():
+            for line in proc.stderr:
+                stderr_lines.append(line)
+                if on_stderr_line is not None:
+                    on_stderr_line(line.strip())
+
+        with self.attach(proc):
+            reader = threading.Thread(target=read_stderr, daemon=True)
+            reader.start()
+            for line in proc.stdout:
+                if on_line is not None:
+                    on_line(line.strip())
+            proc.wait()
+            reader.join()
+
+        self.check_cancelled()
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stderr="".join(stderr_lines[-50:]))
+
+    def run_ffmpeg(self, cmd: List[str], total_seconds: Optional[float] = None, text: str = "") -> None:
+        """
+        ffmpeg を -progress 付きで実行し、出力時刻から進捗を通知する。
+        cmd は "ffmpeg" で始まるコマンド。
+        total_seconds が None の場合は ffmpeg が stderr に出す入力の Duration を使う。
+        """
+        cmd = [cmd[0], "-nostats", "-progress", "pipe:1", *cmd[1:]]
+        total = [total_seconds]
+
+        def on_stderr_line(line: str) -> None:
+            # 例: "Duration: 00:03:21.45, start: 0.000000, bitrate: 192 kb/s"
+            if total[0] is None and line.startswith("Duration:"):
+                stamp = line.split(",", 1)[0].split(":", 1)[1].strip()
+                try:
+                    h, m, sec = stamp.split(":")
+                    total[0] = int(h) * 3600 + int(m) * 60 + float(sec)
+                except ValueError:
+                    pass
+
+        def on_line(line: str) -> None:
+            key, _, value = line.partition("=")
+            if key in ("out_time_us", "out_time_ms"):
+                # どちらのキーも単位はマイクロ秒
+                try:
+                    sec = int(value) / 1_000_000
+                except ValueError:
+                    return
+                if total[0]:
+                    self.report(max(0.0, min(sec / total[0], 1.0)), text)
+                else:
+                    self.report(None, text)
+            elif key == "progress" and value == "end":
+                self.report(1.0, text)
+
+        self.run_process(cmd, on_line, on_stderr_line)
+
+
+class JobRunner:
+    """
+    処理をワーカースレッドで実行し、結果と進捗を Tk のメインスレッドに戻す。
+    ワーカーからは Tk を直接触らず、キューに積んだものを after() で取り出して
+    コールバックを呼ぶ。ジョブが無い間はポーリングしない。
+    """
+
+    POLL_MS = 16  # 約 60fps で進捗を反映する
+
+    def __init__(self, widget):
+        self._widget = widget
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._callbacks = {}
+        self._polling = False
+
+    def submit(
+        self,
+        func: Callable[..., Any],
+        *args,
+        label: str = "",
+        on_done: Optional[Callable[[Any], None]] = None,
+        on_error: Optional[Callable[[BaseException], None]] = None,
+        on_progress: Optional[Callable[[Optional[float], str], None]] = None,
+        on_cancel: Optional[Callable[[], None]] = None,
+    ) -> Job:
+        """
+        func(job, *args) をワーカースレッドで実行する。
+        コールバックはすべてメインスレッドで呼ばれる。
+        """
+        job = Job(self, label)
+        self._callbacks[job] = (on_done, on_error, on_progress, on_cancel)
+
+        def worker():
+            try:
+                result = func(job, *args)
+            except JobCancelled:
+                self._post(job, "cancelled", None)
+            except BaseException as exc:  # ワーカーの例外はすべて Tk 側に渡す
+                if job.cancelled:
+                    self._post(job, "cancelled", None)
+                else:
+                    self._post(job, "error", exc)
+            else:
+                if job.cancelled:
+                    self._post(job, "cancelled", None)
+                else:
+                    self._post(job, "done", result)
+
+        threading.Thread(target=worker, name=f"job-{label}", daemon=True).start()
+        self._ensure_polling()
+        return job
+
+    def has_active_jobs(self) -> bool:
+        return bool(self._callbacks)
+
+    def cancel_all(self) -> None:
+        for job in list(self._callbacks):
+            job.cancel()
+
+    def _post(self, job: Job, kind: str, payload: Any) -> None:
+        self._queue.put((job, kind, payload))
+
+    def _ensure_polling(self) -> None:
+        if not self._polling:
+            self._polling = True
+            self._widget.after(self.POLL_MS, self._poll)
+
+    def _poll(self) -> None:
+        latest_progress = {}
+        finished = []
+        while True:
+            try:
+                job, kind, payload = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                # 1 フレーム内の進捗は最新のものだけ反映すれば十分
+                latest_progress[job] = payload
+            else:
+                finished.append((job, kind, payload))
+
+        for job, (fraction, text) in latest_progress.items():
+            callbacks = self._callbacks.get(job)
+            if callbacks and callbacks[2]:
+                callbacks[2](fraction, text)
+
+        for job, kind, payload in finished:
+            callbacks = self._callbacks.pop(job, None)
+            if not callbacks:
+                continue
+            on_done, on_error, _on_progress, on_cancel = callbacks
+            if kind == "done" and on_done:
+                on_done(payload)
+            elif kind == "error" and on_error:
+                on_error(payload)
+            elif kind == "cancelled" and on_cancel:
+                on_cancel()
+
+        if self._callbacks:
+            try:
+                self._widget.after(self.POLL_MS, self._poll)
+            except Exception:
+                # ウィジェットが破棄された場合は残りのジョブを止める
+                self.cancel_all()
+                self._polling = False
+        else:
+            self._polling = False
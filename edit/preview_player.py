@@ -1,55 +1,128 @@
 import subprocess
-import tempfile
+import threading
+import time
 from pathlib import Path
-from tkinter import messagebox
-from typing import Iterable
+from typing import Iterable, List, Sequence
 
-from edit.segment_cutter import Segment, cut_segments_to_temp_files
+import pygame
 
+from edit.segment_exporter import build_filter_command, cached_export, choose_mode
+from edit.segments import Segment
 
-def preview_segments(segments: Iterable[Segment]) -> None:
+
+class PreviewError(Exception):
+    """プレビュー再生に失敗したときの例外"""
+
+
+# pygame ミキサーのサンプル形式（pygame.mixer.get_init() の size）に対応する ffmpeg の出力形式
+_PCM_FORMATS = {
+    8: ("u8", "pcm_u8"),
+    -8: ("s8", "pcm_s8"),
+    16: ("u16le", "pcm_u16le"),
+    -16: ("s16le", "pcm_s16le"),
+    32: ("f32le", "pcm_f32le"),
+}
+
+# 最初の 1 ブロックは短くして、すぐに音が出るようにする
+FIRST_CHUNK_SECONDS = 0.05
+CHUNK_SECONDS = 0.25
+
+
+def build_pcm_command(segments: Sequence[Segment], sample_rate: int, channels: int, size: int) -> List[str]:
     """
-    渡されたセグメントを順番に一時ファイルに切り出して再生する。
-    segments: (元ファイル Path, 開始秒, 長さ秒) のタプルのイテラブル
+    選択範囲だけをデコード・連結し、生の PCM を標準出力に流す ffmpeg コマンドを作る。
+    フィルタグラフは書き出し（filter モード）と同じものを使う。
     """
+    if size not in _PCM_FORMATS:
+        raise PreviewError(f"未対応のミキサー形式です: {size}")
+    fmt, codec = _PCM_FORMATS[size]
+    codec_args = ["-f", fmt, "-c:a", codec, "-ac", str(channels)]
+    cmd = build_filter_command(segments, "pipe:1", codec_args, sample_rate)
+    # 進捗表示などの stderr 出力は不要
+    return [cmd[0], "-loglevel", "error", "-nostdin", *cmd[1:]]
+
+
+def _read_block(stream, size: int, frame_bytes: int) -> bytes:
+    """size バイト読み出す（終端ではフレーム境界に切り詰める）"""
+    data = stream.read(size)
+    return data[: len(data) - len(data) % frame_bytes]
 
+
+def stream_segments(segments: Iterable[Segment], job) -> None:
+    """
+    選択範囲を 1 本の ffmpeg でデコードし、PCM をそのまま pygame ミキサーに流して再生する。
+    一時ファイルは作らず、セグメントの継ぎ目も途切れない（Channel.queue で隙間なく繋ぐ）。
+    ワーカースレッドから呼ぶ。
+    job: edit.job_runner.Job（キャンセルすると ffmpeg と再生を止める）
+
+    ffmpeg の問題は PreviewError を送出する。
+    """
     segments = list(segments)
-    if not segments:
-        messagebox.showwarning("入力エラー", "再生する切り取り範囲がありません。")
-        return
+    total = sum(duration for _src, _start, duration in segments)
+
+    # 同じ選択範囲を書き出し済みなら、切り出し・連結済みのファイルを 1 本デコードするだけで済む
+    # （再生が終わるまでキャッシュから消されない）。
+    # MP3 だけならスマートカットは境界の再エンコードだけで済むので、先に書き出してキャッシュに入れておき、
+    # 続けて保存するときに書き出し直さないようにする。それ以外は全体のエンコードを待たずにそのまま流す
+    render = choose_mode(segments, Path("preview.mp3")) == "smart"
+    with cached_export(segments, job=job, render=render) as rendered:
+        _play([(rendered, 0.0, total)] if rendered is not None else segments, total, job)
 
+
+def _play(source: Sequence[Segment], total: float, job) -> None:
+    if not pygame.mixer.get_init():
+        pygame.mixer.init()
+    sample_rate, size, channels = pygame.mixer.get_init()
+    frame_bytes = (abs(size) // 8) * channels
+    bytes_per_second = sample_rate * frame_bytes
+    cmd = build_pcm_command(source, sample_rate, channels, size)
     try:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            tmpdir_path = Path(tmpdir)
-
-            # 共通ヘルパーを使って一時mp3として切り出し
-            temp_files = cut_segments_to_temp_files(tmpdir_path, segments, "preview", "プレビュー用")
-            if temp_files is None:
-                return
-
-            # 一時ファイルを順番に再生（=連結して再生するイメージ）
-            for temp in temp_files:
-                try:
-                    subprocess.run(
-                        [
-                            "ffplay",
-                            "-nodisp",
-                            "-autoexit",
-                            "-loglevel",
-                            "error",
-                            str(temp),
-                        ],
-                        check=True,
-                    )
-                except FileNotFoundError:
-                    messagebox.showinfo(
-                        "情報",
-                        "ffplay が見つからないため、プレビュー再生ができませんでした。",
-                    )
-                    return
-                except subprocess.CalledProcessError:
-                    # 再生に失敗しても次は試さず終了
-                    messagebox.showerror("エラー", "プレビュー再生中にエラーが発生しました。")
-                    return
-    except Exception as e:  # 想定外のエラー
-        messagebox.showerror("エラー", f"プレビュー再生中に予期せぬエラーが発生しました:\n{e}")
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError as e:
+        raise PreviewError("ffmpeg が見つからないため、プレビュー再生ができませんでした。") from e
+
+    # stderr のパイプが詰まらないよう別スレッドで読み出しておく
+    stderr_chunks: List[bytes] = []
+    reader = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)
+    reader.start()
+
+    channel = pygame.mixer.find_channel(True)
+    fed_bytes = 0
+    try:
+        with job.attach(proc):
+            block = _read_block(proc.stdout, int(FIRST_CHUNK_SECONDS * sample_rate) * frame_bytes, frame_bytes)
+            chunk_bytes = int(CHUNK_SECONDS * sample_rate) * frame_bytes
+            while block:
+                sound = pygame.mixer.Sound(buffer=block)
+                # キューは 1 つしか持てないので、前のブロックが再生され始めるまで待つ
+                while channel.get_queue() is not None:
+                    job.check_cancelled()
+                    time.sleep(CHUNK_SECONDS / 5)
+                job.check_cancelled()
+                if channel.get_busy():
+                    channel.queue(sound)
+                else:
+                    channel.play(sound)
+                fed_bytes += len(block)
+                played = max(0.0, fed_bytes / bytes_per_second - CHUNK_SECONDS)
+                job.report(min(played / total, 1.0) if total else None, "プレビュー再生中")
+                block = _read_block(proc.stdout, chunk_bytes, frame_bytes)
+
+            proc.wait()
+            reader.join()
+            if proc.returncode != 0:
+                job.check_cancelled()
+                stderr = b"".join(stderr_chunks).decode("utf-8", errors="replace").strip()
+                raise PreviewError(f"プレビュー用のデコードに失敗しました:\n{stderr[-500:]}")
+
+            # 最後のブロックが鳴り終わるまで待つ
+            while channel.get_busy():
+                job.check_cancelled()
+                time.sleep(0.05)
+            job.report(1.0, "プレビュー再生中")
+    finally:
+        if job.cancelled:
+            channel.stop()
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
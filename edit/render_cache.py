@@ -0,0 +1,211 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from edit.segments import Segment
+
+
+logger = logging.getLogger(__name__)
+
+# 書き出し結果のキャッシュ
+# - キーは「元ファイルの同一性（パス・サイズ・更新時刻）+ 切り出し範囲 + 書き出し設定」のハッシュ
+# - 同じ選択範囲を何度もプレビュー・保存・変換しても ffmpeg を再実行しない
+# - 書き出し全体に加えて、スマートカットの境界の再エンコード結果も個別に入れるので、
+#   一部のセグメントだけ変えた場合も変わっていない継ぎ目は作り直さない
+# - ディスク容量の上限を超えたら、最後に使ったのが古いものから消す（更新時刻を使用時刻として扱う）
+#   読んでいる途中のものは消さない（pin() の間は削除の対象から外す）
+
+CACHE_DIR = Path(__file__).resolve().parent.parent / ".cache" / "renders"
+CACHE_VERSION = 1
+DEFAULT_BUDGET_BYTES = 512 * 1024 * 1024
+
+
+def source_identity(path) -> List:
+    """元ファイルの同一性。内容が変わればサイズか更新時刻が変わる前提"""
+    path = Path(path)
+    st = path.stat()
+    return [str(path.resolve()), st.st_size, st.st_mtime_ns]
+
+
+def cache_key(kind: str, *parts) -> str:
+    """JSON にできる値からキャッシュキーを作る"""
+    raw = json.dumps([CACHE_VERSION, kind, *parts], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def segments_key(segments: Sequence[Segment], *options) -> Optional[str]:
+    """
+    セグメント列と書き出し設定のキャッシュキー。
+    元ファイルが読めない場合は None（キャッシュを使わない）。
+    """
+    try:
+        items = [[*source_identity(src), round(start, 6), round(duration, 6)] for src, start, duration in segments]
+    except OSError:
+        return None
+    return cache_key("segments", items, list(options))
+
+
+class RenderCache:
+    """
+    キーごとに 1 ファイルを置くディスクキャッシュ。
+    ファイルの更新時刻を最終使用時刻として LRU で削除する（pin() 中のものは消さない）。スレッドセーフ。
+    """
+
+    def __init__(self, directory: Path = CACHE_DIR, budget_bytes: int = DEFAULT_BUDGET_BYTES):
+        self.directory = Path(directory)
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self._total: Optional[int] = None  # 使用量（最初に必要になったときに数える）
+        self._pins: Dict[str, int] = {}  # 使用中のファイルのパス → pin() の数
+
+    def _path(self, key: str, suffix: str) -> Path:
+        return self.directory / f"{key}{suffix}"
+
+    @contextmanager
+    def pin(self, key: Optional[str], suffix: str) -> Iterator[Optional[Path]]:
+        """
+        キャッシュ済みなら、そのファイルの Path を渡す（無ければ None）。使用時刻を更新し、
+        with を抜けるまでは容量の上限を超えても消さない（同じキーへの store は同じ内容で置き換わる）。
+        """
+        path = self._acquire(key, suffix)
+        try:
+            yield path
+        finally:
+            if path is not None:
+                self._release(path)
+
+    def _acquire(self, key: Optional[str], suffix: str) -> Optional[Path]:
+        if key is None:
+            return None
+        path = self._path(key, suffix)
+        with self._lock:
+            try:
+                os.utime(path)
+            except OSError:
+                return None
+            self._pins[str(path)] = self._pins.get(str(path), 0) + 1
+        return path
+
+    def _release(self, path: Path) -> None:
+        with self._lock:
+            count = self._pins.pop(str(path)) - 1
+            if count:
+                self._pins[str(path)] = count
+
+    def store_file(self, key: Optional[str], src: Path, suffix: str) -> None:
+        """src のコピーをキャッシュに入れる（失敗してもキャッシュしないだけ）"""
+        if key is None:
+            return
+        self._store(key, suffix, lambda tmp: shutil.copyfile(src, tmp))
+
+    def get_bytes(self, key: Optional[str], suffix: str = ".bin") -> Optional[bytes]:
+        with self.pin(key, suffix) as path:
+            if path is None:
+                return None
+            try:
+                return path.read_bytes()
+            except OSError:
+                return None
+
+    def put_bytes(self, key: Optional[str], data: bytes, suffix: str = ".bin") -> None:
+        if key is None:
+            return
+        self._store(key, suffix, lambda tmp: tmp.write_bytes(data))
+
+    def copy_to(self, key: Optional[str], suffix: str, dst: Path) -> bool:
+        """キャッシュ済みなら dst にコピーして True を返す"""
+        with self.pin(key, suffix) as path:
+            if path is None:
+                return False
+            try:
+                shutil.copyfile(path, dst)
+            except OSError:
+                return False
+        return True
+
+    def _store(self, key: str, suffix: str, write) -> None:
+        tmp = self.directory / f".{key}.{uuid.uuid4().hex}.tmp"
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            write(tmp)
+            added = tmp.stat().st_size
+            with self._lock:
+                path = self._path(key, suffix)
+                try:
+                    added -= path.stat().st_size
+                except OSError:
+                    pass
+                os.replace(tmp, path)
+                if self._total is None:
+                    self._total = self.size_bytes()
+                else:
+                    self._total += added
+                if self._total > self.budget_bytes:
+                    self._evict()
+        except OSError:
+            logger.warning("failed to write render cache: %s", key, exc_info=True)
+            tmp.unlink(missing_ok=True)
+
+    def _entries(self) -> Iterable[os.DirEntry]:
+        try:
+            with os.scandir(self.directory) as it:
+                return [e for e in it if e.is_file() and not e.name.startswith(".")]
+        except OSError:
+            return []
+
+    def _evict(self) -> None:
+        """容量の上限を超えていれば、使われていない順に消す（pin() 中のものは残す。ロックを持って呼ぶ）"""
+        entries = []
+        total = 0
+        for entry in self._entries():
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            total += st.st_size
+            if entry.path not in self._pins:
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= self.budget_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+        self._total = total
+
+    def size_bytes(self) -> int:
+        total = 0
+        for entry in self._entries():
+            try:
+                total += entry.stat().st_size
+            except OSError:
+                pass
+        return total
+
+    def clear(self) -> None:
+        with self._lock:
+            for entry in self._entries():
+                if entry.path in self._pins:
+                    continue
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+            self._total = None
+
+
+_default_cache = RenderCache()
+
+
+def default_cache() -> RenderCache:
+    return _default_cache
@@ -0,0 +1,221 @@
+import logging
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+from edit.render_cache import default_cache, segments_key
+from edit.segments import Segment
+from edit.smart_cut import SmartCutError, SmartCutUnsupported, all_codec_args, smart_cut
+
+
+logger = logging.getLogger(__name__)
+
+# 書き出しモード
+# - "copy"  : concat demuxer の inpoint/outpoint で切り出し、再エンコードせずに連結する
+# - "filter": 全セグメントを入力にして concat フィルタで連結し、1 回だけエンコードする
+# - "smart" : 内側のフレームはコピーし、境界だけ再エンコードする（サンプル単位で正確）
+# - "auto"  : 入出力がすべて mp3 なら smart（できない形式なら filter）、それ以外（mp4 など）は filter
+EXPORT_MODES = ("auto", "copy", "filter", "smart")
+
+# filter モードで使うエンコード設定（mp4→mp3 変換と同じ 192kbps）
+DEFAULT_CODEC_ARGS = ["-c:a", "libmp3lame", "-b:a", "192k"]
+DEFAULT_SAMPLE_RATE = 44100
+# copy モードのコーデック指定（再エンコードしない）
+COPY_CODEC_ARGS = ["-c", "copy"]
+
+
+class ExportError(Exception):
+    """セグメントの書き出しに失敗したときの例外"""
+
+
+def _quote_concat_path(path: Path) -> str:
+    """concat リスト用にパスをシングルクォートで囲む（' は '\\'' にエスケープ）"""
+    return "'" + path.resolve().as_posix().replace("'", "'\\''") + "'"
+
+
+def build_concat_list(segments: Sequence[Segment]) -> str:
+    """
+    concat demuxer 用のリストを作る。
+    各セグメントを inpoint/outpoint で指定するので、事前の切り出しは不要。
+    """
+    lines = []
+    for src, start, duration in segments:
+        lines.append(f"file {_quote_concat_path(Path(src))}")
+        lines.append(f"inpoint {start:.6f}")
+        lines.append(f"outpoint {start + duration:.6f}")
+    return "\n".join(lines) + "\n"
+
+
+def build_copy_command(list_file: Path, out_path: Path) -> List[str]:
+    """concat demuxer でストリームコピーするコマンド"""
+    return [
+        "ffmpeg",
+        "-y",
+        "-f",
+        "concat",
+        "-safe",
+        "0",
+        "-i",
+        str(list_file),
+        *COPY_CODEC_ARGS,
+        str(out_path),
+    ]
+
+
+def build_filter_command(
+    segments: Sequence[Segment],
+    out_path: Path,
+    codec_args: Sequence[str] = DEFAULT_CODEC_ARGS,
+    sample_rate: int = DEFAULT_SAMPLE_RATE,
+) -> List[str]:
+    """
+    全セグメントを 1 回の ffmpeg で切り出し・連結するコマンドを作る。
+    各入力は -ss/-t で必要な範囲だけデコードし、atrim で長さを確定させてから concat する。
+    入力ごとにサンプリング周波数・チャンネルが違っても連結できるよう aformat で揃える。
+    """
+    cmd = ["ffmpeg", "-y"]
+    for src, start, duration in segments:
+        cmd += ["-ss", f"{start:.6f}", "-t", f"{duration:.6f}", "-i", str(src)]
+
+    chains = []
+    labels = []
+    for i, (_src, _start, duration) in enumerate(segments):
+        chains.append(
+            f"[{i}:a]atrim=duration={duration:.6f},asetpts=PTS-STARTPTS,"
+            f"aformat=sample_rates={sample_rate}:channel_layouts=stereo[a{i}]"
+        )
+        labels.append(f"[a{i}]")
+    graph = ";".join(chains) + ";" + "".join(labels) + f"concat=n={len(segments)}:v=0:a=1[out]"
+
+    cmd += ["-filter_complex", graph, "-map", "[out]", *codec_args, str(out_path)]
+    return cmd
+
+
+def _run_ffmpeg(cmd: List[str], job=None, total_seconds: Optional[float] = None) -> None:
+    try:
+        if job is not None:
+            job.run_ffmpeg(cmd, total_seconds, "書き出し中")
+        else:
+            subprocess.run(cmd, check=True, capture_output=True)
+    except FileNotFoundError as exc:
+        raise ExportError("ffmpeg が見つかりません。ffmpeg をインストールしてください。") from exc
+    except subprocess.CalledProcessError as exc:
+        stderr = exc.stderr or ""
+        if isinstance(stderr, bytes):
+            stderr = stderr.decode("utf-8", errors="replace")
+        stderr = stderr.strip()
+        logger.error("ffmpeg failed: %s\n%s", " ".join(cmd), stderr)
+        raise ExportError(f"書き出し処理に失敗しました:\n{stderr[-500:]}") from exc
+
+
+def choose_mode(segments: Sequence[Segment], out_path: Path) -> str:
+    """auto モードで使う実際のモードを決める"""
+    return _auto_mode(segments, out_path.suffix.lower())
+
+
+def _auto_mode(segments: Sequence[Segment], suffix: str) -> str:
+    suffixes = {Path(src).suffix.lower() for src, _start, _duration in segments}
+    if suffixes == {".mp3"} and suffix == ".mp3":
+        return "smart"
+    return "filter"
+
+
+def export_key(segments: Sequence[Segment], suffix: str, mode: str = "auto") -> Optional[str]:
+    """
+    書き出し結果のキャッシュキー。モード名ではなく、実際に ffmpeg に渡すコーデック・ビットレートの引数を入れる
+    （設定を変えれば古い結果は使われない）。auto で smart になる場合は、できなかったときの filter の設定も入れる。
+    """
+    resolved = _auto_mode(segments, suffix) if mode == "auto" else mode
+    settings = []
+    if resolved == "smart":
+        settings.append(["smart", all_codec_args()])
+    if resolved == "filter" or (resolved == "smart" and mode == "auto"):
+        settings.append(["filter", DEFAULT_CODEC_ARGS, DEFAULT_SAMPLE_RATE])
+    if resolved == "copy":
+        settings.append(["copy", COPY_CODEC_ARGS])
+    return segments_key(segments, "export", suffix, settings)
+
+
+def export_segments(
+    segments: Iterable[Segment], out_path: Path, mode: str = "auto", job=None, use_cache: bool = True
+) -> Path:
+    """
+    セグメント群を 1 回の ffmpeg 実行で out_path に書き出す。
+    中間の切り出しファイルは作らない。
+    失敗時は ExportError を送出する。
+    job: edit.job_runner.Job を渡すと進捗通知・キャンセルに対応する
+    use_cache: 同じセグメント列・設定の書き出し結果を edit.render_cache から再利用する
+    """
+    segments = list(segments)
+    if not segments:
+        raise ExportError("書き出す切り取り範囲がありません。")
+    if mode not in EXPORT_MODES:
+        raise ValueError(f"unknown export mode: {mode}")
+
+    suffix = out_path.suffix.lower()
+    key = export_key(segments, suffix, mode) if use_cache else None
+    if key is not None and default_cache().copy_to(key, suffix, out_path):
+        logger.info("export cache hit: %s", out_path)
+        if job is not None:
+            job.report(1.0, "書き出し中")
+        return out_path
+
+    _export(segments, out_path, mode, job, use_cache)
+    if key is not None:
+        default_cache().store_file(key, out_path, suffix)
+    return out_path
+
+
+@contextmanager
+def cached_export(
+    segments: Sequence[Segment], suffix: str = ".mp3", mode: str = "auto", job=None, render: bool = False
+) -> Iterator[Optional[Path]]:
+    """
+    同じセグメント列を書き出した結果がキャッシュにあれば、そのファイルの Path を渡す（読み取り専用。無ければ None）。
+    with の間はキャッシュから消されない。
+    render=True なら、無いときはその場で書き出してキャッシュに入れてから渡す（書き出せなければ None）。
+    job: 書き出しの進捗通知・キャンセル用
+    """
+    segments = list(segments)
+    key = export_key(segments, suffix, mode)
+    with default_cache().pin(key, suffix) as path:
+        if path is not None or not render or key is None:
+            yield path
+            return
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            export_segments(segments, Path(tmpdir) / f"render{suffix}", mode, job)
+    except ExportError:
+        logger.warning("render for cache failed", exc_info=True)
+    with default_cache().pin(key, suffix) as path:
+        yield path
+
+
+def _export(segments: List[Segment], out_path: Path, mode: str, job, use_cache: bool) -> None:
+    requested = mode
+    if mode == "auto":
+        mode = choose_mode(segments, out_path)
+    total = sum(duration for _src, _start, duration in segments)
+
+    if mode == "smart":
+        try:
+            smart_cut(segments, out_path, job=job, use_cache=use_cache)
+            return
+        except SmartCutUnsupported as exc:
+            if requested != "auto":
+                raise ExportError(f"スマートカットできない入力です:\n{exc}") from exc
+            logger.info("smart cut unavailable, falling back to filter mode: %s", exc)
+            mode = "filter"
+        except SmartCutError as exc:
+            raise ExportError(str(exc)) from exc
+
+    if mode == "filter":
+        _run_ffmpeg(build_filter_command(segments, out_path), job, total)
+        return
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        list_file = Path(tmpdir) / "concat_list.txt"
+        list_file.write_text(build_concat_list(segments), encoding="utf-8")
+        _run_ffmpeg(build_copy_command(list_file, out_path), job, total)
@@ -0,0 +1,6 @@
+from pathlib import Path
+from typing import Tuple
+
+# 切り取り範囲: (元ファイル Path, 開始秒, 長さ秒)
+# 切り出し・連結は edit.segment_exporter が 1 回の ffmpeg（またはスマートカット）で行う
+Segment = Tuple[Path, float, float]
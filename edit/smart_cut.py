@@ -0,0 +1,778 @@
+import hashlib
+import io
+import itertools
+import logging
+import math
+import os
+import struct
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+from misc.library_index import get_seek_index
+from misc.mp3_header import (
+    DECODER_DELAY,
+    FrameHeader,
+    iter_frame_heads,
+    iter_frames,
+    parse_frame_header,
+    read_info_tag,
+    side_info_length,
+)
+from misc.seek_index import SeekIndex
+from edit.job_runner import JobCancelled
+from edit.render_cache import cache_key, default_cache, source_identity
+from edit.segments import Segment
+
+
+logger = logging.getLogger(__name__)
+
+# スマートカットの考え方
+# - 区間の内側のフレームは元ファイルのバイト列をそのままコピーする
+# - 区間の境目（とセグメント同士のつなぎ目）だけを、ビットリザーバを使わない設定で再エンコードする
+# - コピーするフレームが前のフレームのリザーバ（main_data_begin）を参照している場合は、
+#   その分のバイトを直前の再エンコードフレームの空き領域に書き戻す
+# - 先頭・末尾の端数は LAME タグのエンコーダ遅延・パディングで表し、再生時に捨てさせる
+
+# libmp3lame のエンコーダ遅延 + デコーダ遅延（エンコード結果の Info タグで確認する）
+DEFAULT_CODEC_DELAY = 576 + DECODER_DELAY
+# これより短いコピー区間は作らずに再エンコードにまとめる（フレーム数）
+MIN_COPY_FRAMES = 4
+# リザーバを書き戻す空きが足りないとき、コピー開始を後ろにずらして試す回数
+MAX_SPLICE_RETRIES = 4
+# 再エンコードの前後に付ける文脈（フレーム数）。MDCT の重なりをつなぎ目で合わせるのに使う
+POST_CONTEXT_FRAMES = 2
+# 切り出し前の粗いシークで手前に取る余裕（秒）。シーク直後のフレームはリザーバ不足で壊れるため
+SEEK_PREROLL_SECONDS = 1.0
+# 再エンコードを同時に走らせる ffmpeg の数（ffmpeg 自体も複数スレッドを使うので CPU 数より控えめにする）
+DEFAULT_MAX_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+# リザーバを置く空きが足りないとき、最後のフレームを作り直すビットレート（高い順に試す）
+# 128k のフレームを 320k の大きさに広げればリザーバの上限 511 バイトは必ず収まる
+FALLBACK_BIT_RATES = ("224k", "192k", "160k", "128k")
+FALLBACK_BIT_RATES_MPEG2 = ("112k", "96k", "80k", "64k")
+# 境界の再エンコードのビットレート（MPEG1 / MPEG2・2.5）
+BIT_RATE = "320k"
+BIT_RATE_MPEG2 = "160k"
+
+# 境界の付近で読む、各フレームの先頭のバイト数（ヘッダ 4 + CRC 2 + main_data_begin 2）
+_FRAME_HEAD_BYTES = 8
+# リザーバ（最大 511 バイト）を調べるのに境界の前後で見るフレーム数。
+# レイヤー 3 で一番小さいフレームでもメインデータ領域は 27 バイトあるので、これだけ見れば足りる
+_RESERVOIR_FRAMES = 32
+# コピー区間を元ファイルから書き写すときに 1 回に読む量
+_COPY_CHUNK_BYTES = 1024 * 1024
+
+
+class SmartCutError(Exception):
+    """スマートカットの再エンコードに失敗したときの例外"""
+
+
+class SmartCutUnsupported(SmartCutError):
+    """入力がスマートカットできない形式のときの例外（呼び出し側で通常の書き出しに切り替える）"""
+
+
+class FrameIndex:
+    """
+    MP3 ファイル内の音声フレームの情報（Xing/Info フレームは含まない）。
+    フレームの位置は misc.seek_index のシーク表から引き、リザーバの計算に要るフレームごとの
+    大きさ・main_data_begin は、コピー区間の境界の付近だけファイルから読む。
+    """
+
+    def __init__(self, seek: SeekIndex, first: FrameHeader):
+        self.seek = seek
+        self.path = seek.path
+        self.mpeg1 = first.mpeg1
+        self.sample_rate = seek.sample_rate
+        self.channels = first.channels
+        self.samples_per_frame = seek.samples_per_frame
+        # デコーダが先頭で捨てるサンプル数（LAME タグがあれば遅延 + DECODER_DELAY）
+        self.start_skip = seek.start_skip
+        self.total_samples = seek.total_samples
+
+    def __len__(self) -> int:
+        return self.seek.frame_count
+
+    def frame_start(self, i: int) -> int:
+        """i 番目のフレームのデコード結果の先頭が、元音声の何サンプル目に当たるか"""
+        return i * self.samples_per_frame - self.start_skip
+
+    def first_frame_from(self, sample: int) -> int:
+        """先頭が sample 以降にある最初のフレーム番号"""
+        return -((-(sample + self.start_skip)) // self.samples_per_frame)
+
+    def last_frame_until(self, sample: int) -> int:
+        """末尾が sample 以前にあるフレームの数（= コピー区間の終端フレーム番号）"""
+        return min((sample + self.start_skip) // self.samples_per_frame, len(self))
+
+    def _heads(self, start: int, count: int) -> List[Tuple[int, FrameHeader, bytes]]:
+        """start 番目から最大 count 個のフレームを (位置, ヘッダ, 先頭のバイト列) で読む"""
+        with open(self.path, "rb") as f:
+            heads = iter_frame_heads(
+                f, self.seek.frame_offset(start), self.seek.audio_end, _FRAME_HEAD_BYTES, count * _FRAME_HEAD_BYTES
+            )
+            return list(itertools.islice(heads, count))
+
+    def read_frames(self, start: int, end: int) -> bytes:
+        """[start, end) 番目のフレームのバイト列"""
+        if start >= end:
+            return b""
+        begin = self.seek.frame_offset(start)
+        with open(self.path, "rb") as f:
+            f.seek(begin)
+            return f.read(self.seek.frame_offset(end) - begin)
+
+    def copy_frames(self, start: int, end: int, out) -> None:
+        """[start, end) 番目のフレームを、メモリに溜めずに out へ書き写す"""
+        begin = self.seek.frame_offset(start)
+        remaining = self.seek.frame_offset(end) - begin
+        with open(self.path, "rb") as f:
+            f.seek(begin)
+            while remaining > 0:
+                chunk = f.read(min(remaining, _COPY_CHUNK_BYTES))
+                if not chunk:
+                    raise SmartCutError(f"コピー中にファイルが短くなりました: {self.path}")
+                out.write(chunk)
+                remaining -= len(chunk)
+
+    def main_data_before(self, frame: int, length: int) -> bytes:
+        """frame 番目のフレームより前のメインデータ領域から、末尾 length バイトを集める"""
+        first = max(frame - _RESERVOIR_FRAMES, 0)
+        heads = self._heads(first, frame - first)
+        chunks = []
+        remaining = length
+        with open(self.path, "rb") as f:
+            for offset, header, _head in reversed(heads):
+                if remaining <= 0:
+                    break
+                payload = header.frame_length - _payload_offset(header)
+                take = min(payload, remaining)
+                f.seek(offset + header.frame_length - take)
+                chunks.append(f.read(take))
+                remaining -= take
+        if remaining > 0:
+            raise SmartCutUnsupported("リザーバの参照先がファイルの先頭より前にあります")
+        return b"".join(reversed(chunks))
+
+    def reservoir_needed(self, frame: int) -> int:
+        """
+        frame 番目からコピーするとき、直前に用意しておく必要があるメインデータのバイト数。
+        main_data_begin は最大 511 バイトなので、2 つ目以降のフレームも前まで届くことがある。
+        """
+        needed = 0
+        available = 0
+        if frame >= len(self):
+            return 0
+        for _offset, header, head in self._heads(frame, _RESERVOIR_FRAMES):
+            if available >= 511:
+                break
+            needed = max(needed, _main_data_begin(head, header) - available)
+            available += header.frame_length - _payload_offset(header)
+        return needed
+
+
+def _payload_offset(header: FrameHeader) -> int:
+    """フレーム先頭からメインデータ領域までのバイト数"""
+    return (6 if header.has_crc else 4) + side_info_length(header)
+
+
+def _main_data_begin(frame: bytes, header: FrameHeader) -> int:
+    pos = 6 if header.has_crc else 4
+    if header.mpeg1:
+        return (frame[pos] << 1) | (frame[pos + 1] >> 7)
+    return frame[pos]
+
+
+def _main_data_used(frame: bytes, header: FrameHeader) -> int:
+    """サイドインフォの part2_3_length の合計から、このフレームのメインデータのバイト数を求める"""
+    pos = 6 if header.has_crc else 4
+    side = int.from_bytes(frame[pos:pos + side_info_length(header)], "big")
+    nbits = side_info_length(header) * 8
+    nch = header.channels
+    if header.mpeg1:
+        # main_data_begin 9bit, private 5/3bit, scfsi 4bit x ch、その後 granule x ch ごとに 59bit
+        base = 9 + (5 if nch == 1 else 3) + 4 * nch
+        granules, gr_bits = 2, 59
+    else:
+        # main_data_begin 8bit, private 1/2bit、その後 ch ごとに 63bit（granule は 1 つ）
+        base = 8 + (1 if nch == 1 else 2)
+        granules, gr_bits = 1, 63
+    total = 0
+    for gr in range(granules):
+        for ch in range(nch):
+            bit = base + (gr * nch + ch) * gr_bits
+            total += (side >> (nbits - bit - 12)) & 0xFFF
+    return (total + 7) // 8
+
+
+def _scan_frames(data: bytes, pos: int):
+    """メモリ上の MP3 の pos から連続するフレームを (オフセット, ヘッダ) で返す"""
+    return iter_frames(io.BytesIO(data), pos, len(data))
+
+
+def get_frame_index(path) -> FrameIndex:
+    """
+    path のフレーム情報を返す。シーク表は misc.library_index.get_seek_index のもの
+    （ライブラリのファイルならインデックスに保存済み。無ければ作ってキャッシュする）を使う。
+    """
+    seek = get_seek_index(path)
+    if seek is None:
+        raise SmartCutUnsupported(f"MP3 フレームが見つかりません: {path}")
+    with open(seek.path, "rb") as f:
+        f.seek(seek.frame_offset(0))
+        first = parse_frame_header(f.read(4))
+    if first is None or first.layer != 3:
+        raise SmartCutUnsupported(f"MPEG レイヤー 3 ではありません: {path}")
+    return FrameIndex(seek, first)
+
+
+# ===== 書き出し計画 =====
+
+# 元音声の範囲 (インデックス, 開始サンプル, 終了サンプル)。開始が負・終了が末尾より後の部分は無音になる
+Range = Tuple[FrameIndex, int, int]
+
+
+@dataclass
+class EncodePiece:
+    """再エンコードする部分。ranges を連結した音声がちょうど frames フレーム分になる"""
+
+    ranges: List[Range]
+    frames: int
+    # 前後の文脈（エンコーダの助走と MDCT の重なりを合わせるため。出力には含めない）
+    before: List[Range] = field(default_factory=list)
+    after: List[Range] = field(default_factory=list)
+    # 直後のコピー区間の先頭フレームが参照するリザーバのバイト列
+    reservoir: bytes = b""
+    data: bytes = b""
+
+
+@dataclass
+class CopyPiece:
+    """元ファイルからそのままコピーするフレーム [start, end)"""
+
+    index: FrameIndex
+    start: int
+    end: int
+    segment: int  # 何番目のセグメントのコピー区間か
+
+
+@dataclass
+class CutPlan:
+    pieces: list
+    encoder_delay: int  # LAME タグに書く値
+    encoder_padding: int
+    total_samples: int
+
+    @property
+    def copied_frames(self) -> int:
+        return sum(p.end - p.start for p in self.pieces if isinstance(p, CopyPiece))
+
+    @property
+    def encoded_frames(self) -> int:
+        return sum(p.frames for p in self.pieces if isinstance(p, EncodePiece))
+
+
+def _length(ranges: Sequence[Range]) -> int:
+    return sum(end - start for _idx, start, end in ranges)
+
+
+def _split_tail(ranges: Sequence[Range], n: int) -> Tuple[List[Range], List[Range]]:
+    """ranges を、末尾 n サンプル分とそれより前に分ける"""
+    head = list(ranges)
+    tail: List[Range] = []
+    while n > 0 and head:
+        idx, start, end = head.pop()
+        if end - start > n:
+            head.append((idx, start, end - n))
+            tail.insert(0, (idx, end - n, end))
+            break
+        tail.insert(0, (idx, start, end))
+        n -= end - start
+    return head, tail
+
+
+def _sample_range(segment: Segment, index: FrameIndex) -> Tuple[int, int]:
+    _src, start, duration = segment
+    a = max(0, round(start * index.sample_rate))
+    b = min(index.total_samples, round((start + duration) * index.sample_rate))
+    return a, max(a, b)
+
+
+def plan_smart_cut(segments: Sequence[Segment], indexes: Sequence[FrameIndex], skip=None) -> CutPlan:
+    """
+    どのフレームをコピーし、どこを再エンコードするかを決める。
+    出力の (デコード後の) サンプル位置がフレーム境界に一致するコピー区間だけを採用する。
+    skip: {セグメント番号: コピー開始を何フレーム後ろにずらすか}（リザーバの空き不足時の再計画用）
+    """
+    skip = skip or {}
+    spf = indexes[0].samples_per_frame
+    ranges = [_sample_range(seg, idx) for seg, idx in zip(segments, indexes)]
+
+    # 各セグメントについて、コピー区間が出力のフレーム境界に揃うための「先頭の捨てサンプル数」の剰余
+    # （全セグメントで共通の値なので、コピーできるサンプルが最も多くなる剰余を選ぶ）
+    candidates = {}
+    offset = 0
+    for i, ((a, b), idx) in enumerate(zip(ranges, indexes)):
+        j = idx.first_frame_from(a) + skip.get(i, 0)
+        k = idx.last_frame_until(b)
+        if k - j >= MIN_COPY_FRAMES:
+            residue = -(offset + idx.frame_start(j) - a) % spf
+            candidates[residue] = candidates.get(residue, 0) + (k - j)
+        offset += b - a
+    residue = max(candidates, key=candidates.get) if candidates else 0
+    lead = DECODER_DELAY + (residue - DECODER_DELAY) % spf
+
+    pieces: list = []
+    first_idx, (first_a, _b) = indexes[0], ranges[0]
+    run: List[Range] = [(first_idx, first_a - lead, first_a)]
+    run_before: List[Range] = [(first_idx, first_a - lead - _context_samples(spf), first_a - lead)]
+    position = lead  # 出力のデコード後のサンプル位置
+
+    def flush_run(after: Range):
+        length = _length(run)
+        pieces.append(EncodePiece(ranges=list(run), frames=-(-length // spf), before=run_before, after=[after]))
+
+    for i, ((a, b), idx) in enumerate(zip(ranges, indexes)):
+        if i > 0:
+            run.append((idx, a, a))
+        j = idx.first_frame_from(a) + skip.get(i, 0)
+        k = idx.last_frame_until(b)
+        j_start = idx.frame_start(j)
+        aligned = (position + j_start - a) % spf == 0
+        run_length = _length(run) + (j_start - a)
+        if aligned and k - j >= MIN_COPY_FRAMES and run_length > 0:
+            run[-1] = (idx, run[-1][1], j_start)
+            flush_run(after=(idx, j_start, j_start + POST_CONTEXT_FRAMES * spf))
+            pieces.append(CopyPiece(idx, j, k, i))
+            k_start = idx.frame_start(k)
+            run_before = [(idx, k_start - _context_samples(spf), k_start)]
+            run = [(idx, k_start, b)]
+        else:
+            run[-1] = (idx, run[-1][1], b)
+        position += b - a
+
+    # 末尾の再エンコード区間（フレーム単位に切り上げた分はパディングとして捨てさせる）
+    last_idx, (_a, last_b) = indexes[-1], ranges[-1]
+    run_length = _length(run)
+    if run_length > 0 or not pieces or isinstance(pieces[-1], EncodePiece):
+        flush_run(after=(last_idx, last_b, last_b + POST_CONTEXT_FRAMES * spf))
+        tail = pieces[-1].frames * spf - run_length
+        # 末尾の端数は無音ではなく元の続きの音声で埋める
+        last = pieces[-1].ranges[-1]
+        pieces[-1].ranges[-1] = (last[0], last[1], last[2] + tail)
+        pieces[-1].after = [(last_idx, last_b + tail, last_b + tail + POST_CONTEXT_FRAMES * spf)]
+    else:
+        tail = 0
+
+    total = sum(b - a for a, b in ranges)
+    return CutPlan(
+        pieces=pieces,
+        encoder_delay=lead - DECODER_DELAY,
+        encoder_padding=tail + DECODER_DELAY,
+        total_samples=total,
+    )
+
+
+def _context_samples(spf: int) -> int:
+    """
+    再エンコード区間の前に付ける文脈の長さ。
+    エンコーダ遅延分の助走フレームを捨てたうえで、さらに 1 フレーム分の実音声を前に置き、
+    残すフレームの MDCT 窓がすべて本物の音声にかかるようにする。
+    """
+    frames = -(-DEFAULT_CODEC_DELAY // spf) + 1
+    return frames * spf - DEFAULT_CODEC_DELAY
+
+
+# ===== 再エンコード =====
+
+
+def _seek_quantum(sample_rate: int) -> int:
+    """-ss をマイクロ秒で正確に表せるサンプル数の単位"""
+    return sample_rate // math.gcd(sample_rate, 1_000_000)
+
+
+def _range_input(rng: Range, n: int) -> Tuple[List[str], str]:
+    """1 つの範囲を ffmpeg の入力とフィルタに変換する"""
+    idx, start, end = rng
+    sr = idx.sample_rate
+    length = end - start
+    layout = "mono" if idx.channels == 1 else "stereo"
+    if end <= 0:
+        return (
+            ["-f", "lavfi", "-i", f"anullsrc=r={sr}:cl={layout}"],
+            f"[{n}:a]atrim=end_sample={length},asetpts=N/SR/TB[p{n}]",
+        )
+
+    silence = max(0, -start)
+    start = max(0, start)
+    q = _seek_quantum(sr)
+    coarse = max(0, start - int(SEEK_PREROLL_SECONDS * sr)) // q * q
+    args = ["-ss", f"{coarse * 1_000_000 // sr}us", "-i", idx.path] if coarse else ["-i", idx.path]
+    chain = f"[{n}:a]atrim=start_sample={start - coarse}:end_sample={end - coarse},asetpts=N/SR/TB"
+    if silence:
+        chain += f",adelay=delays={silence}S:all=1"
+    # ファイル末尾を越える部分は無音で埋めて、長さをちょうどにする
+    chain += f",apad=whole_len={length},aformat=channel_layouts={layout}[p{n}]"
+    return args, chain
+
+
+def _encode_command(piece: EncodePiece, out_path: Path, bit_rate: str) -> List[str]:
+    idx = piece.ranges[0][0]
+    ranges = [*piece.before, *piece.ranges, *piece.after]
+    cmd = ["ffmpeg", "-y", "-nostdin", "-loglevel", "error"]
+    chains = []
+    for n, rng in enumerate(ranges):
+        args, chain = _range_input(rng, n)
+        cmd += args
+        chains.append(chain)
+    labels = "".join(f"[p{n}]" for n in range(len(ranges)))
+    graph = ";".join(chains) + f";{labels}concat=n={len(ranges)}:v=0:a=1[out]"
+    cmd += [
+        "-filter_complex", graph, "-map", "[out]",
+        *codec_args(bit_rate),
+        "-ar", str(idx.sample_rate), "-ac", str(idx.channels),
+        "-id3v2_version", "0", "-write_xing", "1", "-f", "mp3", str(out_path),
+    ]
+    return cmd
+
+
+def codec_args(bit_rate: str) -> List[str]:
+    """境界の再エンコードに使うエンコーダの引数（リザーバを使わないフレームにする）"""
+    return ["-c:a", "libmp3lame", "-b:a", bit_rate, "-reservoir", "0"]
+
+
+def all_codec_args() -> List[List[str]]:
+    """スマートカットが使いうるエンコーダの引数すべて（書き出し結果のキャッシュキー用）"""
+    bit_rates = (BIT_RATE, *FALLBACK_BIT_RATES, BIT_RATE_MPEG2, *FALLBACK_BIT_RATES_MPEG2)
+    return [codec_args(bit_rate) for bit_rate in bit_rates]
+
+
+def _run(cmd: List[str], cancel_event: Optional[threading.Event]) -> None:
+    try:
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    except FileNotFoundError as exc:
+        raise SmartCutError("ffmpeg が見つかりません。ffmpeg をインストールしてください。") from exc
+    while True:
+        try:
+            _out, err = proc.communicate(timeout=0.1)
+            break
+        except subprocess.TimeoutExpired:
+            if cancel_event is not None and cancel_event.is_set():
+                proc.kill()
+                proc.communicate()
+                raise JobCancelled()
+    if proc.returncode != 0:
+        message = err.decode("utf-8", errors="replace").strip()
+        logger.error("ffmpeg failed: %s\n%s", " ".join(cmd), message)
+        raise SmartCutError(f"境界の再エンコードに失敗しました:\n{message[-500:]}")
+
+
+def _encode_frames(piece: EncodePiece, bit_rate: str, cancel_event: Optional[threading.Event]) -> List[bytes]:
+    """
+    再エンコード区間をエンコードし、出力に使うフレームを返す。
+    エンコーダ遅延分の助走フレームと前後の文脈のフレームは取り除く。
+    """
+    spf = piece.ranges[0][0].samples_per_frame
+    with tempfile.TemporaryDirectory() as tmpdir:
+        out_path = Path(tmpdir) / "piece.mp3"
+        _run(_encode_command(piece, out_path, bit_rate), cancel_event)
+        data = out_path.read_bytes()
+
+    frames = list(_scan_frames(data, 0))
+    if not frames:
+        raise SmartCutError("境界の再エンコード結果が空です")
+    tag = read_info_tag(data[frames[0][0]:frames[0][0] + frames[0][1].frame_length], frames[0][1])
+    if tag is not None:
+        frames = frames[1:]
+    delay = tag.encoder_delay + DECODER_DELAY if tag is not None and tag.has_lame else DEFAULT_CODEC_DELAY
+    if delay != DEFAULT_CODEC_DELAY:
+        raise SmartCutUnsupported(f"想定外のエンコーダ遅延です: {delay}")
+
+    # 文脈の長さは助走フレームがちょうど捨てられるように決めてある
+    skip = (_length(piece.before) + DEFAULT_CODEC_DELAY) // spf
+    kept = frames[skip:skip + piece.frames]
+    if len(kept) != piece.frames:
+        raise SmartCutError("境界の再エンコード結果のフレーム数が足りません")
+
+    result = []
+    for offset, header in kept:
+        frame = data[offset:offset + header.frame_length]
+        if _main_data_begin(frame, header) != 0:
+            raise SmartCutUnsupported("ビットリザーバを無効にできませんでした")
+        result.append(frame)
+    return result
+
+
+def _free_bytes(frame: bytes) -> int:
+    """フレームのメインデータ領域のうち、メインデータの後ろに余っているバイト数"""
+    header = parse_frame_header(frame)
+    payload = header.frame_length - (6 if header.has_crc else 4) - side_info_length(header)
+    return payload - _main_data_used(frame, header)
+
+
+def _inflate(frame: bytes) -> bytes:
+    """
+    ヘッダのビットレートを最大にしてフレームを大きくする（増えた分は付随データとして 0 で埋める）。
+    main_data_begin が 0 のフレームはメインデータが自分の中で完結しているので、デコード結果は変わらない。
+    """
+    b = bytearray(frame[:4])
+    b[2] = (14 << 4) | (b[2] & 0x0C) | (b[2] & 0x01)  # ビットレートインデックス 14、パディングなし
+    header = parse_frame_header(bytes(b))
+    return bytes(b) + frame[4:] + bytes(header.frame_length - len(frame))
+
+
+def encode_piece(piece: EncodePiece, cancel_event: Optional[threading.Event] = None) -> bytes:
+    """
+    再エンコード区間をエンコードし、出力に使うフレームのバイト列を返す。
+    直後にコピー区間があれば、その先頭フレームが参照するリザーバを最後のフレームの末尾に書き込む。
+    """
+    mpeg1 = piece.ranges[0][0].mpeg1
+    frames = _encode_frames(piece, BIT_RATE if mpeg1 else BIT_RATE_MPEG2, cancel_event)
+
+    if piece.reservoir:
+        last = frames[-1]
+        if _free_bytes(last) < len(piece.reservoir):
+            last = _reencode_last_frame(piece, cancel_event)
+        # メインデータの後ろ（付随データ領域）に、次のコピーフレームの参照先を置く
+        frames[-1] = last[:len(last) - len(piece.reservoir)] + piece.reservoir
+    return b"".join(frames)
+
+
+def _reencode_last_frame(piece: EncodePiece, cancel_event: Optional[threading.Event]) -> bytes:
+    """
+    リザーバを置く空きが足りないとき、最後のフレームだけを低めのビットレートで作り直し、
+    最大サイズに広げて空きを作る。音質が落ちるのは 1 フレームだけなので、収まる範囲で高いビットレートから試す。
+    """
+    spf = piece.ranges[0][0].samples_per_frame
+    all_ranges = [*piece.before, *piece.ranges]
+    head, last_ranges = _split_tail(all_ranges, spf)
+    _rest, before = _split_tail(head, _context_samples(spf))
+    last_piece = EncodePiece(ranges=last_ranges, frames=1, before=before, after=piece.after)
+    bit_rates = FALLBACK_BIT_RATES if piece.ranges[0][0].mpeg1 else FALLBACK_BIT_RATES_MPEG2
+    for bit_rate in bit_rates:
+        last = _inflate(_encode_frames(last_piece, bit_rate, cancel_event)[-1])
+        if _free_bytes(last) >= len(piece.reservoir):
+            return last
+    raise _ReservoirTooSmall()
+
+
+class _ReservoirTooSmall(Exception):
+    """再エンコードしたフレームの空きに、コピーフレームのリザーバが収まらない"""
+
+
+# ===== Info タグ =====
+
+
+def _crc16(data: bytes) -> int:
+    """LAME タグ用の CRC-16（多項式 0x8005 のビット反転版）"""
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+def build_info_frame(header_bytes: bytes, frames: int, total_bytes: int, delay: int, padding: int) -> bytes:
+    """
+    Xing ヘッダ（フレーム数・バイト数）と LAME タグ（遅延・パディング）を持つ先頭フレームを作る。
+    header_bytes: このフレームに使う 4 バイトのフレームヘッダ
+    """
+    if not (0 <= delay <= 0xFFF and 0 <= padding <= 0xFFF):
+        raise SmartCutError("エンコーダ遅延・パディングが LAME タグの範囲を超えています")
+    header = parse_frame_header(header_bytes)
+    xing_offset = 4 + side_info_length(header)
+    frame = bytearray(header.frame_length)
+    frame[:4] = header_bytes
+    # ビットレートが混在するので Xing（VBR）として書き、シーク表は付けない
+    frame[xing_offset:xing_offset + 16] = b"Xing" + struct.pack(">III", 0x03, frames, total_bytes)
+
+    # LAME タグ（36 バイト）: エンコーダ名 9 バイト、+21 に遅延/パディング、+28 に全体のバイト数、+34 にタグの CRC
+    lame_offset = xing_offset + 16
+    lame = bytearray(36)
+    lame[:9] = b"Lavf".ljust(9, b"\x00")
+    lame[21:24] = bytes([delay >> 4, ((delay & 0x0F) << 4) | (padding >> 8), padding & 0xFF])
+    lame[28:32] = struct.pack(">I", total_bytes)
+    frame[lame_offset:lame_offset + 36] = lame
+    frame[lame_offset + 34:lame_offset + 36] = struct.pack(">H", _crc16(bytes(frame[:lame_offset + 34])))
+    return bytes(frame)
+
+
+# ===== 公開 API =====
+
+
+def smart_cut_supported(segments: Sequence[Segment]) -> bool:
+    """すべての入力が同じ形式の MP3 で、スマートカットできるか"""
+    try:
+        indexes = [get_frame_index(src) for src, _s, _d in segments]
+    except (OSError, SmartCutUnsupported):
+        return False
+    return _compatible(indexes)
+
+
+def _compatible(indexes: Sequence[FrameIndex]) -> bool:
+    first = indexes[0]
+    return all(
+        (i.mpeg1, i.sample_rate, i.channels, i.samples_per_frame)
+        == (first.mpeg1, first.sample_rate, first.channels, first.samples_per_frame)
+        for i in indexes
+    )
+
+
+def smart_cut(
+    segments: Sequence[Segment],
+    out_path: Path,
+    max_workers: Optional[int] = None,
+    cancel_event: Optional[threading.Event] = None,
+    job=None,
+    use_cache: bool = True,
+) -> CutPlan:
+    """
+    セグメント群をスマートカットで out_path に書き出し、使った計画を返す。
+    内側のフレームはコピーし、境界だけ再エンコードする。出力はサンプル単位で正確な長さになる。
+    形式の都合でできない場合は SmartCutUnsupported、ffmpeg の失敗は SmartCutError を送出する。
+    cancel_event（job を渡した場合はそのキャンセル）がセットされると JobCancelled を送出する。
+    job: edit.job_runner.Job を渡すと進捗通知・キャンセルに対応する
+    use_cache: 境界の再エンコード結果を edit.render_cache に保存・再利用する
+    """
+    segments = list(segments)
+    if not segments:
+        raise SmartCutError("書き出す切り取り範囲がありません。")
+    if job is not None:
+        cancel_event = job.cancel_event
+    try:
+        indexes = [get_frame_index(src) for src, _s, _d in segments]
+    except OSError as exc:
+        raise SmartCutUnsupported(str(exc)) from exc
+    if not _compatible(indexes):
+        raise SmartCutUnsupported("サンプリング周波数・チャンネル数の異なる MP3 が混在しています")
+
+    skip = {}
+    for _attempt in range(MAX_SPLICE_RETRIES + 1):
+        plan = plan_smart_cut(segments, indexes, skip)
+        retry = _encode_plan(plan, max_workers, cancel_event, job, use_cache)
+        if retry is None:
+            break
+        # リザーバを置く空きが足りなかったセグメントは、コピー開始を 1 フレーム後ろにずらす
+        skip[retry] = skip.get(retry, 0) + 1
+    else:
+        raise SmartCutUnsupported("コピー区間の先頭フレームのリザーバを再現できませんでした")
+
+    _write_output(plan, out_path)
+    logger.info(
+        "smart cut: %d frames copied, %d frames re-encoded", plan.copied_frames, plan.encoded_frames
+    )
+    return plan
+
+
+def _piece_key(piece: EncodePiece) -> Optional[str]:
+    """再エンコード区間のキャッシュキー（元ファイル・範囲・文脈・書き戻すリザーバで決まる）"""
+    parts = []
+    for group in (piece.before, piece.ranges, piece.after):
+        items = []
+        for idx, start, end in group:
+            try:
+                items.append([*source_identity(idx.path), start, end])
+            except OSError:
+                return None
+        parts.append(items)
+    reservoir = hashlib.sha1(piece.reservoir).hexdigest()
+    return cache_key("smart_piece", parts, piece.frames, reservoir, all_codec_args())
+
+
+def _encode_plan(plan: CutPlan, max_workers, cancel_event, job, use_cache: bool = True) -> Optional[int]:
+    """
+    計画の再エンコード区間をすべてエンコードする（並列）。
+    リザーバの空きが足りなかった場合は、そのコピー区間のセグメント番号を返す。
+    """
+    # 再エンコード区間 → 直後のコピー区間のセグメント番号
+    copies = {}
+    for before, piece in zip(plan.pieces, plan.pieces[1:]):
+        if isinstance(piece, CopyPiece):
+            needed = piece.index.reservoir_needed(piece.start)
+            before.reservoir = piece.index.main_data_before(piece.start, needed) if needed else b""
+            copies[id(before)] = piece.segment
+
+    encode_pieces = [p for p in plan.pieces if isinstance(p, EncodePiece)]
+    workers = max(1, min(max_workers or DEFAULT_MAX_WORKERS, len(encode_pieces)))
+    done = [0]
+
+    cache = default_cache() if use_cache else None
+
+    def run(piece: EncodePiece):
+        key = _piece_key(piece) if cache is not None else None
+        cached = cache.get_bytes(key, ".frames") if key is not None else None
+        if cached is not None:
+            piece.data = cached
+        else:
+            try:
+                piece.data = encode_piece(piece, cancel_event)
+            except _ReservoirTooSmall:
+                return copies[id(piece)]
+            if key is not None:
+                cache.put_bytes(key, piece.data, ".frames")
+        done[0] += 1
+        if job is not None:
+            job.report(done[0] / len(encode_pieces), "書き出し中")
+        return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(run, encode_pieces))
+    if job is not None:
+        job.check_cancelled()
+    for r in results:
+        if r is not None:
+            return r
+    return None
+
+
+def _write_output(plan: CutPlan, out_path: Path) -> None:
+    """
+    Info フレームに続けて各ピースを out_path に書く。
+    フレーム数とバイト数は計画から分かるので、コピー区間は元ファイルから少しずつ読んでそのまま書く。
+    """
+    frames = 0
+    body_bytes = 0
+    for piece in plan.pieces:
+        if isinstance(piece, CopyPiece):
+            frames += piece.end - piece.start
+            body_bytes += piece.index.seek.frame_offset(piece.end) - piece.index.seek.frame_offset(piece.start)
+        else:
+            frames += piece.frames
+            body_bytes += len(piece.data)
+
+    first = plan.pieces[0]
+    if isinstance(first, CopyPiece):
+        first_header = first.index.read_frames(first.start, first.start + 1)[:4]
+    else:
+        first_header = first.data[:4]
+    header_bytes = _info_header(first_header)
+    info_length = parse_frame_header(header_bytes).frame_length
+    info = build_info_frame(
+        header_bytes,
+        frames=frames,
+        total_bytes=body_bytes + info_length,
+        delay=plan.encoder_delay,
+        padding=plan.encoder_padding,
+    )
+    with open(out_path, "wb") as f:
+        f.write(info)
+        for piece in plan.pieces:
+            if isinstance(piece, CopyPiece):
+                piece.index.copy_frames(piece.start, piece.end, f)
+            else:
+                f.write(piece.data)
+
+
+def _info_header(first_header: bytes) -> bytes:
+    """先頭フレームのヘッダを元に、タグが収まる大きさの Info フレーム用ヘッダを作る"""
+    b = bytearray(first_header)
+    mpeg1 = (b[1] >> 3) & 0x03 == 3
+    # CRC なし、ビットレートは 128k（MPEG1）/ 64k（MPEG2）、パディングなし
+    b[1] |= 0x01
+    b[2] = ((9 if mpeg1 else 8) << 4) | (b[2] & 0x0C)
+    return bytes(b)
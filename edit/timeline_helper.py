@@ -1,6 +1,6 @@
 import tkinter as tk
 from dataclasses import dataclass, field
-from typing import List, Dict
+from typing import List, Dict, Optional, Set
 
 
 @dataclass
@@ -9,6 +9,9 @@ class TimelineController:
     タイムライン描画とドラッグ操作を担当するヘルパー。
     EditPage 側からは UI 部品と状態(list[dict])、tk.Variable を渡すだけにして、
     描画・秒数⇔座標変換・ドラッグ処理・テキスト表示などはここに集約する。
+
+    Canvas ごとに図形の ID を保持し、範囲の変更は coords() で動かすだけにする。
+    変更は変わった Canvas だけを記録しておき、1 フレームに 1 回まとめて反映する。
     """
 
     canvases: List[tk.Canvas]
@@ -22,6 +25,13 @@ class TimelineController:
     _active_index: int = field(init=False, default=0)
     _dragging_handle: str | None = field(init=False, default=None)
     _is_syncing: bool = field(init=False, default=False)
+    _waveforms: Dict[int, object] = field(init=False, default_factory=dict)
+    _items: Dict[int, Dict[str, object]] = field(init=False, default_factory=dict)
+    _dirty: Set[int] = field(init=False, default_factory=set)
+    _pending_flush: Optional[str] = field(init=False, default=None)
+    _info_text: str = field(init=False, default="")
+
+    FRAME_MS = 16
 
     # ===== 公開 API =====
 
@@ -35,16 +45,34 @@ class TimelineController:
             canvas.bind("<ButtonRelease-1>", self.on_release)
 
     def redraw(self) -> None:
-        """全タイムラインの再描画。"""
+        """全タイムラインの再描画（ファイルの追加・削除時など）。"""
 
-        if not self.canvases:
-            return
+        # 削除されたタイムラインの情報を捨てる
+        for idx in [i for i in self._items if i >= len(self.canvases)]:
+            del self._items[idx]
+        self._dirty.clear()
 
         for idx, canvas in enumerate(self.canvases):
             self._draw_single_timeline(idx, canvas)
 
         self._update_info_label()
 
+    def refresh(self, index: int) -> None:
+        """index 番目のタイムラインを次のフレームで描き直す。"""
+
+        self._dirty.add(index)
+        if self._pending_flush is None:
+            self._pending_flush = self.info_label.after(self.FRAME_MS, self._flush)
+
+    def set_waveform(self, index: int, waveform: Optional[object]) -> None:
+        """index 番目のタイムラインに表示する波形（edit.waveform_cache.Waveform）を設定する。None で消す。"""
+
+        if waveform is None:
+            self._waveforms.pop(index, None)
+        else:
+            self._waveforms[index] = waveform
+        self.refresh(index)
+
     def sync_from_entries(self, index: int, use_end: bool = False) -> None:
         """数値入力欄の値から内部状態・タイムラインを更新する。"""
 
@@ -97,12 +125,16 @@ class TimelineController:
         r["duration"] = duration
         r["total"] = total
 
-        self.redraw()
+        self.refresh(index)
 
     # ===== Canvas イベント =====
 
-    def on_resize(self, _event) -> None:
-        self.redraw()
+    def on_resize(self, event) -> None:
+        try:
+            idx = self.canvases.index(event.widget)
+        except ValueError:
+            return
+        self.refresh(idx)
 
     def on_press(self, event) -> None:
         canvas = event.widget
@@ -111,7 +143,9 @@ class TimelineController:
         except ValueError:
             return
 
-        self._active_index = idx
+        if idx != self._active_index:
+            self._active_index = idx
+            self.refresh(idx)  # 情報欄の★を移す
 
         r = self.file_ranges[idx]
         start = float(r.get("start", 0.0))
@@ -149,11 +183,17 @@ class TimelineController:
         r["start"] = start
         r["duration"] = duration
 
-        self.start_vars[idx].set(round(start, 1))
-        self.duration_vars[idx].set(round(duration, 1))
-        self.end_vars[idx].set(round(end, 1))
+        # 入力欄の trace から sync_from_entries が呼ばれないようにする
+        # （丸めた値で状態を上書きしないため。描画は下の refresh でまとめて行う）
+        self._is_syncing = True
+        try:
+            self.start_vars[idx].set(round(start, 1))
+            self.duration_vars[idx].set(round(duration, 1))
+            self.end_vars[idx].set(round(end, 1))
+        finally:
+            self._is_syncing = False
 
-        self.redraw()
+        self.refresh(idx)
 
     def on_release(self, _event) -> None:
         self._dragging_handle = None
@@ -185,24 +225,24 @@ class TimelineController:
         x = max(margin, min(x, width - margin))
         return total * (x - margin) / inner
 
-    def _draw_single_timeline(self, idx: int, canvas: tk.Canvas) -> None:
-        canvas.delete("all")
+    def _flush(self) -> None:
+        """refresh() で記録された Canvas だけを描き直す。"""
 
+        self._pending_flush = None
+        dirty, self._dirty = self._dirty, set()
+        try:
+            for idx in sorted(dirty):
+                if idx < len(self.canvases):
+                    self._draw_single_timeline(idx, self.canvases[idx])
+            self._update_info_label()
+        except tk.TclError:
+            # ページが破棄された後に呼ばれた場合
+            pass
+
+    def _draw_single_timeline(self, idx: int, canvas: tk.Canvas) -> None:
         width = max(canvas.winfo_width(), 1)
         height = max(canvas.winfo_height(), 1)
         margin = 20
-        bar_top = height / 2 - 10
-        bar_bottom = height / 2 + 10
-
-        # ベースバー
-        canvas.create_rectangle(
-            margin,
-            bar_top,
-            width - margin,
-            bar_bottom,
-            fill="#333",
-            outline="",
-        )
 
         r = self.file_ranges[idx]
         start = float(r.get("start", 0.0))
@@ -212,27 +252,72 @@ class TimelineController:
         start = max(0.0, min(start, total))
         end = max(start, min(start + max(0.0, duration), total))
 
+        waveform = self._waveforms.get(idx)
+        if waveform is not None:
+            # 波形がある場合はキャンバスの高さいっぱいに表示し、選択範囲は背景色で示す
+            bar_top = 4
+            bar_bottom = height - 4
+        else:
+            bar_top = height / 2 - 10
+            bar_bottom = height / 2 + 10
+
+        # サイズ・全長・波形が変わったときだけ図形を作り直し、それ以外は位置だけ動かす
+        key = (width, height, total, id(waveform))
+        items = self._items.get(idx)
+        if items is None or items["canvas"] is not canvas or items["key"] != key:
+            canvas.delete("all")
+            items = {"canvas": canvas, "key": key}
+            if waveform is not None:
+                canvas.create_rectangle(margin, bar_top, width - margin, bar_bottom, fill="#2a2a2a", outline="")
+                items["range"] = canvas.create_rectangle(0, 0, 0, 0, fill="#1e5c3a", outline="")
+                self._draw_waveform(canvas, waveform, total, margin, bar_top, bar_bottom)
+            else:
+                # ベースバー
+                canvas.create_rectangle(
+                    margin,
+                    bar_top,
+                    width - margin,
+                    bar_bottom,
+                    fill="#333",
+                    outline="",
+                )
+                items["range"] = canvas.create_rectangle(0, 0, 0, 0, fill="#2ecc71", outline="")
+            items["start_handle"] = canvas.create_rectangle(0, 0, 0, 0, fill="#ecf0f1", outline="")
+            items["end_handle"] = canvas.create_rectangle(0, 0, 0, 0, fill="#ecf0f1", outline="")
+            self._items[idx] = items
+
         x1 = self._sec_to_x(canvas, total, start)
         x2 = self._sec_to_x(canvas, total, end)
         handle_w = 4
 
-        canvas.create_rectangle(x1, bar_top, x2, bar_bottom, fill="#2ecc71", outline="")
-        canvas.create_rectangle(
-            x1 - handle_w,
-            bar_top - 5,
-            x1 + handle_w,
-            bar_bottom + 5,
-            fill="#ecf0f1",
-            outline="",
-        )
-        canvas.create_rectangle(
-            x2 - handle_w,
-            bar_top - 5,
-            x2 + handle_w,
-            bar_bottom + 5,
-            fill="#ecf0f1",
-            outline="",
-        )
+        canvas.coords(items["range"], x1, bar_top, x2, bar_bottom)
+        canvas.coords(items["start_handle"], x1 - handle_w, bar_top - 5, x1 + handle_w, bar_bottom + 5)
+        canvas.coords(items["end_handle"], x2 - handle_w, bar_top - 5, x2 + handle_w, bar_bottom + 5)
+
+    def _draw_waveform(
+        self, canvas: tk.Canvas, waveform, total: float, margin: float, top: float, bottom: float
+    ) -> None:
+        """波形を 1 ピクセル 1 列で、ピーク（最小〜最大）と RMS の 2 つのポリゴンとして描く"""
+
+        width = max(canvas.winfo_width(), 1)
+        inner = max(width - margin * 2, 1)
+        count = int(inner)
+        mins, maxs, rms = waveform.columns(0.0, total, count)
+
+        mid = (top + bottom) / 2
+        half = (bottom - top) / 2
+        xs = [margin + inner * i / count for i in range(count)]
+
+        def outline(upper, lower):
+            points = []
+            for x, v in zip(xs, upper):
+                points += (x, mid - float(v) * half)
+            for x, v in zip(reversed(xs), reversed(lower)):
+                points += (x, mid - float(v) * half)
+            return points
+
+        canvas.create_polygon(outline(maxs, mins), fill="#7f8c8d", outline="")
+        canvas.create_polygon(outline(rms, -rms), fill="#bdc3c7", outline="")
 
     def _update_info_label(self) -> None:
         lines: list[str] = []
@@ -250,4 +335,7 @@ class TimelineController:
                 f"(長さ: {self._format_time(end - start)} / 全長: {self._format_time(total)})"
             )
 
-        self.info_label.config(text="\n".join(lines))
+        text = "\n".join(lines)
+        if text != self._info_text:
+            self._info_text = text
+            self.info_label.config(text=text)
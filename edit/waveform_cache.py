@@ -0,0 +1,342 @@
+import hashlib
+import logging
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from misc.library_index import get_seek_index
+
+try:
+    import numpy as np
+except ImportError:  # numpy が無い環境では波形表示を行わない
+    np = None
+
+
+logger = logging.getLogger(__name__)
+
+# 波形用のデコード設定（モノラル・低サンプリング周波数で十分）
+WAVEFORM_SAMPLE_RATE = 8000
+# 最も細かい段の 1 バケットのサンプル数（8000Hz で 32ms）
+BASE_BUCKET_SAMPLES = 256
+# 1 段ごとにバケットを何個ずつまとめるか
+LEVEL_FACTOR = 4
+# これより少ないバケット数になったら段を作るのをやめる
+MIN_LEVEL_BUCKETS = 256
+# 長いファイルは区間に分けて並列にデコードする（1 区間の最小秒数）
+MIN_PART_SECONDS = 120.0
+DEFAULT_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+CACHE_DIR = Path(__file__).resolve().parent.parent / ".cache" / "waveforms"
+CACHE_VERSION = 1
+
+_MEMORY_CACHE_SIZE = 16
+
+
+def numpy_available() -> bool:
+    return np is not None
+
+
+@dataclass
+class WaveformLevel:
+    """ある解像度の波形（バケットごとの最小値・最大値・RMS、値は -1.0〜1.0）"""
+
+    seconds_per_bucket: float
+    mins: "np.ndarray"
+    maxs: "np.ndarray"
+    rms: "np.ndarray"
+
+    def __len__(self) -> int:
+        return len(self.mins)
+
+
+@dataclass
+class Waveform:
+    """複数解像度の波形（levels[0] が最も細かい）"""
+
+    duration: float
+    levels: List[WaveformLevel]
+
+    def level_for(self, buckets_needed: int) -> WaveformLevel:
+        """buckets_needed 個以上のバケットを持つ段のうち、最も粗いものを返す"""
+        for level in reversed(self.levels):
+            if len(level) >= buckets_needed:
+                return level
+        return self.levels[0]
+
+    def columns(self, start: float, end: float, count: int) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+        """
+        start〜end 秒を count 列に分けたときの各列の (最小値, 最大値, RMS) を返す。
+        範囲外の列は 0 になる。
+        """
+        count = max(int(count), 1)
+        span = max(end - start, 1e-9)
+        level = self.level_for(int(count * len(self.levels[0]) * self.levels[0].seconds_per_bucket / span))
+        n = len(level)
+
+        # 各列の境界をバケット番号に変換
+        edges = np.linspace(start, end, count + 1) / level.seconds_per_bucket
+        edges = np.clip(np.floor(edges).astype(np.int64), 0, n)
+        lo = edges[:-1]
+        hi = np.maximum(edges[1:], lo + 1)
+        valid = lo < n
+
+        mins = np.zeros(count, dtype=np.float32)
+        maxs = np.zeros(count, dtype=np.float32)
+        rms = np.zeros(count, dtype=np.float32)
+        if n == 0 or not valid.any():
+            return mins, maxs, rms
+
+        # reduceat は区間 [idx[i], idx[i+1]) で集計するので、最後の列の終端で配列を切っておく
+        idx = lo[valid]
+        cut = int(hi[valid][-1])
+        mins[valid] = np.minimum.reduceat(level.mins[:cut], idx)
+        maxs[valid] = np.maximum.reduceat(level.maxs[:cut], idx)
+        sq = np.add.reduceat(level.rms[:cut].astype(np.float64) ** 2, idx)
+        widths = np.diff(np.append(idx, cut))
+        rms[valid] = np.sqrt(sq / np.maximum(widths, 1))
+
+        # 列幅がバケット幅より狭い場合（拡大表示）は、同じバケットを複数列で共有する
+        narrow = valid & (hi - lo <= 1)
+        if narrow.any():
+            b = np.minimum(lo[narrow], n - 1)
+            mins[narrow] = level.mins[b]
+            maxs[narrow] = level.maxs[b]
+            rms[narrow] = level.rms[b]
+        return mins, maxs, rms
+
+
+def _bucketize(samples: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """サンプル列（長さは BASE_BUCKET_SAMPLES の倍数）をバケットごとに集計する"""
+    frames = samples.reshape(-1, BASE_BUCKET_SAMPLES).astype(np.float32) / 32768.0
+    return frames.min(axis=1), frames.max(axis=1), np.sqrt((frames * frames).mean(axis=1))
+
+
+def _decode_part(path: Path, start: float, duration: Optional[float], cancel_event=None):
+    """ffmpeg で start 秒から duration 秒をデコードし、最も細かい段のバケットを作る"""
+    cmd = ["ffmpeg", "-nostdin", "-loglevel", "error"]
+    index = get_seek_index(path) if start > 0 else None
+    if index is not None:
+        # MP3 はシーク表のバイト位置から読み、手前の余分をデコード後に捨てる
+        # （ffmpeg の -ss は VBR で目次が無いとずれるが、こちらはサンプル単位で正確）
+        offset, skip = index.decode_start(start)
+        cmd += ["-skip_initial_bytes", str(offset), "-i", str(path), "-ss", f"{skip:.6f}"]
+        if duration is not None:
+            cmd += ["-t", f"{duration:.6f}"]
+    else:
+        if start > 0:
+            cmd += ["-ss", f"{start:.6f}"]
+        if duration is not None:
+            cmd += ["-t", f"{duration:.6f}"]
+        cmd += ["-i", str(path)]
+    cmd += ["-vn", "-ac", "1", "-ar", str(WAVEFORM_SAMPLE_RATE), "-f", "s16le", "pipe:1"]
+
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    mins, maxs, rms = [], [], []
+    read_bytes = BASE_BUCKET_SAMPLES * 2 * 1024
+    rest = b""
+    try:
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            data = proc.stdout.read(read_bytes)
+            if not data:
+                break
+            data = rest + data
+            usable = len(data) - len(data) % (BASE_BUCKET_SAMPLES * 2)
+            rest = data[usable:]
+            if usable:
+                part = _bucketize(np.frombuffer(data[:usable], dtype="<i2"))
+                mins.append(part[0])
+                maxs.append(part[1])
+                rms.append(part[2])
+        if rest:
+            # 端数は無音で埋めて最後のバケットにする
+            tail = np.zeros(BASE_BUCKET_SAMPLES, dtype="<i2")
+            chunk = np.frombuffer(rest[: len(rest) - len(rest) % 2], dtype="<i2")
+            tail[: len(chunk)] = chunk
+            part = _bucketize(tail)
+            mins.append(part[0])
+            maxs.append(part[1])
+            rms.append(part[2])
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+
+    if proc.returncode != 0 or not mins:
+        return None
+    return np.concatenate(mins), np.concatenate(maxs), np.concatenate(rms)
+
+
+def _build_levels(mins: "np.ndarray", maxs: "np.ndarray", rms: "np.ndarray") -> List[WaveformLevel]:
+    """最も細かい段から LEVEL_FACTOR ずつまとめた段を作る"""
+    seconds = BASE_BUCKET_SAMPLES / WAVEFORM_SAMPLE_RATE
+    levels = [WaveformLevel(seconds, mins, maxs, rms)]
+    while len(levels[-1]) // LEVEL_FACTOR >= MIN_LEVEL_BUCKETS:
+        prev = levels[-1]
+        n = len(prev) // LEVEL_FACTOR * LEVEL_FACTOR
+        levels.append(
+            WaveformLevel(
+                prev.seconds_per_bucket * LEVEL_FACTOR,
+                prev.mins[:n].reshape(-1, LEVEL_FACTOR).min(axis=1),
+                prev.maxs[:n].reshape(-1, LEVEL_FACTOR).max(axis=1),
+                np.sqrt((prev.rms[:n].reshape(-1, LEVEL_FACTOR) ** 2).mean(axis=1)),
+            )
+        )
+    return levels
+
+
+def compute_waveform(
+    path: Path,
+    duration: Optional[float] = None,
+    max_workers: Optional[int] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> Optional[Waveform]:
+    """
+    ファイル全体をデコードして波形を作る（キャッシュは使わない）。
+    duration が分かっていれば区間に分けて並列にデコードする。
+    失敗・キャンセル時は None を返す。
+    """
+    if np is None:
+        return None
+
+    bucket_seconds = BASE_BUCKET_SAMPLES / WAVEFORM_SAMPLE_RATE
+    workers = max_workers or DEFAULT_WORKERS
+    index = get_seek_index(path)
+    if index is not None:
+        # MP3 の長さはシーク表の値が正確（ヘッダからの見積もりは VBR でずれることがある）
+        duration = index.duration
+    if duration and duration > MIN_PART_SECONDS * 2 and workers > 1:
+        parts = min(workers, int(duration // MIN_PART_SECONDS))
+        # 区間の境界をバケット境界に揃えて、連結したときにずれないようにする
+        step = round(duration / parts / bucket_seconds) * bucket_seconds
+        ranges = [(i * step, step if i < parts - 1 else None) for i in range(parts)]
+    else:
+        ranges = [(0.0, None)]
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+            results = list(pool.map(lambda r: _decode_part(path, r[0], r[1], cancel_event), ranges))
+    except FileNotFoundError:
+        logger.info("ffmpeg が見つからないため波形を作成できません")
+        return None
+
+    if any(r is None for r in results):
+        return None
+
+    if len(results) > 1:
+        # 途中の区間は step 秒ちょうどのバケット数に揃える（-t の端数で 1 つ多くなることがある）
+        expected = int(round(step / bucket_seconds))
+        results = [(m[:expected], x[:expected], s[:expected]) for m, x, s in results[:-1]] + [results[-1]]
+
+    mins = np.concatenate([r[0] for r in results])
+    maxs = np.concatenate([r[1] for r in results])
+    rms = np.concatenate([r[2] for r in results])
+    return Waveform(duration=len(mins) * bucket_seconds, levels=_build_levels(mins, maxs, rms))
+
+
+def _cache_key(path: Path) -> Optional[str]:
+    """パス・サイズ・更新時刻から作るキャッシュキー（ファイルが無ければ None）"""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    raw = f"{path.resolve()}|{st.st_size}|{st.st_mtime_ns}|{CACHE_VERSION}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _load_cached(key: str) -> Optional[Waveform]:
+    cache_file = CACHE_DIR / f"{key}.npz"
+    if not cache_file.is_file():
+        return None
+    try:
+        with np.load(cache_file) as data:
+            seconds = data["seconds"]
+            levels = [
+                WaveformLevel(float(seconds[i]), data[f"min{i}"], data[f"max{i}"], data[f"rms{i}"])
+                for i in range(len(seconds))
+            ]
+            return Waveform(duration=float(data["duration"]), levels=levels)
+    except (OSError, KeyError, ValueError) as e:
+        logger.warning("波形キャッシュを読み込めません (%s): %s", cache_file, e)
+        return None
+
+
+def _save_cached(key: str, waveform: Waveform) -> None:
+    arrays = {
+        "duration": np.array(waveform.duration),
+        "seconds": np.array([lv.seconds_per_bucket for lv in waveform.levels]),
+    }
+    for i, lv in enumerate(waveform.levels):
+        # 表示用なので float16 で十分
+        arrays[f"min{i}"] = lv.mins.astype(np.float16)
+        arrays[f"max{i}"] = lv.maxs.astype(np.float16)
+        arrays[f"rms{i}"] = lv.rms.astype(np.float16)
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = CACHE_DIR / f"{key}.tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, CACHE_DIR / f"{key}.npz")
+    except OSError as e:
+        logger.warning("波形キャッシュを保存できません: %s", e)
+
+
+_memory_cache: "OrderedDict[str, Waveform]" = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def cached_waveform(path: Path) -> Optional[Waveform]:
+    """メモリ・ディスクのキャッシュにある波形だけを返す（デコードはしない）"""
+    if np is None:
+        return None
+    key = _cache_key(Path(path))
+    if key is None:
+        return None
+    with _memory_lock:
+        if key in _memory_cache:
+            _memory_cache.move_to_end(key)
+            return _memory_cache[key]
+    waveform = _load_cached(key)
+    if waveform is not None:
+        _remember(key, waveform)
+    return waveform
+
+
+def _remember(key: str, waveform: Waveform) -> None:
+    with _memory_lock:
+        _memory_cache[key] = waveform
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > _MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+
+def load_waveform(path: Path, duration: Optional[float] = None, job=None) -> Optional[Waveform]:
+    """
+    波形を返す。キャッシュ（メモリ → ディスク）に無ければデコードして作り、保存する。
+    キャッシュはパス・サイズ・更新時刻で引くので、ファイルが変わると作り直される。
+    ワーカースレッドから呼ぶ。
+    job: edit.job_runner.Job を渡すとキャンセルに対応する
+    """
+    if np is None:
+        return None
+    path = Path(path)
+    waveform = cached_waveform(path)
+    if waveform is not None:
+        return waveform
+
+    key = _cache_key(path)
+    if key is None:
+        return None
+    waveform = compute_waveform(path, duration, cancel_event=job.cancel_event if job is not None else None)
+    if waveform is None:
+        if job is not None:
+            job.check_cancelled()
+        return None
+    _save_cached(key, waveform)
+    _remember(key, waveform)
+    return waveform
@@ -0,0 +1,307 @@
+import os
+import re
+import sqlite3
+import subprocess
+import threading
+from collections import OrderedDict
+from dataclasses import astuple, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from misc.mp3_header import read_mp3_info
+from misc.seek_index import build_seek_index
+
+# 音声ファイルの情報（長さ・ビットレート・サンプリング周波数・チャンネル数・コーデック）を調べるサービス
+# - mp3 はフレームヘッダを読むだけで済ませる（外部プロセスを起動しない）
+# - それ以外は ffmpeg を 1 回だけ起動し、複数ファイルを -i で並べてまとめて調べる
+# - 結果は (パス, サイズ, 更新時刻) をキーにメモリの LRU とディスク（SQLite）に保存する
+
+CACHE_PATH = Path(__file__).resolve().parent.parent / ".cache" / "probe.sqlite3"
+CACHE_VERSION = 1
+# 1 回の ffmpeg で調べるファイル数（コマンドラインの長さの上限にかからない程度）
+BATCH_SIZE = 32
+
+_MEMORY_CACHE_SIZE = 4096
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS probes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    ok INTEGER NOT NULL,
+    duration REAL,
+    bit_rate INTEGER,
+    sample_rate INTEGER,
+    channels INTEGER,
+    codec TEXT
+);
+"""
+
+
+@dataclass(frozen=True)
+class AudioInfo:
+    """音声ファイル 1 つ分の情報（分からない項目は None）"""
+
+    duration: Optional[float]  # 秒
+    bit_rate: Optional[int]  # bps（音声ストリームの値。分からなければファイル全体の値）
+    sample_rate: Optional[int]
+    channels: Optional[int]
+    codec: Optional[str]  # "mp3", "aac", "opus" など
+
+
+# ===== ffmpeg の出力の解析 =====
+
+# 例: "Input #0, mov,mp4,m4a,3gp,3g2,mj2, from 'movie.mp4':"
+_INPUT_RE = re.compile(r"^Input #(\d+),")
+# 例: "  Duration: 00:03:21.45, start: 0.000000, bitrate: 192 kb/s"
+_DURATION_RE = re.compile(r"^\s*Duration: (?:(\d+):(\d+):(\d+(?:\.\d+)?)|N/A)(?:.*bitrate: (\d+) kb/s)?")
+# 例: "    Stream #0:1[0x2](und): Audio: aac (LC) (mp4a / 0x6134706D), 44100 Hz, stereo, fltp, 128 kb/s (default)"
+_AUDIO_RE = re.compile(r"^\s*Stream #\d+:\d+.*?: Audio: ([^\s,]+)(.*)$")
+_CHANNEL_LAYOUTS = {"mono": 1, "stereo": 2, "2.1": 3, "quad": 4, "4.0": 4, "5.0": 5, "5.1": 6, "6.1": 7, "7.1": 8}
+
+
+def _parse_audio_stream(rest: str) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """Audio: の後ろの部分から (サンプリング周波数, チャンネル数, ビットレート) を読む"""
+    sample_rate = channels = bit_rate = None
+    for part in (p.strip() for p in rest.split(",")):
+        if part.endswith(" Hz"):
+            sample_rate = int(part[:-3])
+        elif part.endswith(" kb/s") or " kb/s " in part:
+            bit_rate = int(part.split(" kb/s")[0].split()[-1]) * 1000
+        elif part.endswith(" channels"):
+            channels = int(part.split()[0])
+        elif part.split("(")[0] in _CHANNEL_LAYOUTS:
+            channels = _CHANNEL_LAYOUTS[part.split("(")[0]]
+    return sample_rate, channels, bit_rate
+
+
+def parse_ffmpeg_inputs(stderr: str) -> Dict[int, AudioInfo]:
+    """
+    `ffmpeg -i a -i b ...` が stderr に出す入力情報を、入力番号ごとの AudioInfo にする。
+    音声ストリームが無い入力は含めない。開けなかった入力以降は ffmpeg が出力しない。
+    """
+    inputs: Dict[int, dict] = {}
+    current: Optional[dict] = None
+    for line in stderr.splitlines():
+        m = _INPUT_RE.match(line)
+        if m:
+            current = inputs.setdefault(int(m.group(1)), {"audio": False})
+            continue
+        if current is None:
+            continue
+        m = _DURATION_RE.match(line)
+        if m:
+            if m.group(1) is not None:
+                current["duration"] = int(m.group(1)) * 3600 + int(m.group(2)) * 60 + float(m.group(3))
+            if m.group(4) is not None:
+                current["format_bit_rate"] = int(m.group(4)) * 1000
+            continue
+        m = _AUDIO_RE.match(line)
+        if m and not current["audio"]:
+            current["audio"] = True
+            current["codec"] = m.group(1)
+            current["sample_rate"], current["channels"], current["bit_rate"] = _parse_audio_stream(m.group(2))
+
+    result = {}
+    for n, d in inputs.items():
+        if not d["audio"]:
+            continue
+        result[n] = AudioInfo(
+            duration=d.get("duration"),
+            bit_rate=d.get("bit_rate") or d.get("format_bit_rate"),
+            sample_rate=d.get("sample_rate"),
+            channels=d.get("channels"),
+            codec=d.get("codec"),
+        )
+    return result
+
+
+def _probe_with_ffmpeg(paths: List[str]) -> Dict[str, Optional[AudioInfo]]:
+    """
+    ffmpeg を 1 回起動して、paths をまとめて調べる。
+    開けないファイルがあると ffmpeg はそこで止まるので、その次のファイルから続きを調べ直す。
+    """
+    results: Dict[str, Optional[AudioInfo]] = {}
+    remaining = list(paths)
+    while remaining:
+        batch = remaining[:BATCH_SIZE]
+        cmd = ["ffmpeg", "-hide_banner", "-nostdin"]
+        for p in batch:
+            # "a:b.mp4" のようなファイル名がプロトコル指定と解釈されないようにする
+            cmd += ["-i", "file:" + p]
+        try:
+            proc = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8", errors="replace")
+        except FileNotFoundError:
+            for p in remaining:
+                results[p] = None
+            break
+        parsed = parse_ffmpeg_inputs(proc.stderr)
+        # 情報が出ている最後の入力までは調べ終わっている（音声が無いものは None）
+        reported = re.findall(r"^Input #(\d+),", proc.stderr, flags=re.MULTILINE)
+        last = max((int(n) for n in reported), default=-1)
+        for n, p in enumerate(batch[: last + 1]):
+            results[p] = parsed.get(n)
+        if last + 1 < len(batch):
+            # last + 1 番目が開けなかったファイル
+            results[batch[last + 1]] = None
+            remaining = remaining[last + 2:]
+        else:
+            remaining = remaining[len(batch):]
+    return results
+
+
+def _probe_mp3(path: str) -> Optional[AudioInfo]:
+    info = read_mp3_info(path)
+    if info is None:
+        return None
+    if info.estimated:
+        # タグの無い VBR は、シーク表と同じ走査でフレームを数えて正確な長さにする
+        index = build_seek_index(path)
+        if index is not None:
+            return AudioInfo(index.duration, index.bit_rate, info.sample_rate, info.channels, "mp3")
+    return AudioInfo(info.duration, info.bit_rate, info.sample_rate, info.channels, "mp3")
+
+
+# ===== キャッシュ付きのサービス =====
+
+
+class AudioProbe:
+    """
+    音声ファイルの情報を調べ、(パス, サイズ, 更新時刻) ごとに覚えておく。
+    メモリの LRU に無ければディスクのキャッシュを見て、それも無ければ実際に調べる。
+    スレッドセーフ。
+    """
+
+    def __init__(self, cache_path: Optional[Path] = CACHE_PATH, memory_size: int = _MEMORY_CACHE_SIZE):
+        self.cache_path = cache_path
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[str, Tuple[tuple, Optional[AudioInfo]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_failed = False
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """ディスクのキャッシュを開く（使えない場合は None。ロックを持って呼ぶ）"""
+        if self._conn is None and self.cache_path is not None and not self._disk_failed:
+            try:
+                self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+                self._conn = sqlite3.connect(str(self.cache_path), check_same_thread=False)
+                self._conn.executescript(_SCHEMA)
+            except sqlite3.Error:
+                self._disk_failed = True
+                self._conn = None
+        return self._conn
+
+    def _remember(self, key: str, stamp: tuple, info: Optional[AudioInfo]) -> None:
+        self._memory[key] = (stamp, info)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def probe(self, path) -> Optional[AudioInfo]:
+        """1 ファイルの情報を返す。音声でない・開けない場合は None"""
+        return self.probe_many([path]).get(os.fspath(path))
+
+    def probe_many(self, paths: Iterable) -> Dict[str, Optional[AudioInfo]]:
+        """
+        複数ファイルの情報を {パス文字列: AudioInfo または None} で返す。
+        調べる必要があるものは mp3 ならヘッダから、それ以外はまとめて 1 回の ffmpeg で調べる。
+        """
+        results: Dict[str, Optional[AudioInfo]] = {}
+        stamps: Dict[str, tuple] = {}
+        keys: Dict[str, str] = {}
+        misses: List[str] = []
+        with self._lock:
+            for path in paths:
+                path = os.fspath(path)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    results[path] = None
+                    continue
+                key = os.path.abspath(path)
+                stamp = (st.st_size, st.st_mtime_ns)
+                keys[path], stamps[path] = key, stamp
+                cached = self._memory.get(key)
+                if cached is not None and cached[0] == stamp:
+                    self._memory.move_to_end(key)
+                    results[path] = cached[1]
+                else:
+                    misses.append(path)
+            misses = self._load_from_disk(misses, keys, stamps, results)
+
+        if not misses:
+            return results
+
+        found: Dict[str, Optional[AudioInfo]] = {}
+        others = []
+        for path in misses:
+            if path.lower().endswith(".mp3"):
+                found[path] = _probe_mp3(path)
+                if found[path] is not None:
+                    continue
+            others.append(path)
+        if others:
+            found.update(_probe_with_ffmpeg(others))
+
+        with self._lock:
+            rows = []
+            for path in misses:
+                info = found.get(path)
+                results[path] = info
+                self._remember(keys[path], stamps[path], info)
+                values = astuple(info) if info is not None else (None,) * 5
+                rows.append((keys[path], *stamps[path], CACHE_VERSION, info is not None, *values))
+            db = self._db()
+            if db is not None:
+                try:
+                    with db:
+                        db.executemany("INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                except sqlite3.Error:
+                    pass
+        return results
+
+    def _load_from_disk(self, misses, keys, stamps, results) -> List[str]:
+        """ディスクのキャッシュにあったものを results に入れ、まだ調べる必要があるものを返す"""
+        db = self._db()
+        if db is None or not misses:
+            return misses
+        remaining = []
+        for path in misses:
+            try:
+                row = db.execute(
+                    "SELECT size, mtime_ns, version, ok, duration, bit_rate, sample_rate, channels, codec "
+                    "FROM probes WHERE path = ?",
+                    (keys[path],),
+                ).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row is None or (row[0], row[1]) != stamps[path] or row[2] != CACHE_VERSION:
+                remaining.append(path)
+                continue
+            info = AudioInfo(*row[4:]) if row[3] else None
+            results[path] = info
+            self._remember(keys[path], stamps[path], info)
+        return remaining
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+
+_default_probe = AudioProbe()
+
+
+def get_audio_probe() -> AudioProbe:
+    return _default_probe
+
+
+def probe_audio(path) -> Optional[AudioInfo]:
+    """音声ファイルの情報を返す（キャッシュ付き）。分からない場合は None"""
+    return _default_probe.probe(path)
+
+
+def probe_audio_many(paths: Iterable) -> Dict[str, Optional[AudioInfo]]:
+    """複数ファイルの情報をまとめて返す（キャッシュに無いものは 1 回の ffmpeg でまとめて調べる）"""
+    return _default_probe.probe_many(paths)
@@ -0,0 +1,256 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+# フォルダ直下のファイルの作成・変更・削除・名前変更を監視する
+# - Linux では inotify（ctypes で libc を直接呼ぶ）。変化があるまでスレッドは眠ったまま
+# - それ以外（inotify が使えない場合も）は POLL_INTERVAL_S ごとにフォルダを走査して差分を取る
+# 通知はワーカースレッドから呼ばれるので、Tk を触る側はキューなどでメインスレッドに戻すこと
+
+POLL_INTERVAL_S = 2.0
+
+
+class DirEvent(NamedTuple):
+    """
+    フォルダ直下のファイル 1 つ分の変化。
+    kind: "created" / "modified" / "deleted" / "moved"（name → new_name）/
+          "overflow"（取りこぼしがあったので全体を調べ直す必要がある。name は空）
+    """
+
+    kind: str
+    name: str
+    new_name: Optional[str] = None
+
+
+EventCallback = Callable[[List[DirEvent]], None]
+
+
+class DirWatcher(ABC):
+    """監視スレッドの共通部分。callback には 1 回に届いた変化がまとめて渡される"""
+
+    def __init__(self, folder: str, callback: EventCallback):
+        self.folder = folder
+        self.callback = callback
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"watch-{self.folder}", daemon=True)
+            self._thread.start()
+
+    @abstractmethod
+    def stop(self) -> None:
+        """監視をやめる（監視スレッドは少し後に終わる）"""
+
+    @abstractmethod
+    def _run(self) -> None:
+        """監視スレッドの本体。変化があれば callback を呼ぶ"""
+
+
+# ===== inotify =====
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# 書き込み途中のファイルを読まないよう、作成（IN_CREATE）ではなく書き終わり（IN_CLOSE_WRITE）を見る。
+# shutil.copy2 は書き終わった後に更新時刻を設定するので IN_ATTRIB も見る
+_WATCH_MASK = IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+_READ_SIZE = 64 * 1024
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class InotifyWatcher(DirWatcher):
+    """inotify でフォルダを監視する（Linux 専用。使えない場合はコンストラクタが OSError）"""
+
+    def __init__(self, folder: str, callback: EventCallback):
+        super().__init__(folder, callback)
+        libc = _load_libc()
+        if libc is None:
+            raise OSError("inotify is not available")
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self._fd, os.fsencode(folder), _WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, "inotify_add_watch failed", folder)
+        # stop() で select を起こすためのパイプ
+        self._wake_r, self._wake_w = os.pipe()
+        # _stopped と fd を閉じる処理を守る。fd を閉じるのは _close だけで、閉じた fd は -1 にする
+        self._lock = threading.Lock()
+        self._stopped = False
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._stopped:
+                return  # 停止済み、または監視スレッドが終わって fd を閉じた後
+            self._stopped = True
+            if self._thread is None:
+                self._close()
+                return
+            # 監視スレッドは _stopped を立ててからでないと閉じないので、ここではまだ開いている
+            os.write(self._wake_w, b"\0")
+
+    def _close(self) -> None:
+        """fd を閉じる（self._lock を持って呼ぶこと。2 回目以降は何もしない）"""
+        for name in ("_fd", "_wake_r", "_wake_w"):
+            fd = getattr(self, name)
+            if fd >= 0:
+                os.close(fd)
+                setattr(self, name, -1)
+
+    def _run(self) -> None:
+        try:
+            while not self._stopped:
+                select.select([self._fd, self._wake_r], [], [])
+                if self._stopped:
+                    break
+                try:
+                    data = os.read(self._fd, _READ_SIZE)
+                except BlockingIOError:
+                    continue
+                events, alive = parse_inotify_events(data)
+                if events:
+                    self.callback(events)
+                if not alive:
+                    break  # フォルダ自体が消えた・移動された
+        finally:
+            with self._lock:
+                self._stopped = True
+                self._close()
+
+
+def parse_inotify_events(data: bytes) -> Tuple[List[DirEvent], bool]:
+    """
+    read() で読んだ inotify のイベント列を DirEvent に変換する。
+    同じ cookie の IN_MOVED_FROM / IN_MOVED_TO は名前変更 1 つにまとめる
+    （片方しか無いものはフォルダへの出入りなので、削除・作成として扱う）。
+    フォルダ自体が無くなったら 2 番目の戻り値が False。
+    """
+    events: List[DirEvent] = []
+    moved_from: Dict[int, int] = {}  # {cookie: events 内の番号}
+    alive = True
+    offset = 0
+    while offset + _EVENT_HEADER.size <= len(data):
+        _wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+        offset += _EVENT_HEADER.size
+        name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+        offset += length
+        if mask & IN_Q_OVERFLOW:
+            events.append(DirEvent("overflow", ""))
+        elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+            alive = False
+        elif mask & IN_ISDIR or not name:
+            continue
+        elif mask & IN_MOVED_FROM:
+            moved_from[cookie] = len(events)
+            events.append(DirEvent("deleted", name))
+        elif mask & IN_MOVED_TO:
+            index = moved_from.pop(cookie, None)
+            if index is None:
+                events.append(DirEvent("created", name))
+            else:
+                events[index] = DirEvent("moved", events[index].name, name)
+        elif mask & IN_DELETE:
+            events.append(DirEvent("deleted", name))
+        elif mask & IN_CLOSE_WRITE:
+            events.append(DirEvent("created", name))
+        elif mask & (IN_ATTRIB | IN_MODIFY):
+            events.append(DirEvent("modified", name))
+    return events, alive
+
+
+# ===== 走査による監視 =====
+
+class PollingWatcher(DirWatcher):
+    """一定間隔でフォルダを走査し、前回との差分を通知する（inotify が使えない環境用）"""
+
+    def __init__(self, folder: str, callback: EventCallback, interval: float = POLL_INTERVAL_S):
+        super().__init__(folder, callback)
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._snapshot = self._take_snapshot()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def _take_snapshot(self) -> Dict[str, Tuple[int, int, int]]:
+        """{ファイル名: (inode, サイズ, 更新時刻)}"""
+        snapshot = {}
+        try:
+            with os.scandir(self.folder) as it:
+                for entry in it:
+                    try:
+                        if entry.is_file():
+                            st = entry.stat()
+                            snapshot[entry.name] = (st.st_ino, st.st_size, st.st_mtime_ns)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return snapshot
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            snapshot = self._take_snapshot()
+            events = diff_snapshots(self._snapshot, snapshot)
+            self._snapshot = snapshot
+            if events:
+                self.callback(events)
+
+
+def diff_snapshots(old: Dict[str, Tuple[int, int, int]], new: Dict[str, Tuple[int, int, int]]) -> List[DirEvent]:
+    """2 回の走査結果の差分。消えた名前と現れた名前の inode が同じなら名前変更とみなす"""
+    gone = {old[name][0]: name for name in old.keys() - new.keys()}
+    events = []
+    for name in sorted(new.keys() - old.keys()):
+        old_name = gone.get(new[name][0])
+        if old_name is not None and old[old_name][1:] == new[name][1:]:
+            del gone[new[name][0]]
+            events.append(DirEvent("moved", old_name, name))
+        else:
+            events.append(DirEvent("created", name))
+    events.extend(DirEvent("deleted", name) for name in sorted(gone.values()))
+    for name in sorted(old.keys() & new.keys()):
+        if old[name] != new[name]:
+            events.append(DirEvent("modified", name))
+    return events
+
+
+def create_watcher(folder: str, callback: EventCallback, poll_interval: float = POLL_INTERVAL_S) -> DirWatcher:
+    """使える中で一番軽い監視方法を選ぶ（inotify → 走査）。start() はまだ呼ばない"""
+    try:
+        return InotifyWatcher(folder, callback)
+    except OSError:
+        return PollingWatcher(folder, callback, poll_interval)
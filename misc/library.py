@@ -1,13 +1,16 @@
-import glob
 import os
 import pygame
+from misc.mp3_header import get_mp3_duration
+from misc.library_index import get_library_index
 
 # pygameのミキサーを初期化
 pygame.mixer.init()
 
 class library:
-    def get_mp3_files(self, folder_name="library_file"): # デフォルトを library_file に変更
-        """実行ファイルと同じ階層にある指定フォルダからMP3を取得"""
+    loaded_path = None  # pygame.mixer.music に読み込んである曲のパス
+
+    def get_library_dir(self, folder_name="library_file"):
+        """実行ファイルと同じ階層にある指定フォルダの絶対パス（無ければ作成する）"""
         # library.py がある場所 (misc/) を取得
         current_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -20,17 +23,34 @@ class library:
         # フォルダが存在しない場合は自動で作成
         if not os.path.exists(target_dir):
             os.makedirs(target_dir)
-            return []
-            
-        # 作成した target_dir 内のMP3ファイルを検索
-        return glob.glob(os.path.join(target_dir, "*.mp3"))
+        return target_dir
+
+    def get_mp3_files(self, folder_name="library_file"): # デフォルトを library_file に変更
+        """実行ファイルと同じ階層にある指定フォルダからMP3を取得"""
+        # インデックスから MP3 の一覧を取得（変更のあったファイルだけ再解析される）
+        target_dir = self.get_library_dir(folder_name)
+        return get_library_index(target_dir).paths((".mp3",), base=target_dir)
+
+    def search_mp3_files(self, query, folder_name="library_file"):
+        """ファイル名・曲名・アーティスト・アルバムで絞り込んだMP3の一覧（ディスクは走査しない）"""
+        target_dir = self.get_library_dir(folder_name)
+        return get_library_index(target_dir).search(query, (".mp3",), base=target_dir)
+
+    def matches_query(self, file_name, query, folder_name="library_file"):
+        """ライブラリ内のファイル file_name が検索語 query に一致するか"""
+        return get_library_index(self.get_library_dir(folder_name)).matches(file_name, query)
 
     def play_music(self, file_path):
         """音楽を再生"""
         pygame.mixer.music.load(file_path)
+        library.loaded_path = file_path
         pygame.mixer.music.play()
-        sound = pygame.mixer.Sound(file_path)
-        return sound.get_length()
+        # フレームヘッダから長さを求める（全体をデコードしない）
+        duration = get_mp3_duration(file_path)
+        if duration is None:
+            # MP3 として解析できない場合のみ従来通りデコードして求める
+            duration = pygame.mixer.Sound(file_path).get_length()
+        return duration
 
     def stop_music(self):
         """音楽を停止"""
@@ -41,8 +61,19 @@ class library:
         return pygame.mixer.music.get_busy()
     
     def set_pos(self, file_path, sec):
-        """指定した秒数から再生を開始する"""
+        """
+        指定した秒数から再生する
+        読み込み済みの曲ならファイルを読み直さず、再生位置だけを変える
+        （get_pos() は再生を始めた時からの経過時間のままなので、位置は呼び出し側で管理する）
+        """
+        if library.loaded_path == file_path and pygame.mixer.music.get_busy():
+            try:
+                pygame.mixer.music.set_pos(sec)
+                return
+            except pygame.error:
+                pass  # 位置の変更に対応していない形式は読み直す
         pygame.mixer.music.load(file_path)
+        library.loaded_path = file_path
         # start引数に秒数を指定して再生
         pygame.mixer.music.play(start=sec)
 
@@ -0,0 +1,429 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from misc.audio_probe import probe_audio_many
+from misc.dir_watcher import DirEvent
+from misc.library_search import SearchIndex, build_search_index
+from misc.mp3_header import read_mp3_info, read_id3_tags
+from misc.seek_index import SEEK_INDEX_VERSION, SeekIndex, build_seek_index
+
+# インデックス対象の拡張子
+AUDIO_EXTENSIONS = (".mp3", ".mp4")
+
+# インデックスファイル名（ライブラリフォルダ内に置く）
+INDEX_FILENAME = ".library_index.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    duration REAL,
+    bit_rate INTEGER,
+    title TEXT,
+    artist TEXT,
+    album TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS seek_index (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    sample_rate INTEGER NOT NULL,
+    samples_per_frame INTEGER NOT NULL,
+    start_skip INTEGER NOT NULL,
+    total_samples INTEGER NOT NULL,
+    frame_count INTEGER NOT NULL,
+    step INTEGER NOT NULL,
+    audio_end INTEGER NOT NULL,
+    offsets BLOB NOT NULL
+);
+"""
+
+
+@dataclass
+class LibraryEntry:
+    """インデックス 1 件分（ファイル名はライブラリフォルダからの相対名）"""
+
+    name: str
+    size: int
+    mtime_ns: int
+    duration: Optional[float] = None
+    bit_rate: Optional[int] = None
+    title: Optional[str] = None
+    artist: Optional[str] = None
+    album: Optional[str] = None
+
+
+@dataclass
+class LibraryChanges:
+    """apply_events() で変わったファイル名（名前変更は removed と added の両方に入る）"""
+
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    modified: List[str] = field(default_factory=list)
+    rescanned: bool = False  # 取りこぼしがあり、フォルダ全体を調べ直した
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.modified or self.rescanned)
+
+
+def probe_entry(path: str, name: str, size: int, mtime_ns: int) -> LibraryEntry:
+    """ファイルのヘッダ・タグを読んでエントリを作る（音声はデコードしない）"""
+    entry = LibraryEntry(name=name, size=size, mtime_ns=mtime_ns)
+    if name.lower().endswith(".mp3"):
+        info = read_mp3_info(path)
+        # タグの無い VBR は長さが見積もりなので入れない（LibraryIndex がシーク表から求める）
+        if info is not None and not info.estimated:
+            entry.duration = info.duration
+            entry.bit_rate = info.bit_rate
+        tags = read_id3_tags(path)
+        entry.title = tags.get("title")
+        entry.artist = tags.get("artist")
+        entry.album = tags.get("album")
+    return entry
+
+
+class LibraryIndex:
+    """
+    ライブラリフォルダのメタデータを SQLite に保存しておくインデックス。
+    - scan() はフォルダの更新時刻が変わっていなければディレクトリを走査しない
+      （上書きされたファイルは scan(force=True) か LibraryWatcher の監視で拾う）
+    - 走査する場合も (サイズ, 更新時刻) が変わったファイルだけを再解析する
+    - MP3 のシーク表も同じファイルに保存する（seek_index() で必要になったときに作る）
+    - 検索用の索引はメモリ上だけに持ち、最初の search() で作った後はエントリの更新に合わせて直す
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        # シーク表はワーカースレッド（切り出し・波形）からも引くので、接続はロックで守って共有する
+        self._conn = sqlite3.connect(os.path.join(folder, INDEX_FILENAME), check_same_thread=False)
+        self._lock = threading.RLock()
+        # ジャーナルファイルを作るとフォルダの更新時刻が変わり、走査の省略判定が効かなくなる。
+        # インデックスは作り直せるキャッシュなのでジャーナルはメモリ上に置く。
+        self._conn.execute("PRAGMA journal_mode=MEMORY")
+        self._conn.executescript(_SCHEMA)
+        self._entries: Optional[Dict[str, LibraryEntry]] = None
+        self._sorted: Optional[List[LibraryEntry]] = None
+        self._search: Optional[SearchIndex] = None
+
+    def _load(self) -> Dict[str, LibraryEntry]:
+        if self._entries is None:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT name, size, mtime_ns, duration, bit_rate, title, artist, album FROM tracks"
+                ).fetchall()
+            self._entries = {row[0]: LibraryEntry(*row) for row in rows}
+        return self._entries
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def scan(self, force: bool = False) -> List[LibraryEntry]:
+        """
+        インデックスをフォルダの内容と同期し、全エントリを名前順で返す。
+        force=False の場合、フォルダ自体の更新時刻が前回と同じなら走査を省略する
+        （ファイルの追加・削除・リネームはフォルダの更新時刻を変えるため）。
+        既存ファイルをその場で上書きしてもフォルダの更新時刻は変わらないので、それを拾うのは
+        force=True（全ファイルの (サイズ, 更新時刻) を比べる）か、LibraryWatcher の監視に任せる。
+        """
+        entries = self._load()
+        try:
+            dir_mtime = str(os.stat(self.folder).st_mtime_ns)
+        except OSError:
+            return []
+
+        if force or dir_mtime != self._get_meta("dir_mtime_ns"):
+            self._sync(entries)
+            self._set_dir_mtime(dir_mtime)
+
+        return self.entries()
+
+    def _set_dir_mtime(self, dir_mtime: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('dir_mtime_ns', ?)",
+                (dir_mtime,),
+            )
+
+    def _sync(self, entries: Dict[str, LibraryEntry]) -> None:
+        seen = set()
+        changed: List[LibraryEntry] = []
+        with os.scandir(self.folder) as it:
+            for dir_entry in it:
+                name = dir_entry.name
+                if not name.lower().endswith(AUDIO_EXTENSIONS) or not dir_entry.is_file():
+                    continue
+                seen.add(name)
+                st = dir_entry.stat()
+                old = entries.get(name)
+                if old is not None and old.size == st.st_size and old.mtime_ns == st.st_mtime_ns:
+                    continue
+                changed.append(probe_entry(dir_entry.path, name, st.st_size, st.st_mtime_ns))
+
+        removed = [name for name in entries if name not in seen]
+        self._commit(entries, changed, removed)
+
+    def _commit(self, entries: Dict[str, LibraryEntry], changed: List[LibraryEntry], removed: List[str]) -> None:
+        """解析し直したエントリと消えたファイルをデータベースとメモリに反映する"""
+        # タグの無い VBR の MP3 はシーク表を作り、フレーム数から長さを求める（シーク表も一緒に保存する）
+        seek_rows = []
+        for e in changed:
+            if e.duration is None and e.name.lower().endswith(".mp3"):
+                index = build_seek_index(os.path.join(self.folder, e.name))
+                if index is not None:
+                    e.duration, e.bit_rate = index.duration, index.bit_rate
+                    seek_rows.append((e.name, e.size, e.mtime_ns, SEEK_INDEX_VERSION, *index.to_row()))
+
+        # mp3 以外（mp4 など）の長さは、変わったファイルの分だけ 1 回の ffmpeg でまとめて調べる
+        others = {os.path.join(self.folder, e.name): e for e in changed if e.duration is None}
+        if others:
+            for path, info in probe_audio_many(others).items():
+                if info is not None:
+                    others[path].duration = info.duration
+                    others[path].bit_rate = info.bit_rate
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (e.name, e.size, e.mtime_ns, e.duration, e.bit_rate, e.title, e.artist, e.album)
+                    for e in changed
+                ],
+            )
+            self._conn.executemany("DELETE FROM tracks WHERE name = ?", [(n,) for n in removed])
+            self._conn.executemany(
+                "DELETE FROM seek_index WHERE name = ?", [(n,) for n in removed] + [(e.name,) for e in changed]
+            )
+            self._conn.executemany(
+                "INSERT INTO seek_index VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", seek_rows
+            )
+
+        for e in changed:
+            entries[e.name] = e
+        for name in removed:
+            del entries[name]
+        if changed or removed:
+            self._sorted = None
+        if self._search is not None:
+            for e in changed:
+                self._search.add_entry(e)
+            for name in removed:
+                self._search.remove(name)
+
+    def apply_events(self, events: Iterable[DirEvent]) -> LibraryChanges:
+        """
+        フォルダの監視で届いた変化を、そのファイルの分だけインデックスに反映する（フォルダは走査しない）。
+        名前が変わっただけのファイルは解析し直さず、保存済みの情報とシーク表を引き継ぐ。
+        取りこぼし（"overflow"）が届いた場合だけフォルダ全体を走査し直す。
+        """
+        entries = self._load()
+        changes = LibraryChanges()
+        events = list(events)
+        if any(e.kind == "overflow" for e in events):
+            before = dict(entries)
+            self._sync(entries)
+            changes.added = sorted(entries.keys() - before.keys())
+            changes.removed = sorted(before.keys() - entries.keys())
+            changes.modified = sorted(n for n in entries.keys() & before.keys() if entries[n] is not before[n])
+            changes.rescanned = True
+        else:
+            check = []
+            for event in events:
+                if event.kind == "moved" and self._rename(entries, event.name, event.new_name):
+                    changes.removed.append(event.name)
+                    changes.added.append(event.new_name)
+                elif event.kind == "moved":
+                    check += [event.name, event.new_name]
+                else:
+                    check.append(event.name)
+            self._refresh_names(entries, dict.fromkeys(check), changes)
+
+        try:
+            self._set_dir_mtime(str(os.stat(self.folder).st_mtime_ns))
+        except OSError:
+            pass
+        if changes:
+            self._sorted = None
+        return changes
+
+    def _rename(self, entries: Dict[str, LibraryEntry], old: str, new: str) -> bool:
+        """old から new への名前変更を、解析し直さずに反映できれば反映して True"""
+        entry = entries.get(old)
+        if entry is None or new in entries or not new.lower().endswith(AUDIO_EXTENSIONS):
+            return False
+        try:
+            st = os.stat(os.path.join(self.folder, new))
+        except OSError:
+            return False
+        if (st.st_size, st.st_mtime_ns) != (entry.size, entry.mtime_ns):
+            return False
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE tracks SET name = ? WHERE name = ?", (new, old))
+            self._conn.execute("DELETE FROM seek_index WHERE name = ?", (new,))
+            self._conn.execute("UPDATE seek_index SET name = ? WHERE name = ?", (new, old))
+        del entries[old]
+        entries[new] = replace(entry, name=new)
+        if self._search is not None:
+            self._search.remove(old)
+            self._search.add_entry(entries[new])
+        return True
+
+    def _refresh_names(self, entries: Dict[str, LibraryEntry], names: Iterable[str], changes: LibraryChanges) -> None:
+        """names のファイルだけを調べ直し、変わっていたものを changes に記録する"""
+        changed: List[LibraryEntry] = []
+        removed: List[str] = []
+        for name in names:
+            if not name.lower().endswith(AUDIO_EXTENSIONS):
+                continue
+            path = os.path.join(self.folder, name)
+            try:
+                st = os.stat(path)
+                is_file = os.path.isfile(path)
+            except OSError:
+                is_file = False
+            old = entries.get(name)
+            if not is_file:
+                if old is not None:
+                    removed.append(name)
+                    changes.removed.append(name)
+                continue
+            if old is not None and old.size == st.st_size and old.mtime_ns == st.st_mtime_ns:
+                continue
+            changed.append(probe_entry(path, name, st.st_size, st.st_mtime_ns))
+            (changes.modified if old is not None else changes.added).append(name)
+        if changed or removed:
+            self._commit(entries, changed, removed)
+
+    def entries(self) -> List[LibraryEntry]:
+        """インデックス済みのエントリを名前順で返す（ディスクは走査しない）"""
+        if self._sorted is None:
+            entries = self._load()
+            self._sorted = [entries[name] for name in sorted(entries)]
+        return list(self._sorted)
+
+    def get(self, name: str) -> Optional[LibraryEntry]:
+        return self._load().get(name)
+
+    def seek_index(self, name: str) -> Optional[SeekIndex]:
+        """
+        ライブラリ内のファイル name のシーク表を返す。
+        保存済みで (サイズ, 更新時刻) が変わっていなければそれを使い、無ければ作って保存する。
+        MP3 として読めないファイルは None。
+        """
+        path = os.path.join(self.folder, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, version, sample_rate, samples_per_frame, start_skip, total_samples, "
+                "frame_count, step, audio_end, offsets FROM seek_index WHERE name = ?",
+                (name,),
+            ).fetchone()
+        if row is not None and row[:3] == (st.st_size, st.st_mtime_ns, SEEK_INDEX_VERSION):
+            return SeekIndex.from_row(path, row[3:])
+
+        index = build_seek_index(path)
+        if index is not None:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO seek_index VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (name, st.st_size, st.st_mtime_ns, SEEK_INDEX_VERSION, *index.to_row()),
+                )
+        return index
+
+    def search(self, query: str, extensions=AUDIO_EXTENSIONS, base: Optional[str] = None) -> List[str]:
+        """
+        ファイル名・曲名・アーティスト・アルバムに query の語（空白区切り）をすべて含むファイルのパスを名前順で返す。
+        ディスクは走査しない（最新にするには先に scan() / paths() を呼ぶ）。
+        """
+        base = self.folder if base is None else base
+        names = self._search_index().search(query)
+        return [os.path.join(base, name) for name in names if name.lower().endswith(extensions)]
+
+    def matches(self, name: str, query: str) -> bool:
+        """ファイル name が query に一致するか（1 件だけ確かめる）"""
+        return self._search_index().matches(name, query)
+
+    def _search_index(self) -> SearchIndex:
+        if self._search is None:
+            self._search = build_search_index(self._load().values())
+        return self._search
+
+    def paths(self, extensions=AUDIO_EXTENSIONS, base: Optional[str] = None, force: bool = False) -> List[str]:
+        """
+        指定拡張子のファイルパスを名前順で返す。
+        base を指定するとそのフォルダ表記（相対/絶対）で結合する。
+        """
+        base = self.folder if base is None else base
+        return [
+            os.path.join(base, e.name)
+            for e in self.scan(force)
+            if e.name.lower().endswith(extensions)
+        ]
+
+
+_indexes: Dict[str, LibraryIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_library_index(folder: str) -> LibraryIndex:
+    """フォルダごとに 1 つのインデックスを共有して返す"""
+    key = os.path.abspath(folder)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = LibraryIndex(folder)
+            _indexes[key] = index
+    return index
+
+
+_SEEK_CACHE_SIZE = 64
+_seek_cache: "OrderedDict[str, Tuple[tuple, Optional[SeekIndex]]]" = OrderedDict()
+_seek_lock = threading.Lock()
+
+
+def get_seek_index(path) -> Optional[SeekIndex]:
+    """
+    MP3 ファイルのシーク表を返す（MP3 でなければ None）。
+    ライブラリのインデックスがあるフォルダのファイルなら、シーク表もそこに保存して使い回す。
+    それ以外のファイルはメモリ上にだけ覚えておく。どのスレッドから呼んでもよい。
+    """
+    path = os.path.abspath(os.fspath(path))
+    if not path.lower().endswith(".mp3"):
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    stamp = (st.st_size, st.st_mtime_ns)
+    with _seek_lock:
+        cached = _seek_cache.get(path)
+        if cached is not None and cached[0] == stamp:
+            _seek_cache.move_to_end(path)
+            return cached[1]
+
+    folder, name = os.path.split(path)
+    if os.path.exists(os.path.join(folder, INDEX_FILENAME)):
+        index = get_library_index(folder).seek_index(name)
+    else:
+        index = build_seek_index(path)
+
+    with _seek_lock:
+        _seek_cache[path] = (stamp, index)
+        while len(_seek_cache) > _SEEK_CACHE_SIZE:
+            _seek_cache.popitem(last=False)
+    return index
@@ -0,0 +1,215 @@
+import argparse
+import os
+import random
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from itertools import compress, repeat
+from typing import Dict, Iterable, List, Optional
+
+# ライブラリの検索用の索引（メモリ上だけに持つ）
+# - ファイル名（拡張子を除く）と ID3 タグ（曲名・アーティスト・アルバム）を 1 つの文字列にまとめ、
+#   1 文字と 2 文字の n-gram ごとに、それを含む曲の番号を array に並べておく
+# - 検索は語ごとに一番少ない n-gram の候補だけを調べ、部分一致を確かめる（全曲をなめない）
+# - 番号は名前順に振るので、検索結果は番号順に取り出せばほぼ名前順になる
+# - 削除は番号に印を付けるだけにし、削除済みが増えたら作り直す（このとき番号を名前順に振り直す）
+# 日本語の曲名でも 1〜2 文字で検索できるよう、単語分割ではなく文字の n-gram を使う
+#
+# 使い方（速度の確認）:
+#   python -m misc.library_search                    # 10 万曲の架空のライブラリで検索時間を測る
+#   python -m misc.library_search -n 20000 love 桜   # 曲数と検索語を指定
+
+# 削除済みの番号がこれを超え、かつ残りの曲数より多くなったら作り直す
+_COMPACT_MIN = 1024
+# 検索結果のうち後から足した曲がこれ以下なら 1 つずつ差し込み、多ければまとめて並べ替える
+_INSORT_MAX = 64
+
+
+def normalize(text: str) -> str:
+    """検索用に表記を揃える（全角・半角と大文字・小文字を区別しない）"""
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def _grams(text: str) -> set:
+    """text に含まれる 1 文字と 2 文字の並び（改行で区切った項目をまたぐものは除く）"""
+    grams = set()
+    for part in text.split("\n"):
+        grams.update(part)
+        grams.update(part[i:i + 2] for i in range(len(part) - 1))
+    return grams
+
+
+def _document(key: str, fields: Iterable[Optional[str]]) -> str:
+    """検索対象の文字列（ファイル名から拡張子を除いたものとタグを改行でつなぐ）"""
+    return normalize("\n".join([os.path.splitext(key)[0], *(f for f in fields if f)]))
+
+
+class SearchIndex:
+    """
+    ファイル名とタグの部分一致検索（複数の語は空白区切りで AND）。
+    キーはライブラリフォルダからの相対ファイル名で、結果は名前順に返す。
+    """
+
+    def __init__(self):
+        self._keys: List[Optional[str]] = []  # 番号 → ファイル名（削除済みは None）
+        self._texts: List[str] = []  # 番号 → 検索対象の文字列（normalize 済み）
+        self._ids: Dict[str, int] = {}  # ファイル名 → 番号
+        self._postings: Dict[str, array] = {}  # n-gram → それを含む番号（昇順）
+        self._sorted_keys: List[str] = []  # 名前順のファイル名
+        self._ordered = 0  # この番号より前は名前順に振ってある（後から足した曲はその後ろに付く）
+        self._dead = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._ids
+
+    # ===== 更新 =====
+
+    def add(self, key: str, *fields: Optional[str]) -> None:
+        """key の曲を fields（タグなど。None は無視）と一緒に登録する（登録済みなら入れ替える）"""
+        if key in self._ids:
+            self._drop(key)
+        else:
+            insort(self._sorted_keys, key)
+        self._insert(key, _document(key, fields))
+
+    def _insert(self, key: str, text: str) -> None:
+        doc = len(self._keys)
+        self._keys.append(key)
+        self._texts.append(text)
+        self._ids[key] = doc
+        for gram in _grams(text):
+            posting = self._postings.get(gram)
+            if posting is None:
+                posting = self._postings[gram] = array("I")
+            posting.append(doc)
+
+    def add_entry(self, entry) -> None:
+        """LibraryEntry（name / title / artist / album を持つもの）を登録する"""
+        self.add(entry.name, entry.title, entry.artist, entry.album)
+
+    def remove(self, key: str) -> None:
+        if key not in self._ids:
+            return
+        self._drop(key)
+        index = bisect_left(self._sorted_keys, key)
+        del self._sorted_keys[index]
+        if self._dead > _COMPACT_MIN and self._dead > len(self._ids):
+            self._compact()
+
+    def _drop(self, key: str) -> None:
+        doc = self._ids.pop(key)
+        self._keys[doc] = None
+        self._texts[doc] = ""
+        self._dead += 1
+
+    def _compact(self) -> None:
+        """削除済みの番号を詰めて作り直す"""
+        live = [(key, self._texts[self._ids[key]]) for key in self._sorted_keys]
+        self._keys, self._texts, self._ids, self._postings = [], [], {}, {}
+        self._dead = 0
+        for key, text in live:
+            self._insert(key, text)
+        self._ordered = len(self._keys)
+
+    # ===== 検索 =====
+
+    def search(self, query: str) -> List[str]:
+        """query の語をすべて含む曲のファイル名を名前順で返す（空の query は全曲）"""
+        terms = normalize(query).split()
+        if not terms:
+            return list(self._sorted_keys)
+
+        # 一番候補の少ない n-gram を選ぶ（どの語のどの n-gram でもよい）
+        smallest: Optional[array] = None
+        covered = None  # 1〜2 文字の語は n-gram そのものなので、候補がその語の答えと一致する
+        for term in dict.fromkeys(terms):
+            grams = [term] if len(term) <= 2 else [term[i:i + 2] for i in range(len(term) - 1)]
+            for gram in grams:
+                posting = self._postings.get(gram)
+                if posting is None:
+                    return []
+                if smallest is None or len(posting) < len(smallest):
+                    smallest = posting
+                    covered = term if len(term) <= 2 else None
+
+        if len(smallest) == len(self._keys) and len(terms) == 1 and covered is not None:
+            return list(self._sorted_keys)  # 全曲に含まれる文字（例: 1 文字目の入力）
+
+        # 候補を番号順に取り出し、残りの語で部分一致を確かめる（map / compress で回し、Python のループを通さない）
+        docs = list(smallest)
+        texts = self._texts
+        for term in dict.fromkeys(terms):
+            if term != covered:
+                hits = map(str.__contains__, map(texts.__getitem__, docs), repeat(term))
+                docs = list(compress(docs, hits))
+        # 名前順に振った番号の範囲の分はそのまま並んでいる。後から足した曲の分だけ差し込む
+        split = bisect_left(docs, self._ordered)
+        matched = list(filter(None, map(self._keys.__getitem__, docs[:split])))  # 削除済み（None）を除く
+        added = list(filter(None, map(self._keys.__getitem__, docs[split:])))
+        if len(added) <= _INSORT_MAX:
+            for key in added:
+                insort(matched, key)
+        else:
+            matched += added
+            matched.sort()
+        return matched
+
+    def matches(self, key: str, query: str) -> bool:
+        """key の曲が query に一致するか（1 曲だけ確かめる）"""
+        doc = self._ids.get(key)
+        if doc is None:
+            return False
+        text = self._texts[doc]
+        return all(term in text for term in normalize(query).split())
+
+
+def build_search_index(entries: Iterable) -> SearchIndex:
+    """LibraryEntry の並びから索引を作る（番号は名前順に振る）"""
+    index = SearchIndex()
+    for entry in sorted(entries, key=lambda e: e.name):
+        if entry.name not in index:
+            index._insert(entry.name, _document(entry.name, (entry.title, entry.artist, entry.album)))
+    index._sorted_keys = list(index._ids)
+    index._ordered = len(index._keys)
+    return index
+
+
+_BENCH_WORDS = ("love", "night", "桜", "夜空", "drive", "blue", "サクラ", "summer", "rain", "dream",
+                "song", "star", "heart", "light", "東京", "walk", "fire", "time", "moon", "ＡＢＣ")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ライブラリ検索の速度確認（架空の曲名とタグで索引を作る）")
+    parser.add_argument("queries", nargs="*", default=["l", "lo", "love", "love night", "桜", "artist42 moon", "zzz"])
+    parser.add_argument("-n", "--tracks", type=int, default=100_000)
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="各検索の繰り返し回数（最速値を採用）")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    entries = []
+    for i in range(args.tracks):
+        title = " ".join(rng.sample(_BENCH_WORDS, 3))
+        entries.append(argparse.Namespace(
+            name=f"{i:06d}_{title.replace(' ', '_')}.mp3", title=title,
+            artist=f"Artist{rng.randrange(500)}", album=f"Album {rng.randrange(3000)}",
+        ))
+
+    start = time.perf_counter()
+    index = build_search_index(entries)
+    print(f"build: {time.perf_counter() - start:.2f}s ({len(index)} tracks)")
+    print(f"{'query':<16} {'hits':>7} {'time':>9}")
+    for query in args.queries:
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            hits = index.search(query)
+            best = min(best, time.perf_counter() - start)
+        print(f"{query:<16} {len(hits):>7} {best * 1000:>7.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import logging
+import os
+import queue
+import threading
+import tkinter as tk
+from typing import Callable, Dict, List, Optional
+
+from misc.dir_watcher import DirEvent, DirWatcher, create_watcher
+from misc.library_index import LibraryChanges, LibraryIndex, get_library_index
+
+
+logger = logging.getLogger(__name__)
+
+# 監視スレッドが変化をキューに積んだことを Tk に知らせる仮想イベント
+CHANGED_EVENT = "<<LibraryFolderChanged>>"
+
+
+class LibraryWatcher:
+    """
+    ライブラリフォルダを監視し、変わったファイルの分だけインデックスを更新して購読者に知らせる。
+    - 監視はバックグラウンドのスレッドで行い（inotify、使えなければ走査）、届いた変化はキューで受け渡す
+    - 監視スレッドは変化を積んだときだけ仮想イベントで Tk を起こす（Tk 側はタイマーで見に行かない）
+    - インデックスの更新と通知は Tk のメインスレッドで行う
+    - 購読者がいる間だけ監視する（ページが破棄されると購読は自動で外れる）
+    """
+
+    def __init__(self, tk_root, folder: str):
+        self._root = tk_root
+        self.folder = folder
+        self.index: LibraryIndex = get_library_index(folder)
+        self._queue: "queue.Queue[list]" = queue.Queue()
+        self._subscribers: Dict[int, Callable[[LibraryChanges], None]] = {}
+        self._next_token = 0
+        self._watcher: Optional[DirWatcher] = None
+        # Tk を起こす仮想イベントを送ってまだ取り出していない間 True（イベントを積み上げない）
+        self._wake_pending = False
+        self._wake_lock = threading.Lock()
+        self._root.bind(CHANGED_EVENT, lambda e: self._drain(), add="+")
+
+    def subscribe(self, callback: Callable[[LibraryChanges], None], owner=None) -> int:
+        """
+        変化の通知を購読し、購読解除用の番号を返す。callback には LibraryChanges が渡される。
+        owner にウィジェットを渡すと、そのウィジェットが破棄されたときに自動で購読を外す。
+        """
+        token = self._next_token
+        self._next_token += 1
+        self._subscribers[token] = callback
+        if owner is not None:
+            owner.bind("<Destroy>", lambda e, t=token: e.widget is owner and self.unsubscribe(t), add="+")
+        self._start()
+        return token
+
+    def unsubscribe(self, token: int) -> None:
+        self._subscribers.pop(token, None)
+        if not self._subscribers:
+            self._stop()
+
+    def _start(self) -> None:
+        if self._watcher is not None:
+            return
+        # 監視を始めてから、それまでの変化を 1 回だけ走査して取り込む。
+        # 上書きされたファイルはフォルダの更新時刻を変えないので、ファイルごとに (サイズ, 更新時刻) を比べる
+        self._watcher = create_watcher(self.folder, self._on_events)
+        self._watcher.start()
+        self.index.scan(force=True)
+
+    def _stop(self) -> None:
+        if self._watcher is None:
+            return
+        self._watcher.stop()
+        self._watcher = None
+
+    def _on_events(self, events: List[DirEvent]) -> None:
+        """監視スレッドから呼ばれる。変化を積み、Tk がまだ起こされていなければ起こす"""
+        self._queue.put(events)
+        with self._wake_lock:
+            if self._wake_pending:
+                return
+            self._wake_pending = True
+        try:
+            # event_generate は別スレッドから呼んでもメインスレッドで処理される（スレッド対応の Tcl の場合）
+            self._root.event_generate(CHANGED_EVENT, when="tail")
+        except (RuntimeError, tk.TclError):
+            # アプリの終了中など。次に変化が届いたときにもう一度起こす
+            with self._wake_lock:
+                self._wake_pending = False
+
+    def _drain(self) -> None:
+        """監視スレッドから届いた変化をまとめてインデックスに反映し、購読者に知らせる"""
+        # 先に印を外してから取り出す（取り出している間に積まれた分は、もう一度起こされて拾う）
+        with self._wake_lock:
+            self._wake_pending = False
+        events = []
+        while True:
+            try:
+                events.extend(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not events:
+            return
+        changes = self.index.apply_events(events)
+        if not changes:
+            return
+        for callback in list(self._subscribers.values()):
+            try:
+                callback(changes)
+            except Exception:
+                logger.exception("library change handler failed")
+
+
+_watchers: Dict[str, LibraryWatcher] = {}
+
+
+def get_library_watcher(widget, folder: str) -> LibraryWatcher:
+    """フォルダごとに 1 つの監視を共有して返す（最初の呼び出しで widget のルートに作る）"""
+    key = os.path.abspath(folder)
+    watcher = _watchers.get(key)
+    if watcher is None:
+        os.makedirs(folder, exist_ok=True)
+        watcher = LibraryWatcher(widget._root(), folder)
+        _watchers[key] = watcher
+    return watcher
@@ -0,0 +1,448 @@
+import itertools
+import os
+import struct
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+# MPEG オーディオのビットレート表 (kbps)
+# キー: (MPEG1 かどうか, レイヤー)
+_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+# サンプリング周波数表 (Hz)  キー: バージョンビット
+_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG1
+    2: [22050, 24000, 16000],  # MPEG2
+    0: [11025, 12000, 8000],   # MPEG2.5
+}
+
+# デコーダ側の遅延サンプル数（LAME タグのエンコーダ遅延に加算される）
+DECODER_DELAY = 529
+
+# LAME 拡張タグとして扱うエンコーダ名の先頭 4 バイト
+LAME_TAG_ENCODERS = (b"LAME", b"Lavc", b"Lavf", b"L3.9", b"GOGO")
+
+# 先頭フレームを探す範囲（ID3 タグの後ろにゴミがあっても許容する）
+_SYNC_SEARCH_BYTES = 64 * 1024
+
+_CACHE_SIZE = 1024
+
+# タグの無い MP3 が CBR かどうかを確かめるのに見る、先頭のフレーム数と読む量
+_VBR_PROBE_FRAMES = 32
+_VBR_PROBE_BYTES = 64 * 1024
+
+_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+@dataclass
+class FrameHeader:
+    """MPEG オーディオフレームヘッダ 1 つ分の情報"""
+
+    mpeg1: bool
+    layer: int
+    bit_rate: int  # bps
+    sample_rate: int
+    padding: bool
+    channels: int
+    has_crc: bool
+    frame_length: int  # バイト
+    samples_per_frame: int
+
+
+@dataclass
+class InfoTag:
+    """先頭フレームの Xing/Info・VBRI ヘッダ（と LAME 拡張タグ）の内容"""
+
+    frames: int
+    vbr: bool
+    has_lame: bool = False  # LAME 拡張タグがあれば、デコーダは遅延 + DECODER_DELAY を捨てる
+    encoder_delay: int = 0
+    encoder_padding: int = 0
+
+
+@dataclass
+class Mp3Info:
+    """MP3 ファイルのヘッダから読み取った情報"""
+
+    duration: float  # 秒
+    bit_rate: int  # bps（VBR の場合は平均値）
+    sample_rate: int
+    channels: int
+    vbr: bool
+    audio_offset: int  # 先頭フレームのバイト位置
+    encoder_delay: int = 0
+    encoder_padding: int = 0
+    # Xing/VBRI タグの無い VBR で、長さ・ビットレートが先頭フレームからの見積もりであること。
+    # 正確な長さはシーク表（misc.seek_index）のフレーム数から求める
+    estimated: bool = False
+
+
+def parse_frame_header(data: bytes) -> Optional[FrameHeader]:
+    """
+    4 バイトのフレームヘッダを解析する。
+    有効なヘッダでなければ None を返す。
+    """
+    if len(data) < 4:
+        return None
+
+    b1, b2, b3, b4 = data[0], data[1], data[2], data[3]
+    if b1 != 0xFF or (b2 & 0xE0) != 0xE0:
+        return None
+
+    version_bits = (b2 >> 3) & 0x03
+    layer_bits = (b2 >> 1) & 0x03
+    if version_bits == 1 or layer_bits == 0:
+        return None
+
+    mpeg1 = version_bits == 3
+    layer = 4 - layer_bits
+    has_crc = (b2 & 0x01) == 0
+
+    bitrate_index = (b3 >> 4) & 0x0F
+    sample_rate_index = (b3 >> 2) & 0x03
+    # 0 はフリーフォーマット、15 は不正値。どちらも長さが決まらないので扱わない
+    if bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    bit_rate = _BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version_bits][sample_rate_index]
+    padding = bool((b3 >> 1) & 0x01)
+    channels = 1 if ((b4 >> 6) & 0x03) == 3 else 2
+
+    if layer == 1:
+        samples_per_frame = 384
+        frame_length = (12 * bit_rate // sample_rate + padding) * 4
+    else:
+        samples_per_frame = 1152 if (layer == 2 or mpeg1) else 576
+        frame_length = samples_per_frame // 8 * bit_rate // sample_rate + padding
+
+    return FrameHeader(
+        mpeg1=mpeg1,
+        layer=layer,
+        bit_rate=bit_rate,
+        sample_rate=sample_rate,
+        padding=padding,
+        channels=channels,
+        has_crc=has_crc,
+        frame_length=frame_length,
+        samples_per_frame=samples_per_frame,
+    )
+
+
+def id3v2_size(head: bytes) -> int:
+    """先頭の ID3v2 タグの長さ（ヘッダ込み）を返す。タグが無ければ 0。"""
+    if len(head) < 10 or head[:3] != b"ID3":
+        return 0
+    size = 0
+    for b in head[6:10]:
+        size = (size << 7) | (b & 0x7F)
+    footer = 10 if head[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def find_first_frame(f, start: int = 0) -> Optional[tuple]:
+    """
+    ファイルオブジェクト f の start 以降で最初の有効なフレームを探す。
+    連続する 2 フレームのヘッダが整合する位置だけを採用し、誤同期を避ける。
+    (オフセット, FrameHeader) を返す。見つからなければ None。
+    """
+    f.seek(start)
+    buf = f.read(_SYNC_SEARCH_BYTES)
+    pos = buf.find(b"\xff")
+    while 0 <= pos < len(buf) - 4:
+        header = parse_frame_header(buf[pos:pos + 4])
+        if header is not None:
+            next_pos = pos + header.frame_length
+            if next_pos + 4 <= len(buf):
+                nxt = parse_frame_header(buf[next_pos:next_pos + 4])
+                if nxt is not None and nxt.sample_rate == header.sample_rate and nxt.layer == header.layer:
+                    return start + pos, header
+            else:
+                # バッファ末尾のフレームは次を確かめられないのでそのまま採用
+                return start + pos, header
+        pos = buf.find(b"\xff", pos + 1)
+    return None
+
+
+def iter_frames(f, start: int, end: int, chunk_size: int = 1024 * 1024):
+    """
+    ファイルオブジェクト f の start から連続するフレームを (オフセット, FrameHeader) で返す。
+    ヘッダだけを見て次のフレームへ進む（音声はデコードしない）。end か不正なヘッダで止まる。
+    """
+    for pos, header, _head in iter_frame_heads(f, start, end, 4, chunk_size):
+        yield pos, header
+
+
+def iter_frame_heads(f, start: int, end: int, head_size: int, chunk_size: int = 1024 * 1024):
+    """
+    iter_frames と同じだが、各フレームの先頭 head_size バイト（ファイル末尾では短いことがある）も
+    (オフセット, FrameHeader, 先頭のバイト列) で返す。CRC やサイドインフォの頭を見たいとき用。
+    """
+    pos = start
+    buf = b""
+    buf_start = start
+    while pos + 4 <= end:
+        if pos + min(head_size, end - pos) > buf_start + len(buf):
+            f.seek(pos)
+            buf = f.read(min(max(chunk_size, head_size), end - pos))
+            buf_start = pos
+            if len(buf) < 4:
+                return
+        rel = pos - buf_start
+        header = parse_frame_header(buf[rel:rel + 4])
+        if header is None or pos + header.frame_length > end:
+            return
+        yield pos, header, buf[rel:rel + head_size]
+        pos += header.frame_length
+
+
+def side_info_length(header: FrameHeader) -> int:
+    """フレームヘッダ（と CRC）の後ろに続くサイドインフォのバイト数"""
+    if header.mpeg1:
+        return 17 if header.channels == 1 else 32
+    return 9 if header.channels == 1 else 17
+
+
+def read_info_tag(frame: bytes, header: FrameHeader) -> Optional[InfoTag]:
+    """
+    先頭フレーム内の Xing/Info または VBRI ヘッダを読む。
+    無ければ None を返す。
+    """
+    xing_offset = 4 + side_info_length(header)
+    tag = frame[xing_offset:xing_offset + 4]
+    if tag in (b"Xing", b"Info") and len(frame) >= xing_offset + 8:
+        flags = struct.unpack(">I", frame[xing_offset + 4:xing_offset + 8])[0]
+        pos = xing_offset + 8
+        frames = None
+        if flags & 0x01:
+            frames = struct.unpack(">I", frame[pos:pos + 4])[0]
+            pos += 4
+        if flags & 0x02:
+            pos += 4
+        if flags & 0x04:
+            pos += 100
+        if flags & 0x08:
+            pos += 4
+        if frames is None:
+            return None
+
+        info = InfoTag(frames=frames, vbr=tag == b"Xing")
+        # LAME 拡張タグ: エンコーダ名 9 バイトの 21 バイト後に遅延/パディングが 12bit ずつ入る
+        lame = frame[pos:pos + 24]
+        if len(lame) == 24 and lame[:4] in LAME_TAG_ENCODERS:
+            raw = lame[21:24]
+            info.has_lame = True
+            info.encoder_delay = (raw[0] << 4) | (raw[1] >> 4)
+            info.encoder_padding = ((raw[1] & 0x0F) << 8) | raw[2]
+        return info
+
+    # VBRI ヘッダはサイドインフォに関係なく 32 バイト目に置かれる
+    if frame[36:40] == b"VBRI" and len(frame) >= 54:
+        frames = struct.unpack(">I", frame[50:54])[0]
+        return InfoTag(frames=frames, vbr=True)
+
+    return None
+
+
+def _parse_file(file_path: str, file_size: int) -> Optional[Mp3Info]:
+    with open(file_path, "rb") as f:
+        offset = id3v2_size(f.read(10))
+        found = find_first_frame(f, offset)
+        if found is None:
+            return None
+        audio_offset, header = found
+
+        f.seek(audio_offset)
+        first_frame = f.read(max(header.frame_length, 192))
+
+        # 末尾の ID3v1 タグはオーディオデータに含めない
+        audio_end = file_size
+        if file_size >= 128:
+            f.seek(file_size - 128)
+            if f.read(3) == b"TAG":
+                audio_end -= 128
+
+        tag = read_info_tag(first_frame, header)
+        if tag is None:
+            return _estimate_untagged(f, header, audio_offset, audio_end)
+
+    frames, vbr, delay, padding = tag.frames, tag.vbr, tag.encoder_delay, tag.encoder_padding
+    total_samples = frames * header.samples_per_frame
+    if delay or padding:
+        total_samples -= delay + padding
+    duration = max(total_samples, 0) / header.sample_rate
+    # Xing/Info フレーム自体は音声を含まないので平均ビットレートから除く
+    audio_bytes = audio_end - audio_offset - header.frame_length
+    bit_rate = int(audio_bytes * 8 / duration) if duration > 0 else header.bit_rate
+    if not vbr:
+        bit_rate = header.bit_rate
+    return Mp3Info(
+        duration=duration,
+        bit_rate=bit_rate,
+        sample_rate=header.sample_rate,
+        channels=header.channels,
+        vbr=vbr,
+        audio_offset=audio_offset,
+        encoder_delay=delay,
+        encoder_padding=padding,
+    )
+
+
+def _estimate_untagged(f, first: FrameHeader, audio_offset: int, audio_end: int) -> Mp3Info:
+    """
+    Xing/Info・VBRI タグが無いファイルの長さをファイルサイズから求める（ファイル全体は読まない）。
+    先頭の _VBR_PROBE_FRAMES フレームのビットレートが揃っていれば CBR とみなす。
+    揃っていなければ VBR なので、それらの平均ビットレートで見積もり estimated を立てる。
+    """
+    sizes = 0
+    samples = 0
+    vbr = False
+    for _pos, header in itertools.islice(iter_frames(f, audio_offset, audio_end, _VBR_PROBE_BYTES), _VBR_PROBE_FRAMES):
+        sizes += header.frame_length
+        samples += header.samples_per_frame
+        vbr = vbr or header.bit_rate != first.bit_rate
+    bit_rate = int(sizes * 8 * first.sample_rate / samples) if vbr else first.bit_rate
+    return Mp3Info(
+        duration=(audio_end - audio_offset) * 8 / bit_rate,
+        bit_rate=bit_rate,
+        sample_rate=first.sample_rate,
+        channels=first.channels,
+        vbr=vbr,
+        audio_offset=audio_offset,
+        estimated=vbr,
+    )
+
+
+def read_mp3_info(file_path) -> Optional[Mp3Info]:
+    """
+    MP3 のフレームヘッダ / Xing・VBRI タグだけを読んで情報を返す（音声はデコードしない）。
+    結果は (サイズ, 更新時刻) が変わらない限りメモリ上にキャッシュする。
+    解析できない場合は None を返す。
+    """
+    file_path = os.fspath(file_path)
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+
+    stamp = (st.st_size, st.st_mtime_ns)
+    cached = _cache.get(file_path)
+    if cached is not None and cached[0] == stamp:
+        _cache.move_to_end(file_path)
+        return cached[1]
+
+    try:
+        info = _parse_file(file_path, st.st_size)
+    except OSError:
+        return None
+
+    _cache[file_path] = (stamp, info)
+    if len(_cache) > _CACHE_SIZE:
+        _cache.popitem(last=False)
+    return info
+
+
+def get_mp3_duration(file_path) -> Optional[float]:
+    """MP3 の長さ（秒）を返す。解析できない場合は None。"""
+    info = read_mp3_info(file_path)
+    if info is None:
+        return None
+    return info.duration
+
+
+# ID3 タグのフレーム ID → キー名
+_ID3_TEXT_FRAMES = {
+    b"TIT2": "title", b"TPE1": "artist", b"TALB": "album",
+    b"TT2": "title", b"TP1": "artist", b"TAL": "album",
+}
+
+
+def _decode_id3_text(data: bytes) -> str:
+    if not data:
+        return ""
+    encoding, body = data[0], data[1:]
+    try:
+        if encoding == 1:
+            text = body.decode("utf-16")
+        elif encoding == 2:
+            text = body.decode("utf-16-be")
+        elif encoding == 3:
+            text = body.decode("utf-8")
+        else:
+            text = body.decode("latin-1")
+    except UnicodeDecodeError:
+        return ""
+    return text.split("\x00", 1)[0].strip()
+
+
+def _parse_id3v2(tag: bytes) -> dict:
+    tags = {}
+    major = tag[3]
+    pos = 10
+    # 拡張ヘッダは読み飛ばす
+    if tag[5] & 0x40 and len(tag) >= 14:
+        if major == 4:
+            ext = 0
+            for b in tag[10:14]:
+                ext = (ext << 7) | (b & 0x7F)
+            pos += ext
+        else:
+            pos += 4 + struct.unpack(">I", tag[10:14])[0]
+
+    id_len, header_len = (3, 6) if major == 2 else (4, 10)
+    while pos + header_len <= len(tag):
+        frame_id = tag[pos:pos + id_len]
+        if not frame_id.strip(b"\x00"):
+            break  # パディング領域
+        raw_size = tag[pos + id_len:pos + header_len - (0 if major == 2 else 2)]
+        if major == 4:
+            size = 0
+            for b in raw_size:
+                size = (size << 7) | (b & 0x7F)
+        else:
+            size = int.from_bytes(raw_size, "big")
+        body = tag[pos + header_len:pos + header_len + size]
+        key = _ID3_TEXT_FRAMES.get(frame_id)
+        if key and key not in tags:
+            text = _decode_id3_text(body)
+            if text:
+                tags[key] = text
+        pos += header_len + size
+    return tags
+
+
+def read_id3_tags(file_path) -> dict:
+    """
+    ID3v2（無ければ ID3v1）からタイトル・アーティスト・アルバムを読む。
+    {"title": ..., "artist": ..., "album": ...} のうち見つかったものだけを返す。
+    """
+    try:
+        with open(file_path, "rb") as f:
+            head = f.read(10)
+            size = id3v2_size(head)
+            if size:
+                return _parse_id3v2(head + f.read(size - 10))
+
+            f.seek(0, os.SEEK_END)
+            if f.tell() < 128:
+                return {}
+            f.seek(-128, os.SEEK_END)
+            v1 = f.read(128)
+    except OSError:
+        return {}
+
+    if v1[:3] != b"TAG":
+        return {}
+    tags = {}
+    for key, start, end in (("title", 3, 33), ("artist", 33, 63), ("album", 63, 93)):
+        text = v1[start:end].split(b"\x00", 1)[0].decode("latin-1").strip()
+        if text:
+            tags[key] = text
+    return tags
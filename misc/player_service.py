@@ -0,0 +1,335 @@
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+import pygame
+
+from misc.audio_probe import probe_audio
+from misc.library import library
+from misc.mp3_header import get_mp3_duration
+
+
+logger = logging.getLogger(__name__)
+
+# 曲の終わりの予定時刻から、どれだけ遅れて切り替わりを確かめるか（ミリ秒）
+END_MARGIN_MS = 60
+# 長さが分からない曲の終わりを確かめる間隔（ミリ秒）
+UNKNOWN_DURATION_CHECK_MS = 1000
+# "position" の購読者がいるときに再生位置を通知する間隔（ミリ秒）
+POSITION_INTERVAL_MS = 200
+
+# 通知するイベントとコールバックの引数
+# - "track_started": (index, path)         曲の再生を始めた（次の曲に切り替わったときも）
+# - "state"        : (state,)              "playing" / "paused" / "stopped" のどれかになった
+# - "position"     : (position, duration)  再生中に POSITION_INTERVAL_MS ごと（秒。長さが不明なら None）
+# - "finished"     : ()                    最後の曲まで再生し終えた（stop() では呼ばれない）
+# - "error"        : (path, exception)     再生できない曲を飛ばした
+EVENTS = ("track_started", "state", "position", "finished", "error")
+
+
+class PlayerService:
+    """
+    pygame.mixer.music を一手に引き受ける再生サービス（アプリ全体で 1 つ）。
+    - ページは subscribe() でイベントを受け取り、ページが破棄されると購読は自動で外れる
+    - タイマーは再生中だけ動く（曲の終わりに 1 回と、位置の購読者がいる間の位置通知だけ）
+    - 連続再生では次の曲を pygame.mixer.music.queue で先読みし、曲間の無音なしで切り替える
+    コールバックはすべて Tk のメインスレッドで呼ばれる。
+    """
+
+    def __init__(self, tk_root):
+        self._root = tk_root
+        self._subscribers: Dict[str, Dict[int, Callable]] = {event: {} for event in EVENTS}
+        self._next_token = 0
+        self.files: List[str] = []
+        self.index = -1  # 再生中の曲の番号（停止中は -1）
+        self.state = "stopped"
+        self.context: Any = None  # 再生を始めたページが自由に使う目印（例: ("playlist", 名前)）
+        self._queued: Optional[int] = None  # 先読み済みの曲の番号
+        self._duration_ms: Optional[int] = None
+        # position() = _offset + get_pos()（秒）。途中から再生・シークしたときのずれを吸収する
+        self._offset = 0.0
+        self._paused_at: Optional[float] = None
+        self._last_pos = 0
+        self._end_after = None
+        self._position_after = None
+
+    # ===== 購読 =====
+
+    def subscribe(self, event: str, callback: Callable, owner=None) -> int:
+        """
+        event を購読し、購読解除用の番号を返す。
+        owner にウィジェットを渡すと、そのウィジェットが破棄されたときに自動で購読を外す。
+        """
+        if event not in self._subscribers:
+            raise ValueError(f"unknown player event: {event}")
+        token = self._next_token
+        self._next_token += 1
+        self._subscribers[event][token] = callback
+        if owner is not None:
+            owner.bind("<Destroy>", lambda e, t=token: e.widget is owner and self.unsubscribe(t), add="+")
+        if event == "position":
+            self._ensure_position_timer()
+        return token
+
+    def unsubscribe(self, token: int) -> None:
+        for callbacks in self._subscribers.values():
+            callbacks.pop(token, None)
+
+    def _emit(self, event: str, *args) -> None:
+        for callback in list(self._subscribers[event].values()):
+            try:
+                callback(*args)
+            except Exception:
+                logger.exception("player event handler failed: %s", event)
+
+    # ===== 操作 =====
+
+    @property
+    def current_path(self) -> Optional[str]:
+        return self.files[self.index] if self.index >= 0 else None
+
+    @property
+    def duration(self) -> Optional[float]:
+        return self._duration_ms / 1000 if self._duration_ms is not None else None
+
+    def is_playing(self, path: Optional[str] = None, context: Any = None) -> bool:
+        """再生中（一時停止は含まない）か。path / context を渡すとそれが再生中かどうか"""
+        if self.state != "playing":
+            return False
+        if path is not None and self.current_path != path:
+            return False
+        return context is None or self.context == context
+
+    def play(self, files: List[str], start_index: int = 0, start: float = 0.0, context: Any = None) -> None:
+        """files を start_index 番目の start 秒から連続再生する（再生中のものは止める）"""
+        self.stop()
+        self.files = list(files)
+        self.context = context
+        self._start(start_index, start)
+
+    def pause(self) -> None:
+        if self.state != "playing":
+            return
+        self._paused_at = self.position()
+        pygame.mixer.music.pause()
+        self._cancel_timers()
+        self._set_state("paused")
+
+    def resume(self) -> None:
+        if self.state != "paused":
+            return
+        pygame.mixer.music.unpause()
+        self._paused_at = None
+        self._set_state("playing")
+        self._schedule_end()
+        self._ensure_position_timer()
+
+    def stop(self) -> None:
+        """再生を止める（"finished" は通知しない）"""
+        self._halt()
+        self.files = []
+        self.context = None
+        self._set_state("stopped")
+
+    def seek(self, seconds: float) -> None:
+        """
+        再生中の曲の seconds 秒の位置へ移動する。
+        読み込み済みのストリームの中で位置だけを変えるので、ファイルの読み直しや
+        先読みのやり直しは起きず、ファイルの大きさによらずすぐに終わる。
+        """
+        if self.index < 0:
+            return
+        seconds = max(0.0, seconds)
+        if self._duration_ms is not None:
+            seconds = min(seconds, self._duration_ms / 1000)
+        if not self._seek_loaded(seconds):
+            # 位置の変更に対応していない形式なら、読み直して途中から再生する
+            was_paused = self.state == "paused"
+            self._start(self.index, seconds, notify_track=False)
+            if was_paused:
+                self.pause()
+            return
+        if self.state == "paused":
+            self._paused_at = seconds
+            return
+        self._schedule_end()
+
+    def position(self) -> float:
+        """再生中の曲の現在位置（秒）"""
+        if self.index < 0:
+            return 0.0
+        if self._paused_at is not None:
+            return self._paused_at
+        position = self._offset + max(0, pygame.mixer.music.get_pos()) / 1000
+        if self._duration_ms is not None:
+            position = min(position, self._duration_ms / 1000)
+        return position
+
+    # ===== 内部処理 =====
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            self.state = state
+            self._emit("state", state)
+
+    def _halt(self) -> None:
+        self._cancel_timers()
+        self.index = -1
+        self._queued = None
+        self._paused_at = None
+        if pygame.mixer.get_init():
+            pygame.mixer.music.stop()
+            # 古い pygame では停止時に先読みした曲が始まってしまうので、その場合はもう一度止める
+            if pygame.mixer.music.get_busy():
+                pygame.mixer.music.stop()
+
+    def _start(self, index: int, start: float = 0.0, notify_track: bool = True) -> None:
+        """index 番目以降で最初に読み込めた曲を start 秒から再生する"""
+        self._cancel_timers()
+        self._paused_at = None
+        while index < len(self.files):
+            path = self.files[index]
+            try:
+                pygame.mixer.music.load(path)
+                pygame.mixer.music.play(start=start)
+            except pygame.error as e:
+                self._report_error(path, e)
+                index, start = index + 1, 0.0
+                continue
+            self._on_started(index, start, notify_track)
+            return
+        self._finish()
+
+    def _seek_loaded(self, seconds: float) -> bool:
+        """
+        読み込み済みの曲の再生位置を seconds 秒に変える。
+        set_pos() は get_pos() を戻さないので、_offset を position() が seconds になるように合わせる。
+        """
+        try:
+            pygame.mixer.music.set_pos(seconds)
+        except pygame.error:
+            return False
+        self._offset = seconds - max(0, pygame.mixer.music.get_pos()) / 1000
+        return True
+
+    def _finish(self) -> None:
+        """最後まで再生し終えた（または再生できる曲が無かった）"""
+        self._halt()
+        self.files = []
+        self.context = None
+        self._set_state("stopped")
+        self._emit("finished")
+
+    def _on_started(self, index: int, start: float = 0.0, notify_track: bool = True) -> None:
+        self.index = index
+        library.loaded_path = self.files[index]  # library.set_pos が読み込み済みの曲を判定できるように
+        self._offset = start
+        self._queued = None
+        self._duration_ms = self._duration_of(self.files[index])
+        self._queue_next()
+        self._set_state("playing")
+        if notify_track:
+            self._emit("track_started", index, self.files[index])
+        self._schedule_end()
+        self._ensure_position_timer()
+
+    def _queue_next(self) -> None:
+        """次に読み込める曲を先読みしておく"""
+        index = self.index + 1
+        while index < len(self.files):
+            path = self.files[index]
+            try:
+                pygame.mixer.music.queue(path)
+            except pygame.error as e:
+                self._report_error(path, e)
+                index += 1
+                continue
+            self._queued = index
+            return
+
+    def _duration_of(self, path: str) -> Optional[int]:
+        # MP3 は Xing/LAME タグかフレームヘッダから長さを求める（Tk のスレッドでファイル全体を読まない）
+        duration = get_mp3_duration(path)
+        if duration is not None:
+            return int(duration * 1000)
+        info = probe_audio(path)
+        if info is None or not info.duration:
+            return None
+        return int(info.duration * 1000)
+
+    def _schedule_end(self) -> None:
+        """今の曲が終わる頃に _on_end_timer が呼ばれるようにする"""
+        self._cancel(self._end_after)
+        pos = max(0, pygame.mixer.music.get_pos())
+        self._last_pos = pos
+        if self._duration_ms is None:
+            delay = UNKNOWN_DURATION_CHECK_MS
+        else:
+            delay = max(10, self._duration_ms - int(self._offset * 1000) - pos + END_MARGIN_MS)
+        self._end_after = self._root.after(delay, self._on_end_timer)
+
+    def _on_end_timer(self) -> None:
+        self._end_after = None
+        if self.state != "playing":
+            return
+
+        if not pygame.mixer.music.get_busy():
+            # 最後の曲が終わった（先読みがあれば pygame が始めているはず）
+            if self._queued is not None:
+                self._start(self._queued)
+            else:
+                self._finish()
+            return
+
+        # get_pos() は次の曲が始まると 0 からになるので、それで切り替わりを判定する
+        pos = pygame.mixer.music.get_pos()
+        if self._duration_ms is None:
+            switched = pos < self._last_pos
+        else:
+            switched = pos < (self._duration_ms - int(self._offset * 1000)) // 2
+        if self._queued is not None and switched:
+            self._on_started(self._queued)
+            return
+        # まだ今の曲が鳴っている（長さの見積もりが短かった）ので、もう一度待つ
+        self._schedule_end()
+
+    def _ensure_position_timer(self) -> None:
+        if self._position_after is None and self.state == "playing" and self._subscribers["position"]:
+            self._position_after = self._root.after(POSITION_INTERVAL_MS, self._on_position_timer)
+
+    def _on_position_timer(self) -> None:
+        self._position_after = None
+        if self.state != "playing" or not self._subscribers["position"]:
+            return
+        self._emit("position", self.position(), self.duration)
+        self._ensure_position_timer()
+
+    def _cancel(self, after_id) -> None:
+        if after_id is not None:
+            try:
+                self._root.after_cancel(after_id)
+            except Exception:
+                pass
+
+    def _cancel_timers(self) -> None:
+        self._cancel(self._end_after)
+        self._cancel(self._position_after)
+        self._end_after = None
+        self._position_after = None
+
+    def _report_error(self, path: str, error: Exception) -> None:
+        logger.warning("cannot play %s: %s", os.path.basename(path), error)
+        self._emit("error", path, error)
+
+
+_service: Optional[PlayerService] = None
+
+
+def get_player(widget) -> PlayerService:
+    """アプリ全体で共有する再生サービスを返す（最初の呼び出しで widget のルートに作る）"""
+    global _service
+    if _service is None:
+        if not pygame.mixer.get_init():
+            pygame.mixer.init()
+        _service = PlayerService(widget._root())
+    return _service
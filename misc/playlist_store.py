@@ -0,0 +1,458 @@
+import argparse
+import glob
+import os
+import sqlite3
+import sys
+import time
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+from misc.library_index import INDEX_FILENAME, get_library_index
+from misc.mp3_header import get_mp3_duration
+
+# プレイリストの保存先
+# - 1 つの SQLite ファイルに全プレイリストを入れる（曲の追加・削除はその行だけを書き、トランザクションで確定する）
+# - 一覧画面で使う情報（曲数・合計時間・更新時刻）はプレイリストごとの行に持ち、曲の一覧は開いたときに初めて読み込む
+# - 読み込んだ曲の一覧は BODY_CACHE_SIZE 個までメモリに残す（古いものから捨てる）
+# - 従来の XML（playlist_file/名前.xml）は、新しいもの・更新されたものを取り込む。XML への書き出しもできる
+
+PLAYLIST_DIR = "playlist_file"
+STORE_FILENAME = "playlists.sqlite3"
+BODY_CACHE_SIZE = 8
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS playlists (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    track_count INTEGER NOT NULL DEFAULT 0,
+    next_position INTEGER NOT NULL DEFAULT 0,
+    duration REAL NOT NULL DEFAULT 0,
+    mtime_ns INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    playlist_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    duration REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (playlist_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS xml_sources (
+    name TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+
+@dataclass
+class PlaylistInfo:
+    """一覧画面に出すプレイリストの情報（曲の一覧は含まない）"""
+
+    name: str
+    track_count: int
+    duration: float  # 合計時間（秒）。長さの分からない曲は 0 として数える
+    mtime_ns: int  # 最後に曲を追加・削除した時刻
+
+
+def track_durations(paths: Iterable[str]) -> List[float]:
+    """
+    曲の長さ（秒）のリスト。ライブラリのインデックスにあればそれを使い、無ければ MP3 のヘッダだけを読む。
+    分からない曲は 0。
+    """
+    indexes = {}  # {フォルダ: インデックス（無ければ None）}
+    durations = []
+    for path in paths:
+        folder, name = os.path.split(os.path.abspath(path))
+        if folder not in indexes:
+            has_index = os.path.exists(os.path.join(folder, INDEX_FILENAME))
+            indexes[folder] = get_library_index(folder) if has_index else None
+        entry = indexes[folder].get(name) if indexes[folder] is not None else None
+        if entry is not None and entry.duration is not None:
+            durations.append(entry.duration)
+        elif path.lower().endswith(".mp3"):
+            durations.append(get_mp3_duration(path) or 0.0)
+        else:
+            durations.append(0.0)
+    return durations
+
+
+def read_playlist_xml(xml_path: str) -> List[str]:
+    """従来形式の XML からファイルパスを order 順に読む"""
+    root = ET.parse(xml_path).getroot()
+    files = root.findall("file")
+    if all(f.get("order", "").isdigit() for f in files):
+        files.sort(key=lambda f: int(f.get("order")))
+    return [f.get("path") for f in files if f.get("path")]
+
+
+def write_playlist_xml(xml_path: str, name: str, paths: Iterable[str]) -> None:
+    """
+    従来形式の XML を書く（一時ファイルに書いてから置き換える）
+
+    <playlist name="プレイリスト名">
+        <file order="1" path="/path/to/file1.mp3" />
+    </playlist>
+    """
+    root = ET.Element("playlist")
+    root.set("name", name)
+    for idx, path in enumerate(paths):
+        element = ET.SubElement(root, "file")
+        element.set("order", str(idx + 1))
+        element.set("path", path)
+    tmp = f"{xml_path}.tmp"
+    ET.ElementTree(root).write(tmp, encoding="utf-8", xml_declaration=True)
+    os.replace(tmp, xml_path)
+
+
+class PlaylistBody:
+    """
+    読み込んだプレイリスト 1 つ分の曲の一覧。
+    順番どおりのリストに「パス → データベース上の位置」の索引を添え、重複の判定を O(1) で行う。
+    """
+
+    __slots__ = ("positions", "paths", "durations", "_where")
+
+    def __init__(self, rows: Iterable[tuple] = ()):
+        self.positions: List[int] = []
+        self.paths: List[str] = []
+        self.durations: List[float] = []
+        self._where: Dict[str, Set[int]] = {}
+        for position, path, duration in rows:
+            self._add(position, path, duration)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._where
+
+    def _add(self, position: int, path: str, duration: float) -> None:
+        self.positions.append(position)
+        self.paths.append(path)
+        self.durations.append(duration)
+        self._where.setdefault(path, set()).add(position)
+
+    def extend(self, positions: Sequence[int], paths: Sequence[str], durations: Sequence[float]) -> None:
+        for row in zip(positions, paths, durations):
+            self._add(*row)
+
+    def remove_indices(self, drop: Set[int]) -> None:
+        """drop に含まれる番目の曲を 1 回の走査で取り除く（後ろの曲の番号は詰まる）"""
+        for i in drop:
+            where = self._where[self.paths[i]]
+            where.discard(self.positions[i])
+            if not where:
+                del self._where[self.paths[i]]
+        keep = [i for i in range(len(self.paths)) if i not in drop]
+        self.positions = [self.positions[i] for i in keep]
+        self.paths = [self.paths[i] for i in keep]
+        self.durations = [self.durations[i] for i in keep]
+
+    def duplicate_indices(self) -> List[int]:
+        """2 回目以降に現れる曲の番号"""
+        seen: Set[str] = set()
+        duplicates = []
+        for i, path in enumerate(self.paths):
+            if path in seen:
+                duplicates.append(i)
+            else:
+                seen.add(path)
+        return duplicates
+
+
+class PlaylistStore:
+    """
+    全プレイリストを SQLite に保存する。
+    - 名前・曲数・合計時間はまとめて読み、曲の一覧は tracks() で必要になったものだけ読む
+    - append() / remove_at() は追加・削除する行だけを書く（位置は詰めずに連番の隙間を許す）
+    - 重複の判定は読み込んだ曲の一覧の索引で行うので、まとめて追加しても曲数の積にはならない
+    Tk のメインスレッドから使う。
+    """
+
+    def __init__(self, folder: str = PLAYLIST_DIR):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(folder, STORE_FILENAME))
+        self._conn.executescript(_SCHEMA)
+        self._ids: Dict[str, int] = {}
+        self._infos: Dict[str, PlaylistInfo] = {}
+        # 読み込み済みの曲の一覧（最近使った順）
+        self._bodies: "OrderedDict[str, PlaylistBody]" = OrderedDict()
+        self._load_infos()
+
+    def _load_infos(self) -> None:
+        self._ids.clear()
+        self._infos.clear()
+        for pid, name, count, duration, mtime_ns in self._conn.execute(
+            "SELECT id, name, track_count, duration, mtime_ns FROM playlists"
+        ):
+            self._ids[name] = pid
+            self._infos[name] = PlaylistInfo(name, count, duration, mtime_ns)
+
+    # ===== 読み出し =====
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._ids
+
+    def names(self) -> List[str]:
+        """プレイリスト名を名前順で返す"""
+        return sorted(self._ids)
+
+    def count(self, name: str) -> int:
+        """曲数（曲の一覧は読み込まない）"""
+        info = self._infos.get(name)
+        return info.track_count if info is not None else 0
+
+    def info(self, name: str) -> PlaylistInfo:
+        """曲数・合計時間・更新時刻（曲の一覧は読み込まない）"""
+        return self._infos[name]
+
+    def tracks(self, name: str) -> List[str]:
+        """プレイリストの曲のパスを順番に返す（キャッシュに無ければデータベースから読む）"""
+        return list(self._body(name).paths)
+
+    def contains(self, name: str, path: str) -> bool:
+        """path がプレイリストに入っているか（一覧を読み込んだ後は O(1)）"""
+        return path in self._body(name)
+
+    def _body(self, name: str) -> PlaylistBody:
+        body = self._bodies.get(name)
+        if body is not None:
+            self._bodies.move_to_end(name)
+            return body
+        body = PlaylistBody(self._conn.execute(
+            "SELECT position, path, duration FROM tracks WHERE playlist_id = ? ORDER BY position",
+            (self._ids[name],),
+        ))
+        self._cache_body(name, body)
+        return body
+
+    def _cache_body(self, name: str, body: PlaylistBody) -> None:
+        self._bodies[name] = body
+        self._bodies.move_to_end(name)
+        while len(self._bodies) > BODY_CACHE_SIZE:
+            self._bodies.popitem(last=False)
+
+    def _touch(self, name: str, pid: int, count_delta: int, duration_delta: float) -> None:
+        """曲数・合計時間・更新時刻を書き換える（呼び出し側のトランザクション内で呼ぶ）"""
+        info = self._infos[name]
+        info.track_count += count_delta
+        info.duration = max(info.duration + duration_delta, 0.0)
+        info.mtime_ns = time.time_ns()
+        self._conn.execute(
+            "UPDATE playlists SET track_count = ?, duration = ?, mtime_ns = ? WHERE id = ?",
+            (info.track_count, info.duration, info.mtime_ns, pid),
+        )
+
+    # ===== 書き込み =====
+
+    def create(self, name: str, paths: Iterable[str] = ()) -> None:
+        if name in self._ids:
+            raise ValueError(f"playlist already exists: {name}")
+        mtime_ns = time.time_ns()
+        with self._conn:
+            cur = self._conn.execute("INSERT INTO playlists (name, mtime_ns) VALUES (?, ?)", (name, mtime_ns))
+        self._ids[name] = cur.lastrowid
+        self._infos[name] = PlaylistInfo(name, 0, 0.0, mtime_ns)
+        if paths:
+            self.append(name, paths)
+
+    def delete(self, name: str) -> None:
+        pid = self._ids.pop(name)
+        with self._conn:
+            self._conn.execute("DELETE FROM tracks WHERE playlist_id = ?", (pid,))
+            self._conn.execute("DELETE FROM playlists WHERE id = ?", (pid,))
+        self._infos.pop(name, None)
+        self._bodies.pop(name, None)
+
+    def append(self, name: str, paths: Iterable[str]) -> None:
+        """末尾に曲を追加する（書き込むのは追加した行だけ）"""
+        paths = list(paths)
+        if not paths:
+            return
+        pid = self._ids[name]
+        durations = track_durations(paths)
+        with self._conn:
+            start = self._conn.execute("SELECT next_position FROM playlists WHERE id = ?", (pid,)).fetchone()[0]
+            positions = list(range(start, start + len(paths)))
+            self._conn.executemany(
+                "INSERT INTO tracks (playlist_id, position, path, duration) VALUES (?, ?, ?, ?)",
+                [(pid, pos, path, d) for pos, path, d in zip(positions, paths, durations)],
+            )
+            self._conn.execute("UPDATE playlists SET next_position = ? WHERE id = ?", (start + len(paths), pid))
+            self._touch(name, pid, len(paths), sum(durations))
+        body = self._bodies.get(name)
+        if body is not None:
+            body.extend(positions, paths, durations)
+
+    def add_unique(self, name: str, paths: Iterable[str]) -> List[str]:
+        """
+        まだ入っていない曲だけを末尾に追加し、追加したパスを順番に返す。
+        paths の中の重複も 1 つにまとめる（かかる時間は追加する数に比例する）。
+        """
+        body = self._body(name)
+        seen: Set[str] = set()
+        new_paths = []
+        for path in paths:
+            if path not in body and path not in seen:
+                seen.add(path)
+                new_paths.append(path)
+        self.append(name, new_paths)
+        return new_paths
+
+    def dedupe(self, name: str) -> int:
+        """2 回目以降に現れる曲を削除し、削除した数を返す"""
+        return self.remove_at(name, self._body(name).duplicate_indices())
+
+    def remove_at(self, name: str, indices: Iterable[int]) -> int:
+        """indices 番目（0 始まり）の曲を削除し、削除した数を返す（書き込むのは削除する行だけ）"""
+        pid = self._ids[name]
+        body = self._body(name)
+        targets = {i for i in indices if 0 <= i < len(body)}
+        if not targets:
+            return 0
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM tracks WHERE playlist_id = ? AND position = ?",
+                [(pid, body.positions[i]) for i in targets],
+            )
+            self._touch(name, pid, -len(targets), -sum(body.durations[i] for i in targets))
+        body.remove_indices(targets)
+        return len(targets)
+
+    def reorder(self, name: str, order: Sequence[int]) -> None:
+        """
+        曲を order の順（今の番号の並び。すべての番号を 1 回ずつ含む）に並べ替える。
+        位置を 0 から振り直して全行を書き直す（1 トランザクション）。
+        """
+        pid = self._ids[name]
+        body = self._body(name)
+        if len(order) != len(body) or set(order) != set(range(len(body))):
+            raise ValueError("order must be a permutation of the track indices")
+        paths = [body.paths[i] for i in order]
+        durations = [body.durations[i] for i in order]
+        with self._conn:
+            self._conn.execute("DELETE FROM tracks WHERE playlist_id = ?", (pid,))
+            self._conn.executemany(
+                "INSERT INTO tracks (playlist_id, position, path, duration) VALUES (?, ?, ?, ?)",
+                [(pid, pos, path, d) for pos, (path, d) in enumerate(zip(paths, durations))],
+            )
+            self._conn.execute("UPDATE playlists SET next_position = ? WHERE id = ?", (len(paths), pid))
+            self._touch(name, pid, 0, 0.0)
+        self._bodies[name] = PlaylistBody(zip(range(len(paths)), paths, durations))
+
+    def replace(self, name: str, paths: Iterable[str]) -> None:
+        """
+        曲の一覧を丸ごと入れ替える（XML の取り込み用。無ければ作る）。
+        既存のプレイリストは番号を保ったまま、行の削除と追加を 1 トランザクションで行う。
+        """
+        paths = list(paths)
+        durations = track_durations(paths)
+        info = PlaylistInfo(name, len(paths), sum(durations), time.time_ns())
+        pid = self._ids.get(name)
+        with self._conn:
+            if pid is None:
+                pid = self._conn.execute("INSERT INTO playlists (name) VALUES (?)", (name,)).lastrowid
+            self._conn.execute("DELETE FROM tracks WHERE playlist_id = ?", (pid,))
+            self._conn.executemany(
+                "INSERT INTO tracks (playlist_id, position, path, duration) VALUES (?, ?, ?, ?)",
+                [(pid, pos, path, d) for pos, (path, d) in enumerate(zip(paths, durations))],
+            )
+            self._conn.execute(
+                "UPDATE playlists SET next_position = ?, track_count = ?, duration = ?, mtime_ns = ? WHERE id = ?",
+                (len(paths), info.track_count, info.duration, info.mtime_ns, pid),
+            )
+        self._ids[name] = pid
+        self._infos[name] = info
+        self._cache_body(name, PlaylistBody(zip(range(len(paths)), paths, durations)))
+
+    # ===== XML との相互変換 =====
+
+    def sync_xml(self) -> bool:
+        """
+        フォルダ内の XML のうち、新しいもの・前回取り込んでから更新されたものを取り込む。
+        取り込んだものがあれば True。
+        """
+        known = dict(self._conn.execute("SELECT name, mtime_ns FROM xml_sources"))
+        changed = False
+        for xml_path in glob.glob(os.path.join(self.folder, "*.xml")):
+            name = os.path.splitext(os.path.basename(xml_path))[0]
+            try:
+                mtime = os.stat(xml_path).st_mtime_ns
+                if known.get(name) == mtime:
+                    continue
+                paths = read_playlist_xml(xml_path)
+            except (OSError, ET.ParseError):
+                continue
+            self.replace(name, paths)
+            self._remember_xml(name, mtime)
+            changed = True
+        return changed
+
+    def import_xml(self, xml_path: str, name: Optional[str] = None) -> str:
+        """XML を name（省略時はファイル名）のプレイリストとして取り込み、その名前を返す"""
+        name = name or os.path.splitext(os.path.basename(xml_path))[0]
+        self.replace(name, read_playlist_xml(xml_path))
+        return name
+
+    def export_xml(self, name: str, xml_path: Optional[str] = None) -> str:
+        """プレイリストを従来形式の XML に書き出し、そのパスを返す（省略時は playlist_file/名前.xml）"""
+        default = xml_path is None
+        xml_path = xml_path or os.path.join(self.folder, f"{name}.xml")
+        write_playlist_xml(xml_path, name, self.tracks(name))
+        if default:
+            # 自分で書いた XML を次の sync_xml で取り込み直さないようにする
+            self._remember_xml(name, os.stat(xml_path).st_mtime_ns)
+        return xml_path
+
+    def _remember_xml(self, name: str, mtime_ns: int) -> None:
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO xml_sources VALUES (?, ?)", (name, mtime_ns))
+
+
+_stores: Dict[str, PlaylistStore] = {}
+
+
+def get_playlist_store(folder: str = PLAYLIST_DIR) -> PlaylistStore:
+    """フォルダごとに 1 つのストアを共有して返す"""
+    key = os.path.abspath(folder)
+    store = _stores.get(key)
+    if store is None:
+        store = PlaylistStore(folder)
+        _stores[key] = store
+    return store
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="プレイリストを XML 形式と相互変換する")
+    parser.add_argument("--dir", default=PLAYLIST_DIR, help="プレイリストのフォルダ")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_export = sub.add_parser("export", help="プレイリストを XML に書き出す")
+    p_export.add_argument("name", nargs="?", help="プレイリスト名（省略時はすべて）")
+    p_export.add_argument("-o", "--output", help="書き出し先（1 つだけ書き出すとき）")
+    p_import = sub.add_parser("import", help="XML を取り込む")
+    p_import.add_argument("xml", nargs="+")
+    sub.add_parser("list", help="プレイリスト名・曲数・合計時間を表示する")
+    args = parser.parse_args(argv)
+
+    store = get_playlist_store(args.dir)
+    if args.command == "export":
+        names = [args.name] if args.name else store.names()
+        for name in names:
+            if name not in store:
+                print(f"プレイリストがありません: {name}", file=sys.stderr)
+                return 1
+            print(store.export_xml(name, args.output if args.name else None))
+    elif args.command == "import":
+        for xml_path in args.xml:
+            print(f"{store.import_xml(xml_path)}: {xml_path}")
+    else:
+        for name in store.names():
+            info = store.info(name)
+            print(f"{info.track_count}\t{info.duration:.0f}s\t{name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import os
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
+
+from misc.mp3_header import DECODER_DELAY, find_first_frame, id3v2_size, iter_frames, read_info_tag
+
+# MP3 のシーク表
+# - 全フレームのヘッダを 1 回だけ走査し、SEEK_INTERVAL_MS ごとに「その時刻のフレームのバイト位置」を記録する
+# - 1 フレームのサンプル数は固定なので、フレーム番号 ↔ 時刻は計算で決まる（VBR でもずれない）
+# - 記録点の間は、ファイルからヘッダを数個読んで正確なフレーム位置まで進む
+
+SEEK_INTERVAL_MS = 250
+SEEK_INDEX_VERSION = 1
+# 途中から読み始めてデコードするとき、目的の位置より前から読むフレーム数。
+# 最初の数フレームはビットリザーバと MDCT の重なりが欠けて正しくデコードされないため
+PREROLL_FRAMES = 10
+# 1 フレームの最大バイト数（レイヤー 2/3、320kbps・32kHz・パディングあり）
+_MAX_FRAME_BYTES = 1441
+
+
+@dataclass
+class SeekIndex:
+    """MP3 ファイル 1 つ分のシーク表（時刻 ↔ バイト位置）"""
+
+    path: str
+    sample_rate: int
+    samples_per_frame: int
+    # デコーダが先頭で捨てるサンプル数（LAME タグがあれば遅延 + DECODER_DELAY）
+    start_skip: int
+    total_samples: int
+    frame_count: int
+    step: int  # 記録点の間隔（フレーム数）
+    audio_end: int  # 最後のフレームの直後のバイト位置
+    offsets: array = field(default_factory=lambda: array("Q"))  # offsets[k] は k * step 番目のフレームの位置
+
+    @property
+    def duration(self) -> float:
+        """再生される長さ（秒）。VBR でもフレーム数から正確に求まる"""
+        return self.total_samples / self.sample_rate
+
+    @property
+    def bit_rate(self) -> int:
+        """音声フレーム全体の平均ビットレート（bps）"""
+        if not self.offsets or not self.total_samples:
+            return 0
+        return int((self.audio_end - self.offsets[0]) * 8 / self.duration)
+
+    def frame_time(self, frame: int) -> float:
+        """frame 番目のフレームのデコード結果の先頭が何秒目に当たるか（先頭付近は負になりうる）"""
+        return (frame * self.samples_per_frame - self.start_skip) / self.sample_rate
+
+    def frame_at(self, seconds: float) -> int:
+        """seconds 秒を含むフレームの番号"""
+        sample = int(round(seconds * self.sample_rate)) + self.start_skip
+        return min(max(sample // self.samples_per_frame, 0), max(self.frame_count - 1, 0))
+
+    def frame_offset(self, frame: int) -> int:
+        """frame 番目のフレームのバイト位置（frame_count 以上なら音声データの終わり）"""
+        if frame >= self.frame_count:
+            return self.audio_end
+        k, rest = divmod(max(frame, 0), self.step)
+        if rest == 0:
+            return self.offsets[k]
+        for i, (pos, _header) in enumerate(self._walk(self.offsets[k])):
+            if i == rest:
+                return pos
+        raise ValueError(f"シーク表がファイルの内容と合いません: {self.path}")
+
+    def time_to_byte(self, seconds: float) -> Tuple[int, float]:
+        """seconds 秒を含むフレームの (バイト位置, そのフレームの先頭の時刻)"""
+        frame = self.frame_at(seconds)
+        return self.frame_offset(frame), self.frame_time(frame)
+
+    def decode_start(self, seconds: float) -> Tuple[int, float]:
+        """
+        seconds 秒から正確にデコードするための (読み始めるバイト位置, デコード後に捨てる秒数)。
+        読み始めは PREROLL_FRAMES 手前のフレームにし、ずれ無くデコードできる所まで捨てる。
+        """
+        frame = max(self.frame_at(seconds) - PREROLL_FRAMES, 0)
+        return self.frame_offset(frame), seconds - self.frame_time(frame)
+
+    def byte_to_time(self, offset: int) -> float:
+        """offset バイト目を含むフレームの先頭の時刻"""
+        k = max(bisect_right(self.offsets, offset) - 1, 0)
+        frame = k * self.step
+        for pos, header in self._walk(self.offsets[k]):
+            if pos + header.frame_length > offset:
+                break
+            frame += 1
+        return self.frame_time(min(frame, self.frame_count))
+
+    def _walk(self, start: int):
+        """start から記録点 1 つ分のフレームを読む"""
+        with open(self.path, "rb") as f:
+            yield from iter_frames(f, start, self.audio_end, chunk_size=(self.step + 1) * _MAX_FRAME_BYTES)
+
+    # ===== 保存用 =====
+
+    def to_row(self) -> tuple:
+        return (
+            self.sample_rate,
+            self.samples_per_frame,
+            self.start_skip,
+            self.total_samples,
+            self.frame_count,
+            self.step,
+            self.audio_end,
+            self.offsets.tobytes(),
+        )
+
+    @classmethod
+    def from_row(cls, path: str, row: tuple) -> "SeekIndex":
+        offsets = array("Q")
+        offsets.frombytes(row[7])
+        return cls(path, *row[:7], offsets=offsets)
+
+
+def build_seek_index(path, interval_ms: int = SEEK_INTERVAL_MS) -> Optional[SeekIndex]:
+    """
+    MP3 のフレームヘッダを先頭から走査してシーク表を作る（音声はデコードしない）。
+    MP3 として読めない場合は None。途中で形式が変わる場合はそこまでを音声とみなす。
+    """
+    path = os.fspath(path)
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            found = find_first_frame(f, id3v2_size(f.read(10)))
+            if found is None:
+                return None
+            first_offset, first = found
+            f.seek(first_offset)
+            tag = read_info_tag(f.read(max(first.frame_length, 192)), first)
+            # Xing/Info フレームは音声を含まないので飛ばす
+            pos = first_offset + first.frame_length if tag is not None else first_offset
+
+            step = max(1, round(interval_ms / 1000 * first.sample_rate / first.samples_per_frame))
+            offsets = array("Q")
+            count = 0
+            end = pos
+            for frame_offset, header in iter_frames(f, pos, size):
+                if header.sample_rate != first.sample_rate or header.samples_per_frame != first.samples_per_frame:
+                    break
+                if count % step == 0:
+                    offsets.append(frame_offset)
+                count += 1
+                end = frame_offset + header.frame_length
+    except OSError:
+        return None
+    if count == 0:
+        return None
+
+    start_skip = tag.encoder_delay + DECODER_DELAY if tag is not None and tag.has_lame else 0
+    total = count * first.samples_per_frame - start_skip
+    if tag is not None and tag.has_lame:
+        total -= max(tag.encoder_padding - DECODER_DELAY, 0)
+    return SeekIndex(
+        path=path,
+        sample_rate=first.sample_rate,
+        samples_per_frame=first.samples_per_frame,
+        start_skip=start_skip,
+        total_samples=max(total, 0),
+        frame_count=count,
+        step=step,
+        audio_end=end,
+        offsets=offsets,
+    )
@@ -0,0 +1,200 @@
+import tkinter as tk
+from bisect import insort
+from typing import Any, Callable, List, Optional
+
+
+class VirtualList(tk.Frame):
+    """
+    表示範囲の行だけウィジェットを作る仮想化リスト。
+    - 行ウィジェットは画面に収まる数だけ作成し、スクロール時に使い回す
+    - 行の見た目は bind_row(row, index, item) で毎回設定し直す
+    件数が増えても作成されるウィジェット数とスクロール時の処理量は一定になる。
+    """
+
+    def __init__(
+        self,
+        parent,
+        row_height: int,
+        create_row: Callable[[tk.Widget], tk.Widget],
+        bind_row: Callable[[tk.Widget, int, Any], None],
+        bg: str = "#222",
+        empty_text: str = "",
+        empty_fg: str = "gray",
+    ):
+        super().__init__(parent, bg=bg)
+        self.row_height = row_height
+        self._create_row = create_row
+        self._bind_row = bind_row
+        self._items: List[Any] = []
+        self._rows: List[tk.Widget] = []  # 使い回す行ウィジェット
+        self._windows: List[int] = []  # 各行ウィジェットを載せた Canvas のウィンドウ ID
+        self._row_index: List[Optional[int]] = []  # 各行ウィジェットが現在表示している項目番号
+        self._width = 1
+
+        self.canvas = tk.Canvas(self, bg=bg, highlightthickness=0)
+        self.scrollbar = tk.Scrollbar(self, orient="vertical", command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self._on_yscroll, yscrollincrement=row_height)
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self._empty_item = self.canvas.create_text(
+            20, 20, text=empty_text, fill=empty_fg, anchor="nw", state="hidden"
+        )
+
+        self.canvas.bind("<Configure>", self._on_configure)
+        self.bind_wheel(self.canvas)
+
+    # ===== 公開 API =====
+
+    @property
+    def items(self) -> List[Any]:
+        return self._items
+
+    def set_items(self, items) -> None:
+        """表示する項目を丸ごと差し替える"""
+        self._items = list(items)
+        self._update_scrollregion()
+        self.canvas.yview_moveto(0)
+        self._layout(force=True)
+
+    def insert(self, index: int, item: Any) -> None:
+        """1 件挿入する。影響するのは表示範囲内の行だけ。"""
+        self._items.insert(index, item)
+        self._update_scrollregion()
+        self._layout(force=True)
+
+    def append(self, item: Any) -> None:
+        self.insert(len(self._items), item)
+
+    def extend(self, items) -> None:
+        """末尾にまとめて追加する（何件でも描き直しは 1 回だけ）"""
+        self._items.extend(items)
+        self._update_scrollregion()
+        self._layout(force=True)
+
+    def remove(self, index: int) -> None:
+        """1 件削除する"""
+        del self._items[index]
+        self._update_scrollregion()
+        self._layout(force=True)
+
+    def remove_many(self, indices) -> None:
+        """複数件をまとめて削除する（スクロール位置は保ったまま 1 回だけ描き直す）"""
+        drop = set(indices)
+        self._items = [item for i, item in enumerate(self._items) if i not in drop]
+        self._update_scrollregion()
+        self._layout(force=True)
+
+    def merge_sorted(self, added=(), removed=()) -> None:
+        """
+        並び順を保った一覧から removed を取り除き、added をそれぞれ並び順どおりの位置に入れる。
+        スクロール位置は保ったまま、描き直しは 1 回だけ。
+        """
+        drop = set(removed)
+        if drop:
+            self._items = [item for item in self._items if item not in drop]
+        for item in added:
+            insort(self._items, item)
+        self._update_scrollregion()
+        self._layout(force=True)
+
+    def set_empty_text(self, text: str) -> None:
+        """項目が無いときに表示する文字を変える"""
+        self.canvas.itemconfig(self._empty_item, text=text)
+
+    def update_item(self, index: int, item: Any = None) -> None:
+        """1 件の内容を更新し、表示中であればその行だけ描き直す"""
+        if item is not None:
+            self._items[index] = item
+        for row, shown in zip(self._rows, self._row_index):
+            if shown == index:
+                self._bind_row(row, index, self._items[index])
+                break
+
+    def refresh(self) -> None:
+        """表示中の行をすべて描き直す（項目数は変わらない場合）"""
+        self._layout(force=True)
+
+    def see(self, index: int) -> None:
+        """指定した項目が見える位置までスクロールする"""
+        if not self._items:
+            return
+        top = self.canvas.canvasy(0)
+        height = max(self.canvas.winfo_height(), 1)
+        y = index * self.row_height
+        if y < top or y + self.row_height > top + height:
+            self.canvas.yview_moveto(y / (len(self._items) * self.row_height))
+
+    def bind_wheel(self, widget: tk.Widget) -> None:
+        """マウスホイールでこのリストをスクロールできるようにする"""
+        widget.bind("<MouseWheel>", self._on_mousewheel, add="+")
+        widget.bind("<Button-4>", lambda e: self.canvas.yview_scroll(-1, "units"), add="+")
+        widget.bind("<Button-5>", lambda e: self.canvas.yview_scroll(1, "units"), add="+")
+
+    # ===== 内部処理 =====
+
+    def _on_mousewheel(self, event) -> None:
+        self.canvas.yview_scroll(int(-1 * (event.delta / 120)) or (-1 if event.delta > 0 else 1), "units")
+
+    def _on_yscroll(self, first, last) -> None:
+        self.scrollbar.set(first, last)
+        self._layout()
+
+    def _on_configure(self, event) -> None:
+        self._width = event.width
+        for window in self._windows:
+            self.canvas.itemconfig(window, width=event.width)
+        self._update_scrollregion()
+        self._layout()
+
+    def _update_scrollregion(self) -> None:
+        total = len(self._items) * self.row_height
+        self.canvas.configure(scrollregion=(0, 0, self._width, total))
+        self.canvas.itemconfig(self._empty_item, state="hidden" if self._items else "normal")
+
+    def _ensure_pool(self, count: int) -> None:
+        while len(self._rows) < count:
+            row = self._create_row(self.canvas)
+            self._bind_wheel_recursive(row)
+            window = self.canvas.create_window(
+                0, -self.row_height, window=row, anchor="nw",
+                width=self._width, height=self.row_height, state="hidden",
+            )
+            self._rows.append(row)
+            self._windows.append(window)
+            self._row_index.append(None)
+
+    def _bind_wheel_recursive(self, widget: tk.Widget) -> None:
+        self.bind_wheel(widget)
+        for child in widget.winfo_children():
+            self._bind_wheel_recursive(child)
+
+    def _layout(self, force: bool = False) -> None:
+        """表示範囲に入っている項目にだけ行ウィジェットを割り当てる"""
+        height = max(self.canvas.winfo_height(), 1)
+        visible = height // self.row_height + 2
+        self._ensure_pool(visible)
+
+        first = max(int(self.canvas.canvasy(0)) // self.row_height, 0)
+        last = min(first + visible, len(self._items))
+        pool = len(self._rows)
+
+        # 項目番号 % プール数 で行ウィジェットを割り当てると、
+        # 1 行スクロールしたときに描き直すのは入れ替わった 1 行だけで済む
+        used = set()
+        for index in range(first, last):
+            slot = index % pool
+            used.add(slot)
+            if not force and self._row_index[slot] == index:
+                continue
+            window = self._windows[slot]
+            self._bind_row(self._rows[slot], index, self._items[index])
+            self.canvas.coords(window, 0, index * self.row_height)
+            if self._row_index[slot] is None:
+                self.canvas.itemconfig(window, state="normal")
+            self._row_index[slot] = index
+
+        for slot in range(pool):
+            if slot not in used and self._row_index[slot] is not None:
+                self.canvas.itemconfig(self._windows[slot], state="hidden")
+                self._row_index[slot] = None
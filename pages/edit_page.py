@@ -2,11 +2,15 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from pathlib import Path
 
-from edit.changemp3 import convert_mp4_to_mp3, ConvertError
-from edit.preview_player import preview_segments
-from edit.library_saver import concat_segments_to_tempfile, copy_temp_to_library
+from edit.batch_convert import convert_batch
+from edit.preview_player import stream_segments, PreviewError
+from edit.library_saver import render_segments_to_tempfile, copy_temp_to_library
+from edit.segment_exporter import ExportError
+from edit.job_runner import JobRunner
+from edit.waveform_cache import load_waveform, numpy_available
 from edit.audio_info import get_duration_seconds
 from edit.timeline_helper import TimelineController
+from misc.player_service import get_player
 
 
 class EditPage(tk.Frame):
@@ -15,6 +19,17 @@ class EditPage(tk.Frame):
         self.config_data = config
         self.theme = theme
         
+        # 変換・プレビュー・保存はワーカースレッドで実行し、UI を止めない
+        self.job_runner = JobRunner(self)
+        self.current_job = None
+        # プレビューとライブラリ・プレイリストの再生は同じ pygame ミキサーに出すので、同時には鳴らさない
+        self.player = get_player(self)
+        self._preview_job = None
+        self.player.subscribe("state", self._on_player_state, owner=self)
+        # 波形の作成は進捗表示なしで別に走らせる（ファイルごとに 1 つ）
+        self.waveform_runner = JobRunner(self)
+        self._waveform_jobs = {}
+        
         # スクロール可能なコンテナを作成
         canvas = tk.Canvas(self, bg=theme["bg"], highlightthickness=0)
         scrollbar = tk.Scrollbar(self, orient="vertical", command=canvas.yview)
@@ -100,6 +115,7 @@ class EditPage(tk.Frame):
         self.timeline_controller.bind_canvas_events()
         self._bind_var_traces()
         self.timeline_controller.redraw()
+        self.bind("<Destroy>", self.on_destroy)
 
     def _create_file_input_ui(self):
         """ファイル入力UIを生成"""
@@ -210,6 +226,7 @@ class EditPage(tk.Frame):
         self.duration_vars.pop()
         self.total_length_vars.pop()
         self._file_ranges.pop()
+        self._clear_waveform(len(self.file_vars))
         
         # タイムラインの最後の行を削除
         if self.timeline_rows:
@@ -246,11 +263,15 @@ class EditPage(tk.Frame):
         )
         if path:
             self.file_vars[index].set(path)
+            self._clear_waveform(index)
             self._update_total_length_from_file(index, path)
 
     def _bind_var_traces(self):
         """変数の変更を監視"""
         for i in range(len(self.start_vars)):
+            # ファイル追加のたびに呼ばれるので、監視済みの変数には重ねて登録しない
+            if self.start_vars[i].trace_info():
+                continue
             self.start_vars[i].trace_add(
                 "write",
                 lambda *_, idx=i: self.timeline_controller.sync_from_entries(
@@ -324,6 +345,87 @@ class EditPage(tk.Frame):
             bg_color="#7f8c8d",
             hover_bg="#95a5a6",
         ).pack(pady=10)
+        
+        # 実行中の処理の進捗表示とキャンセルボタン
+        status_frame = tk.Frame(self.scrollable_frame, bg=self.theme["bg"])
+        status_frame.pack(pady=(0, 10))
+        
+        self.job_label = tk.Label(status_frame, text="", width=28, anchor="w",
+                                  bg=self.theme["bg"], fg=self.theme["fg"])
+        self.job_label.pack(side=tk.LEFT, padx=5)
+        
+        self.job_progress = ttk.Progressbar(status_frame, length=220, mode="determinate", maximum=1.0)
+        self.job_progress.pack(side=tk.LEFT, padx=5)
+        
+        self.cancel_button = ttk.Button(status_frame, text="キャンセル", command=self.on_cancel_job,
+                                        state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+
+    def _start_job(self, func, *args, label, on_done, on_error=None):
+        """func(job, *args) をバックグラウンドで実行し、その Job を返す（同時に 1 つだけ。実行中なら None）"""
+        if self.current_job is not None:
+            messagebox.showinfo("情報", "他の処理を実行中です。完了するかキャンセルしてから実行してください。")
+            return None
+        
+        def finish():
+            self.current_job = None
+            self.job_progress.stop()
+            self.job_progress.config(mode="determinate", value=0)
+            self.cancel_button.config(state=tk.DISABLED)
+        
+        def done(result):
+            finish()
+            self.job_label.config(text="")
+            on_done(result)
+        
+        def error(exc):
+            finish()
+            self.job_label.config(text="")
+            (on_error or self._show_job_error)(exc)
+        
+        def cancelled():
+            finish()
+            self.job_label.config(text=f"{label}をキャンセルしました")
+        
+        self.job_label.config(text=label)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.current_job = self.job_runner.submit(
+            func,
+            *args,
+            label=label,
+            on_done=done,
+            on_error=error,
+            on_progress=self._on_job_progress,
+            on_cancel=cancelled,
+        )
+        return self.current_job
+
+    def _on_job_progress(self, fraction, text):
+        if text:
+            self.job_label.config(text=text)
+        if fraction is None:
+            # 進捗が分からない間は往復するバーを表示
+            if str(self.job_progress.cget("mode")) != "indeterminate":
+                self.job_progress.config(mode="indeterminate")
+                self.job_progress.start(15)
+        else:
+            if str(self.job_progress.cget("mode")) != "determinate":
+                self.job_progress.stop()
+                self.job_progress.config(mode="determinate")
+            self.job_progress.config(value=fraction)
+
+    def _show_job_error(self, exc):
+        messagebox.showerror("エラー", f"処理中に予期せぬエラーが発生しました:\n{exc}")
+
+    def on_cancel_job(self):
+        if self.current_job is not None:
+            self.current_job.cancel()
+
+    def on_destroy(self, event):
+        """ページが破棄されたら実行中の ffmpeg / ffplay も止める"""
+        if event.widget is self:
+            self.job_runner.cancel_all()
+            self.waveform_runner.cancel_all()
 
     def _get_library_dir(self) -> Path:
         lib = Path(self.config_data.get("library_dir", "library_file"))
@@ -342,7 +444,41 @@ class EditPage(tk.Frame):
         
         self._file_ranges[index]["total"] = duration_sec
         self.total_length_vars[index].set(round(duration_sec, 1))
-        self.timeline_controller.redraw()
+        self.timeline_controller.refresh(index)
+        self._request_waveform(index, audio_path, duration_sec)
+
+    def _request_waveform(self, index: int, path: Path, duration_sec: float) -> None:
+        """波形をバックグラウンドで読み込み（無ければ作成し）、タイムラインに表示する"""
+        if not numpy_available():
+            return
+        
+        def forget():
+            if self._waveform_jobs.get(index) is job:
+                del self._waveform_jobs[index]
+        
+        def done(waveform):
+            forget()
+            # 読み込み中に別のファイルに変わっていたら捨てる
+            if waveform is None or index >= len(self.file_vars) or Path(self.file_vars[index].get()) != path:
+                return
+            self.timeline_controller.set_waveform(index, waveform)
+        
+        job = self.waveform_runner.submit(
+            lambda job, p, d: load_waveform(p, d, job=job),
+            path,
+            duration_sec,
+            label="waveform",
+            on_done=done,
+            on_error=lambda _exc: forget(),
+            on_cancel=forget,
+        )
+        self._waveform_jobs[index] = job
+
+    def _clear_waveform(self, index: int) -> None:
+        job = self._waveform_jobs.pop(index, None)
+        if job is not None:
+            job.cancel()
+        self.timeline_controller.set_waveform(index, None)
 
     def _collect_segments(self, action_label: str):
         targets = []
@@ -373,39 +509,57 @@ class EditPage(tk.Frame):
 
     def on_convert(self) -> None:
         targets = []
-        for file_var in self.file_vars:
+        for idx, file_var in enumerate(self.file_vars):
             if file_var.get().strip():
-                targets.append(file_var)
+                targets.append((idx, Path(file_var.get())))
         
         if not targets:
             messagebox.showwarning("入力エラー", "変換するファイルを1つ以上入力してください。")
             return
         
-        for var in targets:
-            src = Path(var.get())
-            try:
-                out = convert_mp4_to_mp3(src)
-            except FileNotFoundError as e:
-                messagebox.showerror("エラー", str(e))
-                continue
-            except ConvertError as e:
-                messagebox.showerror("変換エラー", str(e))
-                continue
-            
-            if out == src and out.suffix.lower() == ".mp3":
-                messagebox.showinfo("情報", f"{src.name} は mp3 のため変換をスキップしました。")
-            else:
-                var.set(str(out))
-                messagebox.showinfo("完了", f"変換が完了しました:\n{out}")
+        def work(job, targets):
+            # Tk の変数はワーカーから触らず、結果だけ返してメインスレッドで反映する
+            report = convert_batch([src for _idx, src in targets], job=job)
+            by_source = {r.source.resolve(): r for r in report.results}
+            return [(idx, by_source[src.resolve()]) for idx, src in targets]
+        
+        def done(results):
+            for idx, result in results:
+                src = result.source
+                if result.status == "missing_ffmpeg":
+                    messagebox.showerror("変換エラー", "ffmpeg コマンドが見つかりません。ffmpeg をインストールしてください。")
+                elif result.status == "failed":
+                    messagebox.showerror("変換エラー", f"{src.name} の変換中に問題が発生しました。\n{result.message}")
+                elif result.status == "passthrough":
+                    messagebox.showinfo("情報", f"{src.name} は mp3 のため変換をスキップしました。")
+                elif result.status in ("converted", "fresh"):
+                    if idx < len(self.file_vars):
+                        self.file_vars[idx].set(str(result.output))
+                    messagebox.showinfo("完了", f"変換が完了しました:\n{result.output}")
+        
+        self._start_job(work, targets, label="変換中", on_done=done)
 
     def on_save_to_library(self) -> None:
         segments = self._collect_segments("保存")
         if not segments:
             return
-        tmp_path = concat_segments_to_tempfile(segments)
-        if tmp_path is None:
-            return
         
+        def error(exc):
+            if isinstance(exc, ExportError):
+                messagebox.showerror("エラー", str(exc))
+            else:
+                messagebox.showerror("エラー", f"一時ファイル作成中に予期せぬエラーが発生しました:\n{exc}")
+        
+        self._start_job(
+            lambda job, segs: render_segments_to_tempfile(segs, job=job),
+            segments,
+            label="書き出し中",
+            on_done=self._finish_save_to_library,
+            on_error=error,
+        )
+
+    def _finish_save_to_library(self, tmp_path: Path) -> None:
+        """書き出し済みの一時ファイルを、保存先を聞いてからライブラリにコピーする"""
         library_dir = self._get_library_dir()
         filename = filedialog.asksaveasfilename(
             initialdir=str(library_dir),
@@ -435,5 +589,21 @@ class EditPage(tk.Frame):
         segments = self._collect_segments("プレビュー再生")
         if not segments:
             return
-        preview_segments(segments)
-
+        
+        def error(exc):
+            if isinstance(exc, PreviewError):
+                messagebox.showerror("エラー", str(exc))
+            else:
+                messagebox.showerror("エラー", f"プレビュー再生中に予期せぬエラーが発生しました:\n{exc}")
+        
+        if self.current_job is None:
+            # ライブラリ・プレイリストの再生を止めてから流す
+            self.player.stop()
+        self._preview_job = self._start_job(
+            stream_segments, segments, label="プレビュー再生", on_done=lambda _r: None, on_error=error
+        )
+    
+    def _on_player_state(self, state) -> None:
+        """ライブラリ・プレイリストで再生が始まったら、プレビュー再生を止める"""
+        if state == "playing" and self.current_job is not None and self.current_job is self._preview_job:
+            self.current_job.cancel()
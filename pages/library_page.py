@@ -1,17 +1,24 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
 import os
-import pygame
 from misc.library import library  # library.pyから読み込み
+from misc.library_watcher import get_library_watcher
+from misc.player_service import get_player
+from misc.virtual_list import VirtualList
+
+# 再生サービスの context に入れる目印（このページで始めた再生かどうか）
+PLAYER_CONTEXT = "library"
+LIBRARY_EMPTY_TEXT = "library_fileフォルダにMP3がありません"
 
 class LibraryPage(tk.Frame):
     def __init__(self, parent, theme, config):
         super().__init__(parent, bg=theme["bg"])
         self.theme = theme
         self.music_manager = library() # 音楽管理クラスをインスタンス化
-        self.current_playing_path = None # 現在再生中のファイルのパスを保存
-        self.current_button = None       # 現在操作中のボタンを保存
+        self.library_dir = self.music_manager.get_library_dir("library_file")
+        self.player = get_player(self) # 再生はアプリ共通の再生サービスに任せる
         self.music_duration = 0  # 曲の長さ
+        self.is_dragging = False # マウス操作中かどうかを判定するフラグ
 
         # タイトル
         tk.Label(self, text="📚 LIBRARY", font=("Arial", 20, "bold"), 
@@ -25,38 +32,59 @@ class LibraryPage(tk.Frame):
                                    bg=theme["bg"], fg="white", font=("Arial", 10))
         
         self._setup_initial_seek_bar() # 起動時にシークバーをあらかじめ作成して表示しておく
+        self._setup_search_box() # ファイル名・タグで絞り込む検索欄
         self._setup_scroll_area() # スクロール可能なエリアの作成
         self.refresh_list() # ページが作られた時にリストを表示する
-        self.check_music_status() # 監視ループを開始する
-        self.bind("<Destroy>", self.on_destroy) # このページが消された（MyAppがdestroyした）時に呼ばれる設定
-        self.is_dragging = False # マウス操作中かどうかを判定するフラグ
-        self.is_paused = False  # 一時停止状態かどうかのフラグ
-        self.current_seek_start = 0  # シークを開始した時点の秒数
+        # 再生位置・状態の変化を購読する（ポーリングしない。ページが破棄されると自動で解除される）
+        # 再生位置は表示中だけ受け取る（on_hide で解除し、on_show で購読し直す）
+        self._position_token = self.player.subscribe("position", self._on_position, owner=self)
+        self.player.subscribe("state", self._on_player_state, owner=self)
+        # フォルダの変化（編集ページからの保存・ファイルのコピーなど）を監視し、変わった行だけ更新する
+        get_library_watcher(self, self.library_dir).subscribe(self._on_library_changed, owner=self)
+        self.bind("<Destroy>", self.on_destroy, add="+") # このページが消された（MyAppがdestroyした）時に呼ばれる設定
 
-    def _setup_scroll_area(self):
-        self.container = tk.Frame(self, bg=self.theme["bg"])
-        self.container.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
+    @property
+    def current_playing_path(self):
+        """このページで再生中（一時停止を含む）のファイルのパス"""
+        if self.player.context != PLAYER_CONTEXT:
+            return None
+        return self.player.current_path
 
-        self.canvas = tk.Canvas(self.container, bg="#222", highlightthickness=0)
-        self.scrollbar = tk.Scrollbar(self.container, orient="vertical", command=self.canvas.yview)
-        self.scrollable_frame = tk.Frame(self.canvas, bg="#222")
+    @property
+    def is_paused(self):
+        return self.current_playing_path is not None and self.player.state == "paused"
 
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-        )
+    def _setup_search_box(self):
+        """入力するたびに一覧を絞り込む検索欄（メモリ上の索引を引くので全件は走査しない）"""
+        search_frame = tk.Frame(self, bg=self.theme["bg"])
+        search_frame.pack(fill=tk.X, padx=20, pady=(5, 0))
+        tk.Label(search_frame, text="🔍", bg=self.theme["bg"], fg="white").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        tk.Entry(search_frame, textvariable=self.search_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.search_var.trace_add("write", lambda *args: self._on_search_changed())
 
-        self.scrollable_window = self.canvas.create_window(
-            (0, 0), window=self.scrollable_frame, anchor="nw"
-        )
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
-        self.canvas.bind(
-            "<Configure>",
-            lambda e: self.canvas.itemconfig(self.scrollable_window, width=e.width)
-        )
+    @property
+    def search_query(self):
+        return self.search_var.get().strip()
+
+    def _on_search_changed(self):
+        """検索欄が書き換わった時に一覧を絞り込み直す"""
+        query = self.search_query
+        files = self.music_manager.search_mp3_files(query) if query else self.music_manager.get_mp3_files("library_file")
+        self.file_list.set_empty_text("一致するMP3がありません" if query else LIBRARY_EMPTY_TEXT)
+        self.file_list.set_items(files)
 
-        self.canvas.pack(side="left", fill="both", expand=True)
-        self.scrollbar.pack(side="right", fill="y")
+    def _setup_scroll_area(self):
+        # 表示範囲の行だけを作る仮想化リスト（行ウィジェットはスクロール時に使い回す）
+        self.file_list = VirtualList(
+            self,
+            row_height=36,
+            create_row=self._create_file_row,
+            bind_row=self._bind_file_row,
+            bg="#222",
+            empty_text=LIBRARY_EMPTY_TEXT,
+        )
+        self.file_list.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
 
     def _setup_initial_seek_bar(self):
         """初期状態のシークバーを作成（中身は0）"""
@@ -74,33 +102,23 @@ class LibraryPage(tk.Frame):
         self.seek_bar.bind("<ButtonPress-1>", self.on_drag_start)
         self.seek_bar.bind("<ButtonRelease-1>", self.on_drag_end)
 
-    def toggle_music(self, path, button):
-        if self.current_playing_path == path and self.music_manager.is_playing():
-            self.current_seek_start += self.music_manager.get_pos()
-            self.music_manager.stop_music()
-            self.is_paused = True
-            button.config(text="▶")
-        else:
-            # 別の曲を再生する場合、または一時停止からの復帰
-            if self.current_playing_path != path:
-                # 全く別の曲なら位置をリセット
-                self.current_seek_start = 0
-                self.is_paused = False
-                if self.current_button:
-                    self.current_button.config(text="▶")
-            
-            # 保存されている位置（0 または停止した位置）から再生
-            self.music_duration = self.music_manager.play_music(path)
-            self.music_manager.set_pos(path, self.current_seek_start)
-            
-            # シークバーを新しく作らず、既存のものの最大値を更新する
-            if self.seek_bar:
-                self.seek_bar.config(to=self.music_duration)
-            
-            button.config(text="■")
-            self.current_playing_path = path
-            self.current_button = button
-            self.is_paused = False
+    def toggle_music(self, path):
+        if self.current_playing_path == path:
+            # 同じ曲なら一時停止 / 再開を切り替える
+            if self.is_paused:
+                self.player.resume()
+            else:
+                self.player.pause()
+            return
+
+        # 別の曲を頭から再生する（ボタンの表示は state イベントで描き直す）
+        self.player.play([path], context=PLAYER_CONTEXT)
+        self.music_duration = self.player.duration or 0
+        # シークバーを新しく作らず、既存のものの最大値を更新する
+        if self.seek_bar:
+            self.seek_bar.config(to=self.music_duration)
+            self.seek_bar.set(0)
+        self.time_label.config(text=f"00:00 / {self._format_time(self.music_duration)}")
 
     def _format_time(self, seconds):
         """秒数を 00:00 の形式に変換"""
@@ -133,11 +151,10 @@ class LibraryPage(tk.Frame):
         if self.current_playing_path:
             # ドラッグ終了時の値を確定させる
             new_pos = float(self.seek_bar.get())
-            self.current_seek_start = new_pos
             # 再生位置をスキップ
-            self.music_manager.set_pos(self.current_playing_path, new_pos)
+            self.player.seek(new_pos)
         
-        # 最後にフラグを戻す（check_music_statusによる上書きを再開）
+        # 最後にフラグを戻す（position イベントによる上書きを再開）
         self.after(100, self._reset_dragging)
 
     def _reset_dragging(self):
@@ -151,56 +168,91 @@ class LibraryPage(tk.Frame):
             total_str = self._format_time(self.music_duration)
             self.time_label.config(text=f"{current_str} / {total_str}")
 
-    def check_music_status(self):
-        """音楽の再生状態とシークバーを更新"""
-        if self.music_manager.is_playing():
-            # ドラッグ中でない時だけ、シークバーの位置を更新する
-            if self.seek_bar and not self.is_dragging:
-                passed_time = self.music_manager.get_pos()
-                current_pos = self.current_seek_start + passed_time
-                self.seek_bar.set(current_pos)
-                self.time_label.config(text=f"{self._format_time(current_pos)} / {self._format_time(self.music_duration)}")
+    def _on_position(self, position, duration):
+        """再生中に再生サービスから定期的に呼ばれ、シークバーの位置を更新する"""
+        # このページの再生で、ドラッグ中でない時だけ更新する
+        if self.current_playing_path is None or self.is_dragging or not self.seek_bar:
+            return
+        self.seek_bar.set(position)
+        self.time_label.config(text=f"{self._format_time(position)} / {self._format_time(self.music_duration)}")
+
+    def _on_player_state(self, state):
+        """再生・一時停止・停止が切り替わった時に呼ばれる"""
+        if self.current_playing_path is None and not self.is_dragging:
+            # 曲が最後まで再生し終わった（または止められた）時はリセット
+            self.seek_bar.set(0)
+        # ボタンは使い回されているので、表示中の行の「▶/■」を状態から描き直す
+        self.file_list.refresh()
+
+    def on_show(self):
+        """MyApp がこのページを再表示する時に呼ばれる（隠れている間の変化だけを反映する）"""
+        self.refresh_list()
+        if self._position_token is None:
+            self._position_token = self.player.subscribe("position", self._on_position, owner=self)
+        # 隠れている間に進んだ再生位置をすぐに反映する
+        if self.current_playing_path is not None:
+            self._on_position(self.player.position(), self.player.duration)
         else:
-            # 一時停止中（is_paused == True）なら、UIをリセットせずに維持する
-            if self.current_button and not self.is_dragging and not self.is_paused:
-                # 曲が最後まで再生し終わった時だけリセット
-                self.current_button.config(text="▶")
-                self.current_playing_path = None
-                self.current_button = None
-                self.current_seek_start = 0
-                self.seek_bar.set(0)
+            self.seek_bar.set(0)
 
-        self.after(200, self.check_music_status) # 頻度を上げて滑らかに
+    def on_hide(self):
+        """MyApp がこのページを隠す時に呼ばれる（再生は止めずに続ける）"""
+        if self._position_token is not None:
+            self.player.unsubscribe(self._position_token)
+            self._position_token = None
 
     def on_destroy(self, event):
         """ページが切り替わってこのウィジェットが破棄された時に実行される"""
-        # pygameのミキサーが動いていれば停止する
-        if pygame.mixer.get_init():
-            pygame.mixer.music.stop()
+        # このページで始めた再生なら停止する（プレイリストの再生などは止めない）
+        if event.widget is self and self.player.context == PLAYER_CONTEXT:
+            self.player.stop()
 
     def refresh_list(self):
-        # 既存リストのクリア
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-
         # 引数に "library_file" を指定して呼び出す
+        # （フォルダが変わっていなければインデックスは走査しない）
         files = self.music_manager.get_mp3_files("library_file")
+        if self.search_query:
+            # 絞り込み中は検索結果を表示する（索引は上の走査で最新になっている）
+            files = self.music_manager.search_mp3_files(self.search_query)
+        if not files or files != self.file_list.items:
+            self.file_list.set_items(files)
+        else:
+            # 一覧が同じならスクロール位置を保ったまま「▶/■」だけ描き直す
+            self.file_list.refresh()
 
-        if not files:
-            tk.Label(self.scrollable_frame, text="library_fileフォルダにMP3がありません", 
-                     bg=self.theme["bg"], fg="gray").pack(pady=20)
-            return
+    def _on_library_changed(self, changes):
+        """ライブラリフォルダのファイルが増えた・消えた・書き換わった・名前が変わった時に呼ばれる"""
+        query = self.search_query
+        # 書き換わったファイルは一度抜いて入れ直す（タグが変わって検索語に合わなくなったものは入れない）
+        changed = [n for n in changes.added + changes.modified if n.lower().endswith(".mp3")]
+        added = [
+            os.path.join(self.library_dir, n) for n in changed
+            if not query or self.music_manager.matches_query(n, query)
+        ]
+        removed = [
+            os.path.join(self.library_dir, n) for n in changes.removed + changes.modified
+            if n.lower().endswith(".mp3")
+        ]
+        if added or removed:
+            # 一覧は作り直さず、該当する行だけを入れる・抜く（スクロール位置はそのまま）
+            self.file_list.merge_sorted(added, removed)
 
-        for path in files:
-            self.create_file_row(path)
+    def _create_file_row(self, parent):
+        """使い回し用の行ウィジェットを作成（中身は _bind_file_row で設定）"""
+        row = tk.Frame(parent, bg="#222")
 
-    def create_file_row(self, file_path):
-        row = tk.Frame(self.scrollable_frame, bg="#222")
-        row.pack(fill=tk.X, pady=2, padx=5)
+        # 切り替えボタンを作成（表示は _bind_file_row で「▶」「■」を切り替える）
+        row.button = tk.Button(row, text="▶", width=5)
+        row.button.config(command=lambda r=row: self.toggle_music(r.file_path))
+        row.button.pack(side=tk.LEFT, padx=5)
 
-        # 切り替えボタンを作成（最初は「▶」）
-        btn = tk.Button(row, text="▶", width=5)
-        btn.config(command=lambda p=file_path, b=btn: self.toggle_music(p, b))
-        btn.pack(side=tk.LEFT, padx=5)
+        row.label = tk.Label(row, bg="#222", fg="white", anchor="w")
+        row.label.pack(side=tk.LEFT, padx=10)
+        return row
 
-        tk.Label(row, text=os.path.basename(file_path), bg="#222", fg="white", anchor="w").pack(side=tk.LEFT, padx=10)
+    def _bind_file_row(self, row, index, file_path):
+        """行ウィジェットに index 番目のファイルを表示する"""
+        row.file_path = file_path
+        row.label.config(text=os.path.basename(file_path))
+        playing = file_path == self.current_playing_path and not self.is_paused
+        row.button.config(text="■" if playing else "▶")
@@ -1,10 +1,16 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
-import xml.etree.ElementTree as ET
 import os
-import glob
 import misc.constants as c  # 定数をインポート
 from misc.library import library
+from misc.library_index import get_library_index
+from misc.library_watcher import get_library_watcher
+from misc.player_service import get_player
+from misc.playlist_store import get_playlist_store
+from misc.virtual_list import VirtualList
+
+# ライブラリ欄に出すファイルの拡張子
+LIBRARY_EXTENSIONS = (".mp3", ".mp4")
 
 class PlaylistPage(tk.Frame):
     """
@@ -20,26 +26,27 @@ class PlaylistPage(tk.Frame):
         self.theme = theme
         
         # プレイリスト管理用の変数
-        self.playlists = {}  # {プレイリスト名: [ファイルパスリスト]}
+        # プレイリストの保存先（名前と曲数だけを先に読み、曲の一覧は開いた時に読む）
+        self.store = get_playlist_store()
         self.selected_playlist = None  # 編集中のプレイリスト名
-        self.selected_file_indices = []  # プレイリスト内の選択されたファイルインデックスリスト（複数選択対応）
+        self.selected_file_indices = set()  # プレイリスト内の選択されたファイルインデックスの集合（複数選択対応）
         self.selected_playlist_for_play = None  # 再生用に選択されたプレイリスト名
         self.view_mode = "list"  # 表示モード: "list"（一覧）, "detail"（詳細）
         self.music_manager = library()  # 音楽再生用のライブラリ
         
-        # 連続再生用の変数
-        self.current_playing_playlist = None  # 現在再生中のプレイリスト名
-        self.current_track_index = 0  # 現在再生中の曲のインデックス
-        self.is_playing = False  # 再生中かどうか
-        self.current_playlist_button = None  # 一覧の再生ボタン参照
-        self.current_track_path = None  # 単曲再生中のファイルパス
-        self.current_track_button = None  # 単曲再生中のボタン参照
+        # 再生はアプリ共通の再生サービスが行い、このページはイベントを受けて表示を更新する
+        # （ページが破棄されると購読は自動で外れ、プレイリストはページを切り替えても再生が続く）
+        self.player = get_player(self)
+        self.player.subscribe("track_started", self._on_track_change, owner=self)
+        self.player.subscribe("state", self._on_player_state, owner=self)
+        self.player.subscribe("finished", self._on_playback_finished, owner=self)
+        self.player.subscribe("error", self._on_playback_error, owner=self)
         
         # ライブラリ機能用の変数
         self.library_folder = None  # ライブラリフォルダのパス
         self.library_files = []  # ライブラリ内のmp3ファイルリスト
         self.selected_library_file = None  # ライブラリで選択されたファイル
-        self.selected_library_file_indices = []  # ライブラリで選択されたファイルのインデックスリスト（複数選択対応）
+        self.selected_library_file_indices = set()  # ライブラリで選択されたファイルのインデックスの集合（複数選択対応）
         
         # === UI要素の配置 ===
         
@@ -61,40 +68,206 @@ class PlaylistPage(tk.Frame):
         
         # === 初期化処理 ===
         
-        # 既存のXMLファイルからプレイリストを読み込み
-        self.load_existing_playlists()
+        # 従来のXMLファイルのうち、新しいもの・更新されたものを取り込む
+        self.store.sync_xml()
         
         # library_fileフォルダからmp3/mp4ファイルを自動ロード
         self._load_library_files()
+        # フォルダの変化を監視し、ライブラリ欄の変わった行だけ更新する
+        get_library_watcher(self, self.library_folder).subscribe(self._on_library_changed, owner=self)
         
         # プレイリスト一覧画面を表示
+        self.playlist_list.set_items(self.store.names())
         self.show_playlist_list()
     
-    def _setup_scroll_area(self):
+    # 再生サービスの context に入れる目印（どのプレイリスト・どの曲の再生か）
+    @property
+    def current_playing_playlist(self):
+        """再生中（一時停止を含む）のプレイリスト名"""
+        context = self.player.context
+        if isinstance(context, tuple) and context[0] == "playlist":
+            return context[1]
+        return None
+    
+    @property
+    def current_track_path(self):
+        """詳細画面の曲ボタンで単曲再生中のファイルパス"""
+        context = self.player.context
+        if isinstance(context, tuple) and context[0] == "playlist_track":
+            return context[1]
+        return None
+    
+    def on_show(self):
         """
-        スクロール可能なコンテンツエリアのセットアップ
-        キャンバスとスクロールバーを組み合わせてスクロール可能にする
+        MyApp がこのページを再表示する時に呼ばれる
+        隠れている間に変わったプレイリスト・ライブラリの分だけを反映する
         """
-        self.canvas = tk.Canvas(self.container, bg=c.COLOR_LIST_BG, highlightthickness=0)
-        self.scrollbar = tk.Scrollbar(self.container, orient="vertical", command=self.canvas.yview)
-        self.scrollable_frame = tk.Frame(self.canvas, bg=c.COLOR_LIST_BG)
+        if self.store.sync_xml():
+            self.playlist_list.set_items(self.store.names())
         
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        old_library_files = self.library_files
+        self._load_library_files()
+        library_changed = self.library_files != old_library_files
+        
+        if self.view_mode == "detail":
+            tracks = self.store.tracks(self.selected_playlist)
+            if self.track_list.items != tracks:
+                # XMLから取り込み直した場合は曲の一覧を入れ替える
+                self.selected_file_indices.clear()
+                self.track_list.set_items(tracks)
+            if library_changed:
+                self.selected_library_file_indices.clear()
+                self.library_list.set_items(self.library_files)
+            self._refresh_play_buttons()
+        else:
+            # 入力中のプレイリスト名は残したまま、タイトルと表示中の行だけ描き直す
+            self._update_list_title()
+            self.playlist_list.refresh()
+    
+    def _update_list_title(self):
+        """一覧画面のタイトル（プレイリストを再生中ならその名前）を表示"""
+        if self.current_playing_playlist:
+            self.title_label.config(text=f"🎵 [{self.current_playing_playlist}]を再生しています")
+        else:
+            self.title_label.config(text="🎵 プレイリスト")
+    
+    def _setup_scroll_area(self):
+        """
+        一覧用・詳細用の仮想化リストを作成する
+        どちらも表示範囲の行だけウィジェットを作り、スクロール時に使い回す。
+        画面切り替え時は作り直さず pack / pack_forget で入れ替える。
+        """
+        # 一覧画面: プレイリスト名のリスト
+        self.playlist_list = VirtualList(
+            self.container, row_height=34,
+            create_row=self._create_playlist_row, bind_row=self._bind_playlist_row,
+            bg=c.COLOR_LIST_BG,
         )
         
-        self.scrollable_window = self.canvas.create_window(
-            (0, 0), window=self.scrollable_frame, anchor="nw"
+        # 詳細画面: プレイリストパネル + ライブラリパネル
+        self.detail_frame = tk.Frame(self.container, bg=c.COLOR_LIST_BG)
+        
+        tk.Label(self.detail_frame, text="📋 プレイリスト",
+                 bg=c.COLOR_LIST_BG, fg="white", font=("Arial", 12, "bold")).pack(fill=tk.X, padx=5, pady=(5, 2))
+        self.track_list = VirtualList(
+            self.detail_frame, row_height=32,
+            create_row=lambda parent: self._create_track_row(parent, self.toggle_file_selection),
+            bind_row=lambda row, index, path: self._bind_track_row(row, index, path, self.selected_file_indices),
+            bg=c.COLOR_LIST_BG,
         )
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
-        self.canvas.bind(
-            "<Configure>",
-            lambda e: self.canvas.itemconfig(self.scrollable_window, width=e.width)
+        self.track_list.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        # ===== セパレータ =====
+        tk.Frame(self.detail_frame, height=2, bg=c.COLOR_SIDEBAR, bd=0,
+                 highlightthickness=0).pack(fill=tk.X, padx=10, pady=5)
+        
+        library_header = tk.Frame(self.detail_frame, bg=c.COLOR_LIST_BG)
+        library_header.pack(fill=tk.X, padx=5, pady=(5, 2))
+        tk.Label(library_header, text="🎵 ライブラリ",
+                 bg=c.COLOR_LIST_BG, fg="white", font=("Arial", 12, "bold")).pack(side=tk.LEFT)
+        # 入力するたびにライブラリ欄を絞り込む（メモリ上の索引を引くので全件は走査しない）
+        self.library_search_var = tk.StringVar()
+        tk.Entry(library_header, textvariable=self.library_search_var, width=24).pack(side=tk.RIGHT)
+        tk.Label(library_header, text="🔍", bg=c.COLOR_LIST_BG, fg="white").pack(side=tk.RIGHT)
+        self.library_search_var.trace_add("write", lambda *args: self._on_library_search_changed())
+        self.library_list = VirtualList(
+            self.detail_frame, row_height=32,
+            create_row=lambda parent: self._create_track_row(parent, self.toggle_library_file_selection),
+            bind_row=lambda row, index, path: self._bind_track_row(row, index, path, self.selected_library_file_indices),
+            bg=c.COLOR_LIST_BG,
         )
+        self.library_list.pack(fill=tk.BOTH, expand=True, padx=5, pady=(0, 5))
+    
+    def _set_row_bg(self, row, color):
+        """行フレームとその中のラベルの背景色を変更"""
+        row.config(bg=color)
+        for child in row.winfo_children():
+            if isinstance(child, tk.Label):
+                child.config(bg=color)
+            elif isinstance(child, tk.Frame):
+                self._set_row_bg(child, color)
+    
+    def _create_playlist_row(self, parent):
+        """一覧画面の行ウィジェットを作成（中身は _bind_playlist_row で設定）"""
+        row = tk.Frame(parent, bg=c.COLOR_LIST_BG)
+        
+        row.play_btn = tk.Button(row, text="▶", width=5)
+        row.play_btn.config(command=lambda r=row: self.toggle_playlist_play(r.playlist_name))
+        row.play_btn.pack(side=tk.LEFT, padx=(0, 5))
         
-        self.canvas.pack(side="left", fill="both", expand=True)
-        self.scrollbar.pack(side="right", fill="y")
+        row.label = tk.Label(row, bg=c.COLOR_LIST_BG, fg=c.COLOR_LIST_TEXT,
+                             font=("Arial", 12), anchor="w", cursor="hand2")
+        row.label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        # 左クリックで選択、ダブルクリックで詳細
+        def on_click(e, frame=row):
+            self.toggle_playlist_selection(frame.playlist_name)
+        
+        def on_double_click(e, frame=row):
+            self.show_playlist_detail(frame.playlist_name)
+        
+        for widget in (row, row.label):
+            widget.bind("<Button-1>", on_click)
+            widget.bind("<Double-Button-1>", on_double_click)
+        return row
+    
+    def _format_time(self, seconds):
+        """秒数を 00:00（1時間以上なら 0:00:00）の形式に変換"""
+        m, s = divmod(int(seconds), 60)
+        h, m = divmod(m, 60)
+        return f"{h}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
+
+    def _bind_playlist_row(self, row, index, pl_name):
+        """一覧画面の行にプレイリストを表示"""
+        row.playlist_name = pl_name
+        # 曲数と合計時間はストアが持っている（曲の一覧は読み込まない）
+        info = self.store.info(pl_name)
+        row.label.config(text=f"{info.track_count}曲 {self._format_time(info.duration)} {pl_name}")
+        playing = self.current_playing_playlist == pl_name
+        row.play_btn.config(text="■" if playing else "▶")
+        selected = self.selected_playlist_for_play == pl_name
+        self._set_row_bg(row, c.COLOR_HIGHLIGHT if selected else c.COLOR_LIST_BG)
+    
+    def _create_track_row(self, parent, on_toggle):
+        """
+        詳細画面（プレイリスト・ライブラリ共通）の行ウィジェットを作成
+        on_toggle: 選択切り替え時に呼ぶメソッド（引数は項目のインデックス）
+        """
+        row = tk.Frame(parent, bg=c.COLOR_LIST_BG)
+        
+        # 再生ボタン
+        row.play_btn = tk.Button(row, text="▶", bg="white", fg="black",
+                                 font=("Arial", 10, "bold"), width=3, height=1)
+        row.play_btn.config(command=lambda r=row: self.toggle_track_play(r.file_path))
+        row.play_btn.pack(side=tk.LEFT, padx=(0, 5))
+        
+        # チェックボックス
+        checkbox = tk.Frame(row, bg=c.COLOR_LIST_BG, width=20, height=20)
+        checkbox.pack(side=tk.LEFT, padx=(0, 5))
+        row.checkbox_label = tk.Label(checkbox, text="☐", bg=c.COLOR_LIST_BG, fg=c.COLOR_LIST_TEXT,
+                                      font=("Arial", 14), cursor="hand2")
+        row.checkbox_label.pack()
+        
+        # 曲名ラベル
+        row.label = tk.Label(row, bg=c.COLOR_LIST_BG, fg=c.COLOR_LIST_TEXT,
+                             font=("Arial", 11), anchor="w", cursor="hand2")
+        row.label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        # チェックボックス・ラベル・行のクリックで選択を切り替え
+        for widget in (row, checkbox, row.checkbox_label, row.label):
+            widget.bind("<Button-1>", lambda e, r=row: on_toggle(r.file_index))
+        return row
+    
+    def _bind_track_row(self, row, index, file_path, selected_indices):
+        """詳細画面の行に曲を表示（選択状態はインデックスの集合から決める）"""
+        row.file_index = index
+        row.file_path = file_path
+        row.label.config(text=os.path.basename(file_path))
+        playing = self.current_track_path == file_path
+        row.play_btn.config(text="■" if playing else "▶")
+        selected = index in selected_indices
+        row.checkbox_label.config(text="☑" if selected else "☐")
+        self._set_row_bg(row, c.COLOR_HIGHLIGHT if selected else c.COLOR_LIST_BG)
     
     # ==========================================
     # プレイリスト一覧表示
@@ -108,7 +281,7 @@ class PlaylistPage(tk.Frame):
         - プレイリスト一覧（クリックで選択、ダブルクリックで詳細へ）
         """
         self.view_mode = "list"
-        self.title_label.config(text="🎵 プレイリスト")
+        self._update_list_title()
         
         # ボタンフレームをクリア
         for widget in self.button_frame.winfo_children():
@@ -127,39 +300,10 @@ class PlaylistPage(tk.Frame):
         tk.Button(form_frame, text="+ 新規作成", bg=c.COLOR_BTN_BG, fg=c.COLOR_BTN_TEXT,
                   command=self.create_new_playlist, width=12).grid(row=0, column=2)
         
-        # スクロールエリアをクリア
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-        
-        # プレイリスト一覧を表示
-        for pl_name, files in self.playlists.items():
-            row = tk.Frame(self.scrollable_frame, bg=c.COLOR_LIST_BG)
-            row.pack(fill=tk.X, pady=2, padx=5)
-            
-            # 選択状態を管理
-            row.is_selected = False
-            row.playlist_name = pl_name
-            
-            play_btn = tk.Button(row, text="▶", width=5)
-            play_btn.config(command=lambda name=pl_name, btn=play_btn: self.toggle_playlist_play(name, btn))
-            play_btn.pack(side=tk.LEFT, padx=(0, 5))
-
-            label = tk.Label(row, text=f"{len(files)}曲 {pl_name}",
-                           bg=c.COLOR_LIST_BG, fg=c.COLOR_LIST_TEXT,
-                           font=("Arial", 12), anchor="w", cursor="hand2")
-            label.pack(side=tk.LEFT, fill=tk.X, expand=True)
-            
-            # 左クリックで選択、ダブルクリックで詳細
-            def on_click(e, frame=row, name=pl_name):
-                self.toggle_playlist_selection(frame, name)
-            
-            def on_double_click(e, name=pl_name):
-                self.show_playlist_detail(name)
-            
-            label.bind("<Button-1>", on_click)
-            row.bind("<Button-1>", on_click)
-            label.bind("<Double-Button-1>", on_double_click)
-            row.bind("<Double-Button-1>", on_double_click)
+        # 詳細画面を隠して一覧を表示（曲数が変わっている可能性があるので表示中の行だけ描き直す）
+        self.detail_frame.pack_forget()
+        self.playlist_list.pack(fill=tk.BOTH, expand=True)
+        self.playlist_list.refresh()
 
     # ==========================================
     # プレイリスト詳細表示（編集画面）
@@ -189,222 +333,17 @@ class PlaylistPage(tk.Frame):
                   command=self.add_library_file_to_playlist, width=10).pack(side=tk.LEFT, padx=5)
         tk.Button(self.button_frame, text="❌ 削除", bg=c.COLOR_BTN_BG, fg=c.COLOR_BTN_TEXT,
                   command=self.remove_selected, width=10).pack(side=tk.LEFT, padx=5)
+        tk.Button(self.button_frame, text="📤 XML書き出し", bg=c.COLOR_BTN_BG, fg=c.COLOR_BTN_TEXT,
+                  command=self.export_playlist_xml, width=12).pack(side=tk.LEFT, padx=5)
         
-        # スクロールエリアをクリア
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-        
-        # メインコンテナを2分割（プレイリストパネル + ライブラリパネル）
-        main_container = tk.Frame(self.scrollable_frame, bg=c.COLOR_LIST_BG)
-        main_container.pack(fill=tk.BOTH, expand=True)
-        
-        # ===== プレイリスト表示パネル =====
-        playlist_label = tk.Label(main_container, text="📋 プレイリスト", 
-                                 bg=c.COLOR_LIST_BG, fg="white", font=("Arial", 12, "bold"))
-        playlist_label.pack(fill=tk.X, padx=5, pady=(5, 2))
-        
-        playlist_frame = tk.Frame(main_container, bg=c.COLOR_LIST_BG, height=200)
-        playlist_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-        playlist_frame.pack_propagate(False)
-        
-        # プレイリスト用スクロール
-        playlist_canvas = tk.Canvas(playlist_frame, bg=c.COLOR_LIST_BG, highlightthickness=0)
-        playlist_scrollbar = tk.Scrollbar(playlist_frame, orient="vertical", command=playlist_canvas.yview)
-        playlist_scrollable = tk.Frame(playlist_canvas, bg=c.COLOR_LIST_BG)
-        
-        playlist_scrollable.bind(
-            "<Configure>",
-            lambda e: playlist_canvas.configure(scrollregion=playlist_canvas.bbox("all"))
-        )
-        
-        playlist_window = playlist_canvas.create_window(
-            (0, 0), window=playlist_scrollable, anchor="nw"
-        )
-        playlist_canvas.configure(yscrollcommand=playlist_scrollbar.set)
-        playlist_canvas.bind(
-            "<Configure>",
-            lambda e: playlist_canvas.itemconfig(playlist_window, width=e.width)
-        )
-        
-        playlist_canvas.pack(side="left", fill="both", expand=True)
-        playlist_scrollbar.pack(side="right", fill="y")
-        
-        # プレイリスト内容を表示
-        if playlist_name in self.playlists:
-            files = self.playlists[playlist_name]
-            for idx, file_path in enumerate(files):
-                filename = os.path.basename(file_path)
-                
-                row = tk.Frame(playlist_scrollable, bg=c.COLOR_LIST_BG)
-                row.pack(fill=tk.X, pady=2, padx=5)
-                
-                # 選択状態を管理するための内部フレーム
-                row.is_selected = False
-                row.file_index = idx
-                row.file_path = file_path
-                
-                # 再生ボタン
-                play_btn = tk.Button(row, text="▶", bg="white", fg="black",
-                                    font=("Arial", 10, "bold"), width=3, height=1)
-                play_btn.config(command=lambda path=file_path, btn=play_btn: self.toggle_track_play(path, btn))
-                play_btn.pack(side=tk.LEFT, padx=(0, 5))
-                
-                # チェックボックス
-                checkbox = tk.Frame(row, bg=c.COLOR_LIST_BG, width=20, height=20)
-                checkbox.pack(side=tk.LEFT, padx=(0, 5))
-                checkbox_label = tk.Label(checkbox, text="☐", bg=c.COLOR_LIST_BG, fg=c.COLOR_LIST_TEXT,
-                                         font=("Arial", 14), cursor="hand2")
-                checkbox_label.pack()
-                
-                # チェックボックスのクリック処理
-                def on_checkbox_click(e, frame=row, index=idx, check_label=checkbox_label):
-                    self.toggle_file_selection(frame, index)
-                    # チェック状態を反映
-                    if frame.is_selected:
-                        check_label.config(text="☑")
-                    else:
-                        check_label.config(text="☐")
-                
-                checkbox_label.bind("<Button-1>", on_checkbox_click)
-                checkbox.bind("<Button-1>", on_checkbox_click)
-                
-                # 曲名ラベル
-                label = tk.Label(row, text=filename, 
-                        bg=c.COLOR_LIST_BG, fg=c.COLOR_LIST_TEXT, 
-                        font=("Arial", 11), anchor="w", cursor="hand2")
-                label.pack(side=tk.LEFT, fill=tk.X, expand=True)
-                
-                # ラベルクリックで選択
-                def on_click(e, frame=row, index=idx, check_label=checkbox_label):
-                    self.toggle_file_selection(frame, index)
-                    # チェック状態を反映
-                    if frame.is_selected:
-                        check_label.config(text="☑")
-                    else:
-                        check_label.config(text="☐")
-                
-                label.bind("<Button-1>", on_click)
-                row.bind("<Button-1>", on_click)
-        
-        # ===== セパレータ =====
-        separator = tk.Frame(main_container, height=2, bg=c.COLOR_SIDEBAR, bd=0, highlightthickness=0)
-        separator.pack(fill=tk.X, padx=10, pady=5)
-        
-        # ===== ライブラリパネル =====
-        library_label = tk.Label(main_container, text="🎵 ライブラリ", 
-                                bg=c.COLOR_LIST_BG, fg="white", font=("Arial", 12, "bold"))
-        library_label.pack(fill=tk.X, padx=5, pady=(5, 2))
-        
-        library_frame = tk.Frame(main_container, bg=c.COLOR_LIST_BG, height=200)
-        library_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=(0, 5))
-        library_frame.pack_propagate(False)
-        
-        # ライブラリ用スクロール
-        library_canvas = tk.Canvas(library_frame, bg=c.COLOR_LIST_BG, highlightthickness=0)
-        library_scrollbar = tk.Scrollbar(library_frame, orient="vertical", command=library_canvas.yview)
-        library_scrollable = tk.Frame(library_canvas, bg=c.COLOR_LIST_BG)
-        
-        library_scrollable.bind(
-            "<Configure>",
-            lambda e: library_canvas.configure(scrollregion=library_canvas.bbox("all"))
-        )
-        
-        library_window = library_canvas.create_window(
-            (0, 0), window=library_scrollable, anchor="nw"
-        )
-        library_canvas.configure(yscrollcommand=library_scrollbar.set)
-        library_canvas.bind(
-            "<Configure>",
-            lambda e: library_canvas.itemconfig(library_window, width=e.width)
-        )
-        
-        library_canvas.pack(side="left", fill="both", expand=True)
-        library_scrollbar.pack(side="right", fill="y")
-        
-        # ライブラリファイルを表示
-        if self.library_files:
-            for idx, file_path in enumerate(self.library_files):
-                filename = os.path.basename(file_path)
-                
-                row = tk.Frame(library_scrollable, bg=c.COLOR_LIST_BG)
-                row.pack(fill=tk.X, pady=2, padx=5)
-                
-                # 選択状態を管理
-                row.is_selected = False
-                row.file_index = idx
-                row.file_path = file_path
-                
-                # 再生ボタン
-                play_btn = tk.Button(row, text="▶", bg="white", fg="black",
-                                    font=("Arial", 10, "bold"), width=3, height=1)
-                play_btn.config(command=lambda path=file_path, btn=play_btn: self.toggle_track_play(path, btn))
-                play_btn.pack(side=tk.LEFT, padx=(0, 5))
-                
-                # チェックボックス
-                checkbox = tk.Frame(row, bg=c.COLOR_LIST_BG, width=20, height=20)
-                checkbox.pack(side=tk.LEFT, padx=(0, 5))
-                checkbox_label = tk.Label(checkbox, text="☐", bg=c.COLOR_LIST_BG, fg=c.COLOR_LIST_TEXT,
-                                         font=("Arial", 14), cursor="hand2")
-                checkbox_label.pack()
-                
-                # チェックボックスのクリック処理
-                def on_checkbox_click(e, frame=row, index=idx, check_label=checkbox_label):
-                    self.toggle_library_file_selection(frame, index)
-                    # チェック状態を反映
-                    if frame.is_selected:
-                        check_label.config(text="☑")
-                    else:
-                        check_label.config(text="☐")
-                
-                checkbox_label.bind("<Button-1>", on_checkbox_click)
-                checkbox.bind("<Button-1>", on_checkbox_click)
-                
-                # ファイル名ラベル
-                label = tk.Label(row, text=filename, 
-                        bg=c.COLOR_LIST_BG, fg=c.COLOR_LIST_TEXT, 
-                        font=("Arial", 11), anchor="w", cursor="hand2")
-                label.pack(side=tk.LEFT, fill=tk.X, expand=True)
-                
-                # クリックで選択
-                def on_lib_click(e, frame=row, index=idx, check_label=checkbox_label):
-                    self.toggle_library_file_selection(frame, index)
-                    # チェック状態を反映
-                    if frame.is_selected:
-                        check_label.config(text="☑")
-                    else:
-                        check_label.config(text="☐")
-                
-                label.bind("<Button-1>", on_lib_click)
-                row.bind("<Button-1>", on_lib_click)
-    
-    # ==========================================
-    # データ読み込み・保存
-    # ==========================================
-    
-    def load_existing_playlists(self):
-        """
-        既存のXMLプレイリストファイルを読み込み
-        playlist_fileフォルダ内の全.xmlファイルをスキャンして
-        プレイリストデータとして読み込む
-        """
-        playlist_folder = "playlist_file"
+        # 選択状態をリセットして、プレイリストとライブラリの内容を表示
+        self.selected_file_indices.clear()
+        self.selected_library_file_indices.clear()
+        self.track_list.set_items(self.store.tracks(playlist_name))
+        self.library_list.set_items(self.library_files)
         
-        # フォルダが存在しない場合は作成
-        if not os.path.exists(playlist_folder):
-            os.makedirs(playlist_folder)
-        
-        # playlist_fileフォルダ内の全.xmlファイルを取得
-        xml_files = glob.glob(os.path.join(playlist_folder, "*.xml"))
-        for xml_file in xml_files:
-            try:
-                tree = ET.parse(xml_file)
-                root = tree.getroot()
-                files = [f.get("path") for f in root.findall("file")]
-                # ファイル名からplaylist_file/を除いたプレイリスト名を取得
-                playlist_name = os.path.splitext(os.path.basename(xml_file))[0]
-                self.playlists[playlist_name] = files
-            except:
-                pass
+        self.playlist_list.pack_forget()
+        self.detail_frame.pack(fill=tk.BOTH, expand=True)
     
     # ==========================================
     # プレイリスト作成・編集
@@ -413,7 +352,7 @@ class PlaylistPage(tk.Frame):
     def create_new_playlist(self):
         """
         新規プレイリストを作成
-        入力された名前で空のプレイリストを作成し、XMLファイルに保存
+        入力された名前で空のプレイリストを作成して保存
         """
         name = self.playlist_name_entry.get().strip()
         
@@ -421,19 +360,18 @@ class PlaylistPage(tk.Frame):
             messagebox.showinfo("入力エラー", "プレイリスト名を入力してください。")
             return
         
-        if name in self.playlists:
+        if name in self.store:
             messagebox.showinfo("エラー", "同じ名前のプレイリストが既に存在します。")
             return
         
         # 空のプレイリストを作成
-        self.playlists[name] = []
-        self.save_playlist(name)
+        self.store.create(name)
         
         # テキスト入力欄をクリア
         self.playlist_name_entry.delete(0, tk.END)
         
-        # プレイリスト一覧を更新
-        self.show_playlist_list()
+        # プレイリスト一覧に1行だけ追加
+        self.playlist_list.append(name)
         messagebox.showinfo("作成完了", f"プレイリスト「{name}」を作成しました。")
     
     def add_files(self):
@@ -450,12 +388,9 @@ class PlaylistPage(tk.Frame):
             filetypes=[("Audio Files", "*.mp3 *.mp4"), ("All Files", "*.*")]
         )
         
-        for file in files:
-            if file not in self.playlists[self.selected_playlist]:
-                self.playlists[self.selected_playlist].append(file)
-        
-        self.save_playlist(self.selected_playlist)
-        self.show_playlist_detail(self.selected_playlist)
+        # 重複を除いて追加し、追加した曲の行だけを書き込む
+        added = self.store.add_unique(self.selected_playlist, files)
+        self.track_list.extend(added)
     
     def _load_library_files(self):
         """
@@ -469,13 +404,45 @@ class PlaylistPage(tk.Frame):
         
         self.library_folder = library_folder
         
-        # フォルダ内のmp3/mp4ファイルを取得
-        self.library_files = []
-        for ext in ["*.mp3", "*.mp4"]:
-            self.library_files.extend(glob.glob(os.path.join(library_folder, ext)))
+        # インデックスからmp3/mp4ファイルを取得（ファイル名順）。検索欄に入力があれば絞り込む
+        index = get_library_index(library_folder)
+        self.library_files = index.paths(LIBRARY_EXTENSIONS, base=library_folder)
+        query = self.library_search_var.get().strip()
+        if query:
+            self.library_files = index.search(query, LIBRARY_EXTENSIONS, base=library_folder)
+    
+    def _on_library_search_changed(self):
+        """ライブラリ欄の検索語が変わった時に絞り込み直す（選択はファイル単位で引き継ぐ）"""
+        selected = {self.library_files[i] for i in self.selected_library_file_indices if i < len(self.library_files)}
+        self._load_library_files()
+        positions = {path: i for i, path in enumerate(self.library_files)}
+        self.selected_library_file_indices.clear()
+        self.selected_library_file_indices.update(positions[p] for p in selected if p in positions)
+        self.library_list.set_items(self.library_files)
+    
+    def _on_library_changed(self, changes):
+        """ライブラリフォルダのファイルが増えた・消えた・書き換わった・名前が変わった時に呼ばれる"""
+        query = self.library_search_var.get().strip()
+        index = get_library_index(self.library_folder)
+        # 書き換わったファイルは一度抜いて入れ直す（タグが変わって検索語に合わなくなったものは入れない）
+        changed = [n for n in changes.added + changes.modified if n.lower().endswith(LIBRARY_EXTENSIONS)]
+        added = [os.path.join(self.library_folder, n) for n in changed if not query or index.matches(n, query)]
+        removed = [
+            os.path.join(self.library_folder, n) for n in changes.removed + changes.modified
+            if n.lower().endswith(LIBRARY_EXTENSIONS)
+        ]
+        if not added and not removed:
+            return
         
-        # ファイル名でソート
-        self.library_files.sort()
+        # 選択は番号で持っているので、ファイルで覚えておいて入れ直した後の番号に付け替える
+        selected = {self.library_files[i] for i in self.selected_library_file_indices if i < len(self.library_files)}
+        self.library_list.merge_sorted(added, removed)
+        self.library_files = list(self.library_list.items)
+        if selected or self.selected_library_file_indices:
+            positions = {path: i for i, path in enumerate(self.library_files)}
+            self.selected_library_file_indices.clear()
+            self.selected_library_file_indices.update(positions[p] for p in selected if p in positions)
+            self.library_list.refresh()
     
     def add_library_file_to_playlist(self):
         """
@@ -489,25 +456,21 @@ class PlaylistPage(tk.Frame):
             messagebox.showinfo("ファイル未選択", "追加するファイルを選択してください。")
             return
         
-        # 選択された全てのファイルをプレイリストに追加
-        added_count = 0
-        skipped_count = 0
-        
-        for index in self.selected_library_file_indices:
-            if index >= len(self.library_files):
-                continue
-            
-            file_path = self.library_files[index]
-            if file_path not in self.playlists[self.selected_playlist]:
-                self.playlists[self.selected_playlist].append(file_path)
-                added_count += 1
-            else:
-                skipped_count += 1
-        
-        if added_count > 0:
-            self.save_playlist(self.selected_playlist)
-            self.show_playlist_detail(self.selected_playlist)
-            
+        # 選択された全てのファイルをプレイリストに追加（重複はストアの索引で除く）
+        candidates = [
+            self.library_files[index]
+            for index in sorted(self.selected_library_file_indices)
+            if index < len(self.library_files)
+        ]
+        added = self.store.add_unique(self.selected_playlist, candidates)
+        self.track_list.extend(added)
+        added_count = len(added)
+        skipped_count = len(candidates) - added_count
+        
+        # ライブラリ側の選択を解除（表示中の行だけ描き直す）
+        self.selected_library_file_indices.clear()
+        self.library_list.refresh()
+        
         # 結果メッセージ
         if added_count > 0 and skipped_count == 0:
             messagebox.showinfo("追加完了", f"{added_count}曲をプレイリストに追加しました。")
@@ -519,293 +482,154 @@ class PlaylistPage(tk.Frame):
     def remove_selected(self):
         """
         選択された曲をプレイリストから削除（複数削除対応）
-        クリックで選択された曲をプレイリストから削除し、XMLを更新
+        クリックで選択された曲をプレイリストから削除し、削除した行だけを保存する
         """
         if not self.selected_file_indices:
             messagebox.showinfo("選択なし", "削除する曲を選択してください。")
             return
         
-        if not self.selected_playlist or self.selected_playlist not in self.playlists:
+        if not self.selected_playlist or self.selected_playlist not in self.store:
             return
         
-        # 選択されたインデックスを降順でソート（後ろから削除してインデックスを狂わさない）
-        sorted_indices = sorted(self.selected_file_indices, reverse=True)
-        
-        for index in sorted_indices:
-            if 0 <= index < len(self.playlists[self.selected_playlist]):
-                del self.playlists[self.selected_playlist][index]
-        
-        self.selected_file_indices = []
-        self.save_playlist(self.selected_playlist)
-        self.show_playlist_detail(self.selected_playlist)
-        messagebox.showinfo("削除完了", f"{len(sorted_indices)}曲を削除しました。")
+        removed = self.store.remove_at(self.selected_playlist, self.selected_file_indices)
+        self.track_list.remove_many(self.selected_file_indices)
+        self.selected_file_indices.clear()
+        messagebox.showinfo("削除完了", f"{removed}曲を削除しました。")
     
     # ==========================================
     # 選択状態管理
     # ==========================================
     
-    def toggle_file_selection(self, frame, file_index):
+    def toggle_file_selection(self, file_index):
         """
         プレイリスト詳細画面での曲の選択状態を切り替え（複数選択対応）
         選択された曲の背景色を変更して視覚的にフィードバック
-        クリックするたびに選択/解除を切り替え
-        """
-        # 既に選択されているかチェック
-        if frame.is_selected:
-            # 選択解除
-            frame.config(bg=c.COLOR_LIST_BG)
-            for child in frame.winfo_children():
-                if isinstance(child, tk.Label):
-                    child.config(bg=c.COLOR_LIST_BG)
-            frame.is_selected = False
-            
-            # リストから削除
-            if file_index in self.selected_file_indices:
-                self.selected_file_indices.remove(file_index)
+        クリックするたびに選択/解除を切り替え（描き直すのはその1行だけ）
+        """
+        if file_index in self.selected_file_indices:
+            self.selected_file_indices.remove(file_index)
         else:
-            # 選択
-            frame.config(bg=c.COLOR_HIGHLIGHT)
-            for child in frame.winfo_children():
-                if isinstance(child, tk.Label):
-                    child.config(bg=c.COLOR_HIGHLIGHT)
-            frame.is_selected = True
-            
-            # リストに追加
-            if file_index not in self.selected_file_indices:
-                self.selected_file_indices.append(file_index)
-    
-    def toggle_library_file_selection(self, frame, file_index):
+            self.selected_file_indices.add(file_index)
+        self.track_list.update_item(file_index)
+    
+    def toggle_library_file_selection(self, file_index):
         """
         ライブラリパネルでのファイルの選択状態を切り替え（複数選択対応）
         選択されたファイルの背景色を変更して視覚的にフィードバック
-        クリックするたびに選択/解除を切り替え
-        """
-        # 既に選択されているかチェック
-        if frame.is_selected:
-            # 選択解除
-            frame.config(bg=c.COLOR_LIST_BG)
-            for child in frame.winfo_children():
-                if isinstance(child, tk.Label):
-                    child.config(bg=c.COLOR_LIST_BG)
-            frame.is_selected = False
-            
-            # リストから削除
-            if file_index in self.selected_library_file_indices:
-                self.selected_library_file_indices.remove(file_index)
+        クリックするたびに選択/解除を切り替え（描き直すのはその1行だけ）
+        """
+        if file_index in self.selected_library_file_indices:
+            self.selected_library_file_indices.remove(file_index)
         else:
-            # 選択
-            frame.config(bg=c.COLOR_HIGHLIGHT)
-            for child in frame.winfo_children():
-                if isinstance(child, tk.Label):
-                    child.config(bg=c.COLOR_HIGHLIGHT)
-            frame.is_selected = True
-            
-            # リストに追加
-            if file_index not in self.selected_library_file_indices:
-                self.selected_library_file_indices.append(file_index)
+            self.selected_library_file_indices.add(file_index)
+        self.library_list.update_item(file_index)
+    
+    def toggle_playlist_selection(self, playlist_name):
         """
         プレイリスト一覧画面でのプレイリストの選択状態を切り替え
         選択されたプレイリストの背景色を変更（再生用の選択）
         """
-        # 前回選択されたアイテムの選択を解除
-        for widget in self.scrollable_frame.winfo_children():
-            if hasattr(widget, 'is_selected') and widget.is_selected:
-                widget.config(bg=c.COLOR_LIST_BG)
-                for child in widget.winfo_children():
-                    if isinstance(child, tk.Label):
-                        child.config(bg=c.COLOR_LIST_BG)
-                widget.is_selected = False
-        
-        # 新しいアイテムを選択
-        frame.config(bg=c.COLOR_HIGHLIGHT)
-        for child in frame.winfo_children():
-            if isinstance(child, tk.Label):
-                child.config(bg=c.COLOR_HIGHLIGHT)
-        frame.is_selected = True
         self.selected_playlist_for_play = playlist_name
+        self.playlist_list.refresh()
     
     # ==========================================
     # 再生機能
     # ==========================================
     
-    def toggle_playlist_play(self, playlist_name, button):
+    def _refresh_play_buttons(self):
+        """
+        再生状態が変わった時に、表示中の行の「▶/■」を描き直す
+        （行ウィジェットは使い回されるため、ボタンを直接保持しない）
+        """
+        if self.view_mode == "list":
+            self.playlist_list.refresh()
+        else:
+            self.track_list.refresh()
+            self.library_list.refresh()
+    
+    def toggle_playlist_play(self, playlist_name):
         """
         一覧の再生ボタンでプレイリストの再生/停止を切り替える
         """
-        if self.is_playing and self.current_playing_playlist == playlist_name:
+        if self.current_playing_playlist == playlist_name:
             self.stop_playlist()
-            button.config(text="▶")
             return
 
-        if playlist_name not in self.playlists:
+        if playlist_name not in self.store:
             return
 
-        files = self.playlists[playlist_name]
+        files = self.store.tracks(playlist_name)
         if not files:
             messagebox.showinfo("曲なし", "プレイリストに曲がありません。")
             return
 
-        if self.current_playlist_button and self.current_playlist_button != button:
-            self.current_playlist_button.config(text="▶")
-
-        self.current_playlist_button = button
-        self.current_playing_playlist = playlist_name
-        self.current_track_index = 0
-        self.is_playing = True
-        button.config(text="■")
-
-        self._play_current_track()
-        self._check_playback_status()
+        # 次の曲は再生中に先読みされ、曲間の無音なしで切り替わる
+        self.player.play(files, context=("playlist", playlist_name))
     
-    def _play_current_track(self):
+    def _on_track_change(self, index, file_path):
         """
-        現在のトラックを再生
+        プレイヤーが次の曲に切り替わったときに呼ばれる
         """
-        if not self.current_playing_playlist or self.current_playing_playlist not in self.playlists:
-            return
-        
-        files = self.playlists[self.current_playing_playlist]
-        if self.current_track_index >= len(files):
-            # 全ての曲を再生完了
-            self.is_playing = False
-            if self.current_playlist_button:
-                self.current_playlist_button.config(text="▶")
-                self.current_playlist_button = None
-            self.title_label.config(text="🎵 プレイリスト")
+        if not self.current_playing_playlist:
             return
-        
-        try:
-            current_file = files[self.current_track_index]
-            self.music_manager.play_music(current_file)
-            # タイトルラベルに再生中のプレイリスト名を表示
-            self.title_label.config(text=f"🎵 [{self.current_playing_playlist}]を再生しています")
-            print(f"再生中: {os.path.basename(current_file)} ({self.current_track_index + 1}/{len(files)})")
-        except Exception as e:
-            messagebox.showerror("再生エラー", f"再生できませんでした: {e}")
-            self.is_playing = False
-            if self.current_playlist_button:
-                self.current_playlist_button.config(text="▶")
-                self.current_playlist_button = None
+        # タイトルラベルに再生中のプレイリスト名を表示
+        self.title_label.config(text=f"🎵 [{self.current_playing_playlist}]を再生しています")
     
-    def _check_playback_status(self):
+    def _on_player_state(self, state):
         """
-        再生状態を定期的にチェックし、曲が終わったら次の曲を再生
+        再生・停止が切り替わったときに呼ばれる（他のページで始めた再生も含む）
         """
-        if not self.is_playing:
-            return
-        
-        # pygameの音楽が再生中かチェック
-        import pygame
-        if not pygame.mixer.music.get_busy():
-            # 曲が終了した
-            self.current_track_index += 1
-            if self.current_playing_playlist and self.current_track_index < len(self.playlists.get(self.current_playing_playlist, [])):
-                # 次の曲を再生
-                self._play_current_track()
-            else:
-                # プレイリスト終了
-                self.is_playing = False
-                self.title_label.config(text="🎵 プレイリスト")
-                if self.current_playlist_button:
-                    self.current_playlist_button.config(text="▶")
-                    self.current_playlist_button = None
-                return
-        
-        # 100ミリ秒後に再度チェック
-        self.after(100, self._check_playback_status)
-
-    def toggle_track_play(self, file_path, button):
+        self._refresh_play_buttons()
+    
+    def _on_playback_finished(self):
         """
-        プレイリスト詳細画面の各曲ボタンで単曲再生/停止を切り替える
+        最後の曲まで再生し終えたときに呼ばれる（プレイリスト・単曲とも）
         """
-        if self.is_playing:
-            self.stop_playlist()
-
-        if self.current_track_path == file_path and self.music_manager.is_playing():
-            self.music_manager.stop_music()
-            button.config(text="▶")
-            self.current_track_path = None
-            self.current_track_button = None
-            return
-
-        if self.current_track_button and self.current_track_button != button:
-            self.current_track_button.config(text="▶")
-
-        try:
-            self.music_manager.play_music(file_path)
-            button.config(text="■")
-            self.current_track_path = file_path
-            self.current_track_button = button
-            self.after(200, self._check_single_track_status)
-        except Exception as e:
-            messagebox.showerror("再生エラー", f"再生できませんでした: {e}")
-            button.config(text="▶")
+        self.title_label.config(text="🎵 プレイリスト")
+        self._refresh_play_buttons()
+    
+    def _on_playback_error(self, file_path, error):
+        """
+        再生できない曲があったときに呼ばれる（その曲は飛ばして次へ進む）
+        """
+        messagebox.showerror("再生エラー", f"再生できませんでした: {os.path.basename(file_path)}\n{error}")
 
-    def _check_single_track_status(self):
+    def toggle_track_play(self, file_path):
         """
-        単曲再生の終了を監視してボタン表示を戻す
+        プレイリスト詳細画面の各曲ボタンで単曲再生/停止を切り替える
         """
-        if not self.current_track_button:
-            return
+        if self.current_playing_playlist:
+            self.stop_playlist()
 
-        if not self.music_manager.is_playing():
-            self.current_track_button.config(text="▶")
-            self.current_track_button = None
-            self.current_track_path = None
+        if self.current_track_path == file_path:
+            self.player.stop()
             return
 
-        self.after(200, self._check_single_track_status)
+        self.player.play([file_path], context=("playlist_track", file_path))
     
     def stop_playlist(self):
         """
         プレイリストの再生を停止
         """
-        self.music_manager.stop_music()
-        self.is_playing = False
-        self.current_playing_playlist = None
-        self.current_track_index = 0
-        if self.current_playlist_button:
-            self.current_playlist_button.config(text="▶")
-            self.current_playlist_button = None
-        if self.current_track_button:
-            self.current_track_button.config(text="▶")
-            self.current_track_button = None
-            self.current_track_path = None
+        self.player.stop()
         # 一覧画面の場合はタイトルをリセット
         if self.view_mode == "list":
             self.title_label.config(text="🎵 プレイリスト")
     
     # ==========================================
-    # XMLファイル保存
+    # XMLファイル書き出し
     # ==========================================
     
-    def save_playlist(self, playlist_name):
+    def export_playlist_xml(self):
         """
-        プレイリストをXMLファイルに保存
-        
-        XML構造:
-        <playlist name="プレイリスト名">
-            <file order="1" path="/path/to/file1.mp3" />
-            <file order="2" path="/path/to/file2.mp3" />
-        </playlist>
-        
+        編集中のプレイリストを従来のXML形式で書き出す（他のアプリとの受け渡し用）
         保存先: playlist_fileフォルダ内の「プレイリスト名.xml」
         """
-        playlist_folder = "playlist_file"
-        
-        # フォルダが存在しない場合は作成
-        if not os.path.exists(playlist_folder):
-            os.makedirs(playlist_folder)
-        
-        root = ET.Element("playlist")
-        root.set("name", playlist_name)
-        
-        for idx, file_path in enumerate(self.playlists[playlist_name]):
-            file_element = ET.SubElement(root, "file")
-            file_element.set("order", str(idx + 1))
-            file_element.set("path", file_path)
-        
-        tree = ET.ElementTree(root)
-        xml_path = os.path.join(playlist_folder, f"{playlist_name}.xml")
-        tree.write(xml_path, encoding="utf-8", xml_declaration=True)
-        print(f"プレイリストを保存しました: {xml_path}")
+        if not self.selected_playlist or self.selected_playlist not in self.store:
+            return
+        try:
+            xml_path = self.store.export_xml(self.selected_playlist)
+        except OSError as e:
+            messagebox.showerror("エラー", f"XMLの書き出しに失敗しました:\n{e}")
+            return
+        messagebox.showinfo("書き出し完了", f"プレイリストを書き出しました:\n{xml_path}")